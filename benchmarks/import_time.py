@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Import time of Invenio Records Presentation modules.
+
+Every module is imported in a fresh interpreter with ``python -X importtime``, so the
+numbers include all dependencies pulled in by the module::
+
+    python benchmarks/import_time.py --repeat 5
+    python benchmarks/import_time.py --top 15 invenio_records_presentation.views
+
+Reported times are medians of the cumulative import time in milliseconds.
+"""
+
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+
+MODULES = (
+    'invenio_records_presentation',
+    'invenio_records_presentation.tasks',
+    'invenio_records_presentation.views',
+    'invenio_records_presentation.api',
+)
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def measure(module):
+    """Import a module in a fresh interpreter.
+
+    :returns: dict of imported module name -> cumulative import time in microseconds
+    """
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                             universal_newlines=True, check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            times[match.group(4)] = int(match.group(2))
+    return times
+
+
+def main():
+    """Print import times of the given modules."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=3, help='number of measurements per module')
+    parser.add_argument('--top', type=int, default=0, help='show the slowest dependencies too')
+    args = parser.parse_args()
+
+    startup = set(measure('sys'))  # modules imported by the interpreter itself
+    for module in args.modules:
+        runs = [measure(module) for _ in range(args.repeat)]
+        total = statistics.median(run[module] for run in runs) / 1000
+        print('{:<50} {:>9.1f} ms'.format(module, total))
+        if args.top:
+            deps = {name: statistics.median(run.get(name, 0) for run in runs) / 1000
+                    for name in runs[0] if name != module and name not in startup}
+            for name, ms in sorted(deps.items(), key=lambda item: -item[1])[:args.top]:
+                print('    {:<46} {:>9.1f} ms'.format(name, ms))
+
+
+if __name__ == '__main__':
+    main()
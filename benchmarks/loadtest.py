@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Load test of the presentation REST API.
+
+Virtual users send a weighted mix of ``prepare``, ``status`` and ``download`` requests,
+anonymously or with one of the given OAuth tokens. Latency histograms and error rates are
+collected per operation, open file descriptors of the server process and the size of the
+scratch directory are sampled over time.
+
+Against a running deployment::
+
+    python benchmarks/loadtest.py --url http://localhost:5000/api/presentation/1.0 \\
+        --presentation pdf --records records.txt --token $TOKEN --users 50 --duration 300
+
+Against an application started in this process, with Celery tasks run eagerly::
+
+    python benchmarks/loadtest.py --app invenio_app.factory:create_api --eager \\
+        --presentation pdf --records records.txt --scratch-dir /tmp --users 10
+
+Increase ``--users`` between runs to find the point where throughput stops growing and
+latency or rejections (429/503) start to climb.
+"""
+
+import argparse
+import csv
+import http.client
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+OPERATIONS = ('prepare', 'status', 'download')
+
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+
+class Stats(object):
+    """Thread-safe latency and error statistics of operations."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.window = defaultdict(int)
+
+    def add(self, operation, status, seconds):
+        with self.lock:
+            self.latencies[operation].append(seconds * 1000)
+            self.statuses[operation][status] += 1
+            self.window['requests'] += 1
+            if is_error(status):
+                self.window['errors'] += 1
+
+    def take_window(self):
+        with self.lock:
+            window, self.window = self.window, defaultdict(int)
+        return window
+
+    def summary(self, elapsed):
+        report = {}
+        for operation in OPERATIONS:
+            latencies = sorted(self.latencies.get(operation, []))
+            if not latencies:
+                continue
+            statuses = dict(self.statuses[operation])
+            errors = sum(count for status, count in statuses.items() if is_error(status))
+            histogram = [sum(1 for ms in latencies if ms <= bound) for bound in BUCKETS_MS]
+            report[operation] = {
+                'requests': len(latencies),
+                'rate': len(latencies) / elapsed,
+                'error_rate': errors / len(latencies),
+                'statuses': {str(status): count for status, count in statuses.items()},
+                'p50_ms': percentile(latencies, 0.5),
+                'p90_ms': percentile(latencies, 0.9),
+                'p99_ms': percentile(latencies, 0.99),
+                'max_ms': latencies[-1],
+                'mean_ms': statistics.mean(latencies),
+                'histogram_ms': {'<={}'.format(bound): count
+                                 for bound, count in zip(BUCKETS_MS, _non_cumulative(histogram))},
+            }
+        return report
+
+
+def _non_cumulative(counts):
+    return [count - previous for previous, count in zip([0] + counts[:-1], counts)]
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+def is_error(status):
+    """Rejections by admission control are not errors, but they are reported."""
+    return not isinstance(status, int) or status >= 500 or status in (400, 401, 403, 404)
+
+
+class Client(object):
+    """Minimal keep-alive HTTP client of a single virtual user."""
+
+    def __init__(self, base_url, token=None, timeout=120):
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.netloc, timeout=timeout)
+        self.prefix = parts.path.rstrip('/')
+        self.headers = {'Accept-Encoding': 'gzip'}
+        if token:
+            self.headers['Authorization'] = 'Bearer {}'.format(token)
+
+    def request(self, method, path, body=None, read=True):
+        headers = dict(self.headers)
+        if body is not None:
+            body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            size = 0
+            chunks = []
+            while True:
+                chunk = response.read(128000)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if read:
+                    chunks.append(chunk)
+            return response.status, b''.join(chunks), size
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            raise
+
+
+class LoadTest(object):
+
+    def __init__(self, args):
+        self.args = args
+        self.stats = Stats()
+        self.jobs = []
+        self.finished_jobs = []
+        self.jobs_lock = threading.Lock()
+        self.stop = threading.Event()
+        self.records = [line.strip() for line in open(args.records) if line.strip()]
+        self.weights = [args.prepare, args.status, args.download]
+
+    def timed(self, operation, func, *args, **kwargs):
+        started = time.monotonic()
+        try:
+            status, data, size = func(*args, **kwargs)
+        except Exception as e:
+            self.stats.add(operation, type(e).__name__, time.monotonic() - started)
+            return None, None
+        self.stats.add(operation, status, time.monotonic() - started)
+        return status, data
+
+    def virtual_user(self, number):
+        anonymous = not self.args.token or random.random() < self.args.anonymous
+        token = None if anonymous else self.args.token[number % len(self.args.token)]
+        client = Client(self.args.base_url, token)
+
+        while not self.stop.is_set():
+            operation = random.choices(OPERATIONS, weights=self.weights)[0]
+            if operation == 'prepare' or not self.jobs:
+                self.prepare(client)
+            elif operation == 'status':
+                self.status(client)
+            elif self.finished_jobs or not self.args.wait_for_jobs:
+                self.download(client)
+            else:
+                self.status(client)
+            time.sleep(random.expovariate(1 / self.args.think_time) if self.args.think_time else 0)
+
+    def prepare(self, client):
+        record = random.choice(self.records)
+        status, data = self.timed('prepare', client.request, 'POST',
+                                  '/prepare/{}/{}/'.format(record, self.args.presentation))
+        if status == 200:
+            with self.jobs_lock:
+                self.jobs.append(json.loads(data.decode('utf-8'))['job_id'])
+                del self.jobs[:-self.args.max_jobs]
+
+    def status(self, client):
+        with self.jobs_lock:
+            job_id = random.choice(self.jobs)
+        status, data = self.timed('status', client.request, 'GET', '/status/{}/'.format(job_id))
+        if status == 200 and json.loads(data.decode('utf-8'))['status'] == 'SUCCESS':
+            with self.jobs_lock:
+                if job_id not in self.finished_jobs:
+                    self.finished_jobs.append(job_id)
+                    del self.finished_jobs[:-self.args.max_jobs]
+
+    def download(self, client):
+        with self.jobs_lock:
+            job_id = random.choice(self.finished_jobs or self.jobs)
+        self.timed('download', client.request, 'GET', '/download/{}/'.format(job_id), read=False)
+
+    def sample(self, writer, started):
+        """Sample throughput, errors, open files and scratch size every interval."""
+        while not self.stop.wait(self.args.sample_interval):
+            window = self.stats.take_window()
+            row = {
+                'elapsed': round(time.monotonic() - started, 1),
+                'requests_per_s': round(window['requests'] / self.args.sample_interval, 2),
+                'errors': window['errors'],
+                'open_fds': open_fds(self.args.pid),
+                'scratch_bytes': directory_size(self.args.scratch_dir),
+                'jobs': len(self.jobs),
+                'finished_jobs': len(self.finished_jobs),
+            }
+            writer.writerow(row)
+            sys.stdout.flush()
+
+    def run(self):
+        started = time.monotonic()
+        timeseries = open(self.args.timeseries, 'w') if self.args.timeseries else None
+        writer = csv.DictWriter(timeseries or sys.stdout,
+                                fieldnames=('elapsed', 'requests_per_s', 'errors', 'open_fds',
+                                            'scratch_bytes', 'jobs', 'finished_jobs'))
+        writer.writeheader()
+        threads = [threading.Thread(target=self.sample, args=(writer, started), daemon=True)]
+        for number in range(self.args.users):
+            threads.append(threading.Thread(target=self.virtual_user, args=(number,), daemon=True))
+        try:
+            for thread in threads:
+                thread.start()
+                time.sleep(self.args.ramp_up / max(1, self.args.users))
+
+            self.stop.wait(self.args.duration)
+            self.stop.set()
+            for thread in threads:
+                thread.join(timeout=5)
+        finally:
+            self.stop.set()
+            if timeseries:
+                timeseries.close()
+        return self.stats.summary(time.monotonic() - started)
+
+
+def open_fds(pid):
+    """Count open file descriptors of a process (Linux only)."""
+    try:
+        return len(os.listdir('/proc/{}/fd'.format(pid or 'self')))
+    except OSError:
+        return None
+
+
+def directory_size(path):
+    if not path:
+        return None
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass  # removed meanwhile
+    return total
+
+
+def write_report(report, out):
+    json.dump(report, out, indent=2)
+    out.write('\n')
+
+
+def start_app(args):
+    """Start the application in a thread of this process and return its base URL."""
+    from werkzeug.serving import make_server
+    from werkzeug.utils import import_string
+
+    config = {}
+    if args.eager:
+        # eager results are stored only with task_store_eager_result (Celery 5.1+), otherwise
+        # status of every job stays PENDING
+        config.update(CELERY_TASK_ALWAYS_EAGER=True, CELERY_TASK_EAGER_PROPAGATES=False,
+                      CELERY_TASK_STORE_EAGER_RESULT=True,
+                      CELERY_RESULT_BACKEND='cache', CELERY_CACHE_BACKEND='memory')
+    app = import_string(args.app)(**config)
+    app.config.update(config)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return 'http://127.0.0.1:{}{}'.format(server.server_port, args.url_prefix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='base URL of the presentation blueprint')
+    target.add_argument('--app', help='application factory to start in this process, e.g. '
+                                      'invenio_app.factory:create_api')
+    parser.add_argument('--url-prefix', default='/presentation/1.0', help='blueprint prefix with --app')
+    parser.add_argument('--eager', action='store_true',
+                        help='run Celery tasks eagerly with --app (job status needs Celery 5.1+)')
+    parser.add_argument('--presentation', required=True, help='presentation id to prepare')
+    parser.add_argument('--records', required=True, help='file with record UUIDs, one per line')
+    parser.add_argument('--token', action='append', default=[], help='OAuth token of a user (repeatable)')
+    parser.add_argument('--anonymous', type=float, default=0.0,
+                        help='share of anonymous virtual users when tokens are given')
+    parser.add_argument('--users', type=int, default=10, help='number of concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to run the test for')
+    parser.add_argument('--ramp-up', type=float, default=10, help='seconds over which users are started')
+    parser.add_argument('--think-time', type=float, default=0.5, help='mean seconds between user requests')
+    parser.add_argument('--prepare', type=float, default=1, help='weight of prepare requests')
+    parser.add_argument('--status', type=float, default=5, help='weight of status requests')
+    parser.add_argument('--download', type=float, default=2, help='weight of download requests')
+    parser.add_argument('--wait-for-jobs', action='store_true',
+                        help='download only jobs whose status was seen as SUCCESS')
+    parser.add_argument('--max-jobs', type=int, default=1000, help='number of recent jobs users pick from')
+    parser.add_argument('--pid', type=int, help='server process to count open files of (this process by default)')
+    parser.add_argument('--scratch-dir', help='scratch location to sample the size of')
+    parser.add_argument('--sample-interval', type=float, default=5, help='seconds between samples')
+    parser.add_argument('--timeseries', help='CSV file for the samples (stdout by default)')
+    parser.add_argument('--report', help='JSON file for the final report (stdout by default)')
+    args = parser.parse_args()
+
+    args.base_url = args.url or start_app(args)
+    report = LoadTest(args).run()
+    if args.report:
+        with open(args.report, 'w') as out:
+            write_report(report, out)
+    else:
+        write_report(report, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+""" Accounting of presentation worker usage per user and presentation.
+
+    Worker processes sum CPU seconds, wall time and artifact bytes of finished jobs in
+    memory and add them to the daily :class:`.models.PresentationUsage` rows in batches,
+    at most once per ``INVENIO_RECORDS_PRESENTATION_USAGE_FLUSH_INTERVAL`` seconds (and when
+    the worker process shuts down). Usage of a crashed worker process since its last flush
+    is lost.
+
+    CPU time of a job is the CPU time of the thread running it plus CPU time of child processes
+    finished in the meantime, which is exact in prefork pools. In thread pools, child processes
+    of concurrent jobs are accounted to whichever job finishes first, and in gevent or eventlet
+    pools all jobs of a process share one thread, so their CPU time is not separated at all.
+"""
+import logging
+import resource
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from invenio_cache import current_cache
+from invenio_db import db
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from .models import ANONYMOUS_USER_ID, PresentationUsage
+
+logger = logging.getLogger(__name__)
+
+USAGE_PREFIX = 'invenio_presentation:usage:'
+
+USAGE_CACHE_TIMEOUT = 30
+""" Seconds for which daily usage of a user is cached for quota checks """
+
+COUNTERS = ('jobs', 'cpu_seconds', 'wall_seconds', 'artifact_bytes')
+
+_pending = {}
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def cpu_time() -> float:
+    """ CPU seconds consumed by the current thread and the finished child processes of this process """
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.thread_time() + usage.ru_utime + usage.ru_stime
+
+
+def account_job(presentation_id: str, object_id: int, cpu_seconds: float, wall_seconds: float):
+    """ Account usage of a finished job to the user who requested it """
+    from .api import PresentationWorkflowObject
+
+    try:
+        extra_data = PresentationWorkflowObject.get(object_id).extra_data
+        user_id = (extra_data.get('_user') or {}).get('id', None)
+        if user_id is None:
+            user_id = ANONYMOUS_USER_ID
+        artifact_bytes = sum(entry['size'] for entry in extra_data.get('_manifest', []))
+    except Exception:
+        logger.exception('Could not account presentation job object {}'.format(object_id))
+        return
+
+    key = (user_id, presentation_id, datetime.utcnow().date())
+    with _pending_lock:
+        counters = _pending.setdefault(key, dict.fromkeys(COUNTERS, 0))
+        counters['jobs'] += 1
+        counters['cpu_seconds'] += cpu_seconds
+        counters['wall_seconds'] += wall_seconds
+        counters['artifact_bytes'] += artifact_bytes
+
+    if time.monotonic() - _last_flush >= current_app.config['INVENIO_RECORDS_PRESENTATION_USAGE_FLUSH_INTERVAL']:
+        flush_usage()
+
+
+def _add_usage(user_id: int, presentation_id: str, day: date, counters: dict):
+    query = PresentationUsage.query.filter_by(user_id=user_id, presentation_id=presentation_id, day=day)
+    increments = {getattr(PresentationUsage, name): getattr(PresentationUsage, name) + value
+                  for name, value in counters.items()}
+    if query.update(increments, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(PresentationUsage(user_id=user_id, presentation_id=presentation_id,
+                                             day=day, **counters))
+    except IntegrityError:
+        # another worker inserted the row in the meantime
+        query.update(increments, synchronize_session=False)
+
+
+def flush_usage():
+    """ Write usage accumulated by this process to the database """
+    global _last_flush
+
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+
+    try:
+        for (user_id, presentation_id, day), counters in pending.items():
+            _add_usage(user_id, presentation_id, day, counters)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        logger.exception('Could not write presentation usage, keeping it for the next flush')
+        with _pending_lock:
+            for key, counters in pending.items():
+                merged = _pending.setdefault(key, dict.fromkeys(COUNTERS, 0))
+                for name, value in counters.items():
+                    merged[name] += value
+
+
+def usage_today(user_id: int) -> dict:
+    """ Get usage of a user summed over all presentations since the UTC midnight """
+    key = '{}{}'.format(USAGE_PREFIX, user_id)
+    usage = current_cache.get(key)
+    if usage is None:
+        row = db.session.query(*[func.coalesce(func.sum(getattr(PresentationUsage, name)), 0)
+                                 for name in COUNTERS]) \
+            .filter(PresentationUsage.user_id == user_id,
+                    PresentationUsage.day == datetime.utcnow().date()) \
+            .one()
+        usage = dict(zip(COUNTERS, (float(value) for value in row)))
+        current_cache.set(key, usage, timeout=USAGE_CACHE_TIMEOUT)
+    return usage
+
+
+def user_quota(user: dict) -> dict:
+    """ Get daily limits of a user, the most generous of the default quota and quotas of their roles """
+    quota = dict(current_app.config['INVENIO_RECORDS_PRESENTATION_QUOTA'])
+    role_quotas = current_app.config['INVENIO_RECORDS_PRESENTATION_ROLE_QUOTAS']
+    for role in user.get('roles', []):
+        for name, limit in role_quotas.get(role['name'], {}).items():
+            if quota.get(name) is not None and (limit is None or limit > quota[name]):
+                quota[name] = limit
+    return {name: limit for name, limit in quota.items() if limit is not None}
+
+
+def seconds_to_midnight() -> int:
+    now = datetime.utcnow()
+    return int((datetime.combine(now.date() + timedelta(days=1), datetime.min.time()) - now).total_seconds()) + 1
+
+
+def usage_report(since: date, until: date, group_by: str) -> list:
+    """ Sum usage of days between given dates (inclusive) by user, role, presentation or day """
+    from invenio_accounts.models import Role, userrole
+
+    keys = {
+        'user': PresentationUsage.user_id,
+        'role': Role.name,
+        'presentation': PresentationUsage.presentation_id,
+        'day': PresentationUsage.day,
+    }
+    key = keys[group_by]
+    query = db.session.query(key, *[func.sum(getattr(PresentationUsage, name)) for name in COUNTERS]) \
+        .select_from(PresentationUsage) \
+        .filter(PresentationUsage.day >= since, PresentationUsage.day <= until) \
+        .group_by(key) \
+        .order_by(key)
+    if group_by == 'role':
+        query = query.join(userrole, userrole.c.user_id == PresentationUsage.user_id) \
+            .join(Role, Role.id == userrole.c.role_id)
+
+    report = []
+    for row in query:
+        entry = dict(zip(COUNTERS, (float(value or 0) for value in row[1:])))
+        entry[group_by] = row[0].isoformat() if isinstance(row[0], date) else row[0]
+        if group_by == 'user' and row[0] == ANONYMOUS_USER_ID:
+            entry[group_by] = None
+        report.append(entry)
+    return report
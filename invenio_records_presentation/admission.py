@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+""" Admission control of presentation jobs.
+
+    Limits are kept in the configured cache, so they are shared by all web nodes. The
+    checks are not transactional, so the limits are enforced approximately under races.
+    Admitted jobs count as in flight until they are released or their admission expires,
+    so jobs of killed workers do not hold their slots forever.
+"""
+import math
+import time
+import uuid
+from typing import Optional
+
+from flask import current_app
+from invenio_cache import current_cache
+
+from .errors import PresentationAdmissionError
+from .utils import queue_length
+
+ADMISSION_PREFIX = 'invenio_presentation:admission:'
+
+
+def _take_token(key: str, rate: float, burst: int) -> Optional[float]:
+    """ Take a token from a token bucket
+
+        :returns: None if there was a token, otherwise seconds until there will be one
+    """
+    now = time.time()
+    tokens, stamp = current_cache.get(key) or (burst, now)
+    tokens = min(burst, tokens + (now - stamp) * rate)
+    if tokens < 1:
+        return (1 - tokens) / rate
+
+    current_cache.set(key, (tokens - 1, now), timeout=int(burst / rate) + 1)
+    return None
+
+
+def _in_flight_key(presentation_id: str) -> str:
+    return '{}in_flight:{}'.format(ADMISSION_PREFIX, presentation_id)
+
+
+def _job_key(job_id: str) -> str:
+    return '{}job:{}'.format(ADMISSION_PREFIX, job_id)
+
+
+def _in_flight_jobs(presentation_id: str) -> dict:
+    """ Get unexpired admitted jobs of a presentation (job id -> expiration time) """
+    now = time.time()
+    jobs = current_cache.get(_in_flight_key(presentation_id)) or {}
+    return {job_id: expires for job_id, expires in jobs.items() if expires > now}
+
+
+def check_rate_limits(user: dict):
+    """ Check per-user and per-IP token buckets """
+    limits = current_app.config['INVENIO_RECORDS_PRESENTATION_RATE_LIMITS']
+    buckets = []
+    if user.get('id') is not None and limits.get('user'):
+        buckets.append(('user:{}'.format(user['id']), limits['user']))
+    if user.get('current_ip') and limits.get('ip'):
+        buckets.append(('ip:{}'.format(user['current_ip']), limits['ip']))
+
+    for bucket, (rate, burst) in buckets:
+        wait = _take_token(ADMISSION_PREFIX + bucket, rate, burst)
+        if wait is not None:
+            raise PresentationAdmissionError('Too many presentation requests', status=429,
+                                             retry_after=int(math.ceil(wait)))
+
+
+def check_load(presentation_id: str):
+    """ Check presentation queue depth and in-flight jobs of a presentation """
+    retry_after = current_app.config['INVENIO_RECORDS_PRESENTATION_RETRY_AFTER']
+
+    max_queue_length = current_app.config['INVENIO_RECORDS_PRESENTATION_MAX_QUEUE_LENGTH']
+    if max_queue_length is not None and queue_length() >= max_queue_length:
+        raise PresentationAdmissionError('Presentation service is overloaded', status=503,
+                                         retry_after=retry_after)
+
+    max_in_flight = current_app.config['INVENIO_RECORDS_PRESENTATION_MAX_IN_FLIGHT'].get(presentation_id)
+    if max_in_flight is not None and len(_in_flight_jobs(presentation_id)) >= max_in_flight:
+        raise PresentationAdmissionError('Too many {} presentations in progress'.format(presentation_id),
+                                         status=503, retry_after=retry_after)
+
+
+def check_quota(user: dict):
+    """ Check daily usage of a user against their quota """
+    from .accounting import seconds_to_midnight, usage_today, user_quota
+
+    if user.get('id') is None:
+        return
+    quota = user_quota(user)
+    if not quota:
+        return
+
+    usage = usage_today(user['id'])
+    for name, limit in quota.items():
+        if usage.get(name, 0) >= limit:
+            raise PresentationAdmissionError('Daily presentation quota exceeded', status=429,
+                                             retry_after=seconds_to_midnight())
+
+
+def admit_job(presentation_id: str, user: dict) -> str:
+    """ Admit a new presentation job or raise PresentationAdmissionError
+
+        :returns: ID the admitted job must be dispatched with
+    """
+    check_load(presentation_id)
+    check_rate_limits(user)
+    check_quota(user)
+
+    job_id = str(uuid.uuid4())
+    if current_app.config['INVENIO_RECORDS_PRESENTATION_MAX_IN_FLIGHT'].get(presentation_id) is not None:
+        ttl = current_app.config['INVENIO_RECORDS_PRESENTATION_ADMISSION_TTL']
+        jobs = _in_flight_jobs(presentation_id)
+        jobs[job_id] = time.time() + ttl
+        current_cache.set(_in_flight_key(presentation_id), jobs, timeout=ttl)
+        current_cache.set(_job_key(job_id), presentation_id, timeout=ttl)
+    return job_id
+
+
+def release_job(job_id: str):
+    """ Release in-flight slot of a finished job if it was admitted """
+    presentation_id = current_cache.get(_job_key(job_id))
+    if not presentation_id:
+        return
+
+    current_cache.delete(_job_key(job_id))
+    jobs = _in_flight_jobs(presentation_id)
+    if jobs.pop(job_id, None) is not None:
+        current_cache.set(_in_flight_key(presentation_id), jobs,
+                          timeout=current_app.config['INVENIO_RECORDS_PRESENTATION_ADMISSION_TTL'])
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Create presentation usage table."""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '7ca322a37640'
+down_revision = '76245a009d3a'
+branch_labels = ()
+depends_on = None
+
+
+def upgrade():
+    """Upgrade database."""
+    op.create_table(
+        'records_presentation_usage',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('presentation_id', sa.String(length=255), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('jobs', sa.Integer(), nullable=False),
+        sa.Column('cpu_seconds', sa.Float(), nullable=False),
+        sa.Column('wall_seconds', sa.Float(), nullable=False),
+        sa.Column('artifact_bytes', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id', name=op.f('pk_records_presentation_usage')),
+        sa.UniqueConstraint('user_id', 'presentation_id', 'day',
+                            name='uq_records_presentation_usage_user_presentation_day'),
+    )
+    op.create_index(op.f('ix_records_presentation_usage_day'),
+                    'records_presentation_usage', ['day'], unique=False)
+    op.create_index(op.f('ix_records_presentation_usage_user_id'),
+                    'records_presentation_usage', ['user_id'], unique=False)
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_index(op.f('ix_records_presentation_usage_user_id'),
+                  table_name='records_presentation_usage')
+    op.drop_index(op.f('ix_records_presentation_usage_day'),
+                  table_name='records_presentation_usage')
+    op.drop_table('records_presentation_usage')
@@ -6,31 +6,65 @@
 # under the terms of the MIT License; see LICENSE file for more details.
 
 """ API for Invenio Records Presentation."""
-from typing import Optional
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Optional
 
-from invenio_accounts.models import User
+from flask import current_app
+from invenio_access import Permission
 from invenio_db import db
-from invenio_records_files.api import Record
 from invenio_workflows import workflows, WorkflowObject
 from invenio_workflows.errors import WorkflowsMissingData
 from sqlalchemy.orm.exc import NoResultFound
 
 from invenio_records_presentation.errors import WorkflowsRecordNotFound
-from invenio_records_presentation.permissions import needs_permission
+from invenio_records_presentation.permissions import check_permission, needs_permission
 from invenio_records_presentation.workflows import PresentationWorkflow
-from .utils import obj_or_import_string, ScratchDirectory
+from .admission import admit_job, release_job
+from .cache import get_output_job, record_revision, set_output_job
+from .cancellation import check_cancelled, pin_job
+from .utils import content_disposition, obj_or_import_string, release_session, ScratchDirectory, \
+    STREAM_COMPLETE_SUFFIX, STREAM_FAILED_SUFFIX, STREAMING
+
+if TYPE_CHECKING:
+    from invenio_records_files.api import Record
+
+SYSTEM_USER = {
+    'id': None,
+    'email': None,
+    'login_ip': None,
+    'current_ip': None,
+    'roles': [],
+    'full_name': 'System',
+    'username': None
+}
+""" User metadata of presentations prepared by the system itself (pre-warming, CLI) """
 
 
 class PresentationWorkflowObject(WorkflowObject):
     """Main entity for the presentation workflow module."""
 
+    session_released = False
+    """ Do workflow tasks run without an open DB transaction? See :func:`.utils.release_session` """
+
     def __init__(self, model=None):
         """Instantiate class."""
         super(PresentationWorkflowObject, self).__init__(model)
 
+    @classmethod
+    def create_job(cls) -> 'PresentationWorkflowObject':
+        """ Create a workflow object of a new presentation job
+
+            Unlike ``create()``, no savepoint is used and nothing is written to DB
+            until the job is started.
+        """
+        return cls(cls.dbmodel(data={}, extra_data={}, status=cls.known_statuses.INITIAL))
+
     @needs_permission()
     def start_workflow(self, workflow_name, delayed=False, permissions=None,
-                       record_uuid=None, user=None, request_headers=dict, **kwargs):
+                       record_uuid=None, user=None, request_headers=dict, task_options=None,
+                       **kwargs):
         """Run the workflow specified on the object.
            :param workflow_name: name of workflow to run
            :type workflow_name: str
@@ -41,6 +75,9 @@ class PresentationWorkflowObject(WorkflowObject):
            :param record_uuid: UUID of a Record to be presented
            :param user: dict containing user metadata
            :param request_headers: headers dict of a calling request
+           :param task_options: extra Celery options (queue, priority...) of a delayed workflow
+
+           Delayed workflows are sent to Celery once the current DB transaction commits.
 
            :return: UUID of WorkflowEngine (or AsyncResult).
         """
@@ -56,15 +93,21 @@ class PresentationWorkflowObject(WorkflowObject):
         self.model.extra_data['_record'] = record_uuid
         self.model.extra_data['_user'] = user
         self.model.extra_data['_request'] = request_headers
-        self.model.extra_data['_scratch'] = self.scratch.dir_path
+        if delayed:
+            task_options = dict(task_options or {})
+            self.model.extra_data['_job'] = task_options.setdefault('task_id', str(uuid.uuid4()))
 
         from invenio_workflows.tasks import start
+        from .outbox import enqueue_on_commit
+        from .tasks import run_presentation
 
-        self.save()
-        db.session.commit()
+        db.session.add(self.model)
+        db.session.flush()
 
         if delayed:
-            return start.delay(workflow_name, object_id=self.id, **kwargs)
+            return enqueue_on_commit(run_presentation, args=(workflow_name,),
+                                     kwargs=dict(object_id=self.id, **kwargs),
+                                     task_options=task_options)
         else:
             return start(workflow_name, data=[self], **kwargs)
 
@@ -73,31 +116,155 @@ class PresentationWorkflowObject(WorkflowObject):
         return self.model.extra_data
 
     @property
-    def record(self) -> Optional[Record]:
-        try:
-            return Record.get_record(self.model.extra_data['_record'])
-        except NoResultFound:
-            raise WorkflowsRecordNotFound('No Record for id: {}'
-                                          .format(self.model.extra_data['_record']))
+    def extra_data_lock(self) -> threading.RLock:
+        """ Lock to hold while changing ``extra_data`` from tasks running concurrently, e.g. in a DAG """
+        return self.__dict__.setdefault('_extra_data_lock', threading.RLock())
+
+    @property
+    def record(self) -> Optional['Record']:
+        from invenio_records_files.api import Record
+
+        def load():
+            try:
+                return Record.get_record(self.model.extra_data['_record'])
+            except NoResultFound:
+                raise WorkflowsRecordNotFound('No Record for id: {}'
+                                              .format(self.model.extra_data['_record']))
+        return self._load('record', load)
+
+    def check_cancelled(self):
+        """ Stop a long running task if its job was cancelled, see :func:`.cancellation.check_cancelled` """
+        check_cancelled(self)
+
+    def iter_files(self, batch_size=500):
+        """ Iterate over the current versions of the record files
+
+            Files are fetched from DB in batches ordered by key, so only a batch
+            of ``ObjectVersion`` instances is held in memory at once.
+        """
+        from invenio_files_rest.models import ObjectVersion
+        from invenio_records_files.models import RecordsBuckets
+        from sqlalchemy.orm import joinedload
+
+        bucket_ids = [rb.bucket_id for rb in RecordsBuckets.query
+                      .with_entities(RecordsBuckets.bucket_id)
+                      .filter_by(record_id=self.model.extra_data['_record'])]
+
+        for bucket_id in bucket_ids:
+            last_key = None
+            while True:
+                query = ObjectVersion.query \
+                    .options(joinedload(ObjectVersion.file)) \
+                    .filter(ObjectVersion.bucket_id == bucket_id,
+                            ObjectVersion.is_head.is_(True),
+                            ObjectVersion.file_id.isnot(None)) \
+                    .order_by(ObjectVersion.key)
+                if last_key is not None:
+                    query = query.filter(ObjectVersion.key > last_key)
+
+                batch = query.limit(batch_size).all()
+                if self.session_released:
+                    release_session()  # do not hold the connection while the batch is processed
+                if not batch:
+                    break
+                for object_version in batch:
+                    yield object_version
+                last_key = batch[-1].key
+                self.check_cancelled()
+
+    def iter_metadata(self, field: str, batch_size=500):
+        """ Iterate over items of a top-level array field of the record metadata
+
+            On PostgreSQL the items are streamed from a server-side cursor, so the whole
+            array never has to be loaded. Other databases load the record JSON once.
+        """
+        from invenio_records.models import RecordMetadata
+
+        record_uuid = self.model.extra_data['_record']
+        if db.engine.dialect.name == 'postgresql':
+            elements = db.func.jsonb_array_elements(RecordMetadata.json.op('->')(field)) \
+                .alias('element')
+            query = db.session.query(db.column('element', type_=RecordMetadata.json.type)) \
+                .select_from(RecordMetadata) \
+                .join(elements, db.true()) \
+                .filter(RecordMetadata.id == record_uuid) \
+                .execution_options(stream_results=True) \
+                .yield_per(batch_size)
+            for row in query:
+                yield row[0]
+            if self.session_released:
+                release_session()
+        else:
+            json = RecordMetadata.query.with_entities(RecordMetadata.json) \
+                .filter_by(id=record_uuid).scalar() or {}
+            if self.session_released:
+                release_session()
+            for item in json.get(field, []):
+                yield item
 
     @property
     def user(self):
-        return User.query.get(self.model.extra_data['_user']['id'])
+        from invenio_accounts.models import User
+
+        return self._load('user', lambda: User.query.get(self.model.extra_data['_user']['id']))
+
+    def _load(self, name, loader):
+        """ Load data related to the job once, ending the transaction again if running in a worker """
+        loaded = self.__dict__.setdefault('_loaded', {})
+        if name not in loaded:
+            loaded[name] = loader()
+            if self.session_released:
+                release_session()
+        return loaded[name]
+
+    @contextmanager
+    def stream_output(self, mimetype, filename, task_name='output'):
+        """ Write the job output so that it can be downloaded while it is being written
+
+            Yields a binary file handle to write the output into. Clients downloading the
+            output get data as soon as it is flushed. Streaming is only published when the
+            artifact storage is the (shared) scratch directory; otherwise the output is
+            downloadable once the job finishes, as usual.
+        """
+        from celery import current_app as current_celery_app
+        from .proxies import current_records_presentation
+
+        fh, path = self.scratch.create_file(task_name=task_name, pass_fh=True, transient=False)
+        output = PresentationOutputFile(path=path, mimetype=mimetype, filename=filename)
+        output['streaming'] = True
+
+        job_id = self.model.extra_data.get('_job', None)
+        if job_id and current_records_presentation.storage.local:
+            current_celery_app.backend.store_result(job_id, output, STREAMING)
+
+        try:
+            with fh:
+                yield fh
+        except BaseException:
+            open(path + STREAM_FAILED_SUFFIX, 'wb').close()
+            raise
+        open(path + STREAM_COMPLETE_SUFFIX, 'wb').close()
+        self.data = output
 
     @property
     def scratch(self) -> ScratchDirectory:
-        if self.model.extra_data.get('_scratch', None):
-            return ScratchDirectory.from_path(self.model.extra_data['_scratch'])
+        """ Scratch directory of the job, created on first access by the worker """
+        with self.extra_data_lock:
+            if self.model.extra_data.get('_scratch', None):
+                return ScratchDirectory.from_path(self.model.extra_data['_scratch'])
 
-        return ScratchDirectory()
+            scratch = ScratchDirectory()
+            self.model.extra_data['_scratch'] = scratch.dir_path
+            return scratch
 
 
 class Presentation(object):
 
-    def __init__(self, name: str, permissions: list):
+    def __init__(self, name: str, permissions: list, workflow: Optional[PresentationWorkflow] = None):
         self.name = name
         self.permissions = []
         self.init_permissions(permissions)
+        self._workflow = workflow
         self.initialized = True
 
     def init_permissions(self, permission_list: list):
@@ -111,29 +278,86 @@ class Presentation(object):
 
     @property
     def workflow(self) -> Optional[PresentationWorkflow]:
-        return workflows.get(self.name, None)
+        if self._workflow is None:
+            self._workflow = workflows.get(self.name, None)
+        return self._workflow
+
+    @property
+    def prewarmed(self) -> bool:
+        """ Are outputs of this presentation pre-warmed and shared through the output cache? """
+        return self.name in current_app.config['INVENIO_RECORDS_PRESENTATION_PREWARM']
 
-    def prepare(self, record_uuid, user, request_headers=dict, delayed=True) -> str:
+    def prepare(self, record_uuid, user, request_headers=dict, delayed=True,
+                check_permissions=True, task_options=None, cached=True, admit=True) -> str:
         """ Prepare Presentation of a given record
 
             :param record_uuid: UUID of a Record to be presented
             :param user: dict containing user metadata
             :param request_headers: headers dict of a calling request
+            :param check_permissions: check presentation permissions of the current user
+            :param task_options: extra Celery options (queue, priority...) of a delayed workflow
+            :param cached: reuse a pre-warmed job from the output cache if there is one
+            :param admit: subject the job to admission control
+
+            The job is sent to workers once the current DB transaction commits.
 
             :returns eng_uuid: running workflow engine UUID
         """
         assert self.initialized
 
-        presentation_obj = PresentationWorkflowObject().create(data='/tmp')
-        return presentation_obj.start_workflow(self.name, delayed=delayed,
-                                               permissions=self.permissions,
-                                               record_uuid=record_uuid, user=user,
-                                               request_headers=request_headers)
+        if check_permissions and self.permissions:
+            check_permission(Permission(*self.permissions))
+
+        if cached and self.prewarmed:
+            job_id = get_output_job(self.name, record_uuid, record_revision(record_uuid))
+            if job_id:
+                return job_id
+
+        if delayed and admit:
+            task_options = dict(task_options or {}, task_id=admit_job(self.name, user))
+
+        try:
+            presentation_obj = PresentationWorkflowObject.create_job()
+            # permissions were already checked above
+            return presentation_obj.start_workflow(self.name, delayed=delayed, permissions=[],
+                                                   record_uuid=record_uuid, user=user,
+                                                   request_headers=request_headers,
+                                                   task_options=task_options)
+        except Exception:
+            if task_options and 'task_id' in task_options:
+                release_job(task_options['task_id'])
+            raise
+
+    def prewarm(self, record_uuid, task_options=None, force=False) -> Optional[str]:
+        """ Prepare Presentation of the current record revision into the output cache
+
+            :param record_uuid: UUID of a Record to be presented
+            :param task_options: extra Celery options (queue, priority...) of the workflow
+            :param force: prepare the presentation again even if it is already in the output cache
+
+            :returns: ID of a job preparing the presentation or None if the record does not exist
+        """
+        revision = record_revision(record_uuid)
+        if revision is None:
+            return None
+
+        job_id = None if force else get_output_job(self.name, record_uuid, revision)
+        if not job_id:
+            result = self.prepare(str(record_uuid), SYSTEM_USER, {}, delayed=True,
+                                  check_permissions=False, task_options=task_options,
+                                  cached=False, admit=False)
+            job_id = getattr(result, 'task_id', result)
+            pin_job(job_id)
+            set_output_job(self.name, record_uuid, revision, job_id)
+
+        return job_id
 
 
-def PresentationOutputFile(path, mimetype, filename):
+def PresentationOutputFile(path, mimetype, filename, encoding=None):
     return dict(
         path=path,
         mimetype=mimetype,
         filename=filename,
+        encoding=encoding,
+        content_disposition=content_disposition(filename),
     )
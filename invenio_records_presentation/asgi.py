@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""ASGI (asyncio) variant of the presentation REST API.
+
+The application serves ``/prepare/``, ``/status/`` and ``/download/`` of the presentation
+blueprint. Short calls (``prepare``, ``status``) are dispatched to the Flask application
+on a small thread pool, so they keep exactly the same permission semantics. Downloads wait
+for their job in the event loop and stream the output file chunk by chunk, so pending
+downloads do not hold a thread while the job is running::
+
+    from invenio_app.factory import create_api
+    from invenio_records_presentation.asgi import PresentationASGIApp
+
+    application = PresentationASGIApp(create_api())
+"""
+
+import asyncio
+import io
+import logging
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from celery import current_app as current_celery_app
+from celery import states
+from werkzeug.test import run_wsgi_app
+
+logger = logging.getLogger(__name__)
+
+
+class PresentationASGIApp(object):
+    """ASGI application serving the presentation REST API."""
+
+    def __init__(self, app, url_prefix='/presentation/1.0', max_workers=4,
+                 poll_interval=0.2, max_poll_interval=2.0, wait_timeout=30 * 60, fallback=None):
+        """Initialize the application.
+
+        :param app: Flask application with the presentation extension and blueprint
+        :param url_prefix: URL prefix of the presentation blueprint
+        :param max_workers: number of threads running blocking calls
+        :param poll_interval: initial interval of result backend polling
+        :param max_poll_interval: maximal interval of result backend polling
+        :param wait_timeout: seconds a download waits for its job to finish
+        :param fallback: ASGI application handling requests outside of the presentation API
+        """
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='presentation-asgi')
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.wait_timeout = wait_timeout
+        self.fallback = fallback
+        self.download_route = re.compile(r'^{}/download/(?P<job_uuid>[^/]+)/$'.format(re.escape(url_prefix)))
+        self.wsgi_routes = re.compile(r'^{}/(prepare|status|preview|job)/'.format(re.escape(url_prefix)))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise NotImplementedError('Unsupported ASGI scope: {}'.format(scope['type']))
+
+        path = scope['path']
+        match = self.download_route.match(path)
+        if match and scope['method'] in ('GET', 'HEAD'):
+            return await self.download(match.group('job_uuid'), scope, send)
+        if self.wsgi_routes.match(path):
+            return await self.dispatch_wsgi(scope, receive, send)
+        if self.fallback is not None:
+            return await self.fallback(scope, receive, send)
+        return await self.respond(send, 404, b'Not Found')
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def run(self, func, *args, **kwargs):
+        """Run a blocking call on the thread pool."""
+        return asyncio.get_running_loop().run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def respond(self, send, status, body=b'', headers=None):
+        headers = dict(headers or {})
+        headers.setdefault('Content-Type', 'text/plain; charset=utf-8')
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': _encode_headers(headers.items())})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def dispatch_wsgi(self, scope, receive, send):
+        """Run a short request through the Flask application."""
+        body = await _read_body(receive)
+        app_iter, status, headers = await self.run(run_wsgi_app, self.app,
+                                                   _wsgi_environ(scope, body), buffered=True)
+        await send({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                    'headers': _encode_headers(headers.items())})
+        await send({'type': 'http.response.body', 'body': b''.join(app_iter)})
+
+    async def wait_for_result(self, job_uuid):
+        """Wait for a job to finish without blocking a thread.
+
+        :returns: UUID of the workflow engine that ran the job
+        :raises asyncio.TimeoutError: if the job did not finish in ``wait_timeout`` seconds
+        """
+        result = current_celery_app.AsyncResult(job_uuid)
+        interval = self.poll_interval
+        deadline = time.monotonic() + self.wait_timeout
+        while not await self.run(self.poll, result):
+            if time.monotonic() >= deadline:
+                raise asyncio.TimeoutError()
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, self.max_poll_interval)
+        return await self.run(result.get, propagate=True)
+
+    def poll(self, result):
+        """ Is a job finished? Records that the client still waits for it otherwise """
+        if result.ready():
+            return True
+        self.heartbeat(result.id)
+        return False
+
+    def heartbeat(self, job_uuid):
+        """ Record that a client still waits for a job, see :mod:`.cancellation` """
+        from .cancellation import heartbeat
+
+        with self.app.app_context():
+            heartbeat(job_uuid)
+
+    def resolved_output(self, job_uuid, eng_uuid=None):
+        """ Get output of a finished job, from the resolved output cache if possible """
+        from .cache import get_resolved_output, set_resolved_output
+        from .cancellation import heartbeat
+        from .views import job_output
+
+        with self.app.app_context():
+            heartbeat(job_uuid)
+            output = get_resolved_output(job_uuid)
+            if output is None and eng_uuid is not None:
+                output = job_output(eng_uuid)
+                set_resolved_output(job_uuid, output)
+            return output
+
+    def resolve_download(self, output, accept_encoding, if_none_match=None):
+        """ Get redirect URL or body chunks and headers of a job output
+
+            Neither URL nor chunks are returned if the client already has the output.
+        """
+        from .views import download_body, download_redirect, not_modified
+
+        with self.app.app_context():
+            headers = not_modified(output, accept_encoding, if_none_match)
+            if headers:
+                return None, None, headers
+            url = download_redirect(output, accept_encoding)
+            if url:
+                return url, None, None
+            return (None,) + download_body(output, accept_encoding)
+
+    async def follow(self, result, scope, send, idle_checks=10):
+        """Stream a job output which is still being written, until the job finishes or fails."""
+        from .utils import follow_file
+        from .views import download_headers
+
+        output = await self.run(lambda: result.info)
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': _encode_headers(download_headers(output).items())})
+        if scope['method'] == 'HEAD':
+            return await send({'type': 'http.response.body', 'body': b''})
+
+        idle_timeout = self.app.config['INVENIO_RECORDS_PRESENTATION_STREAM_IDLE_TIMEOUT']
+        chunks = follow_file(output['path'])
+        idle = 0
+        last_data = last_heartbeat = time.monotonic()
+        try:
+            while True:
+                if time.monotonic() - last_heartbeat >= self.poll_interval:
+                    await self.run(self.heartbeat, result.id)
+                    last_heartbeat = time.monotonic()
+                chunk = await self.run(next, chunks, b'')
+                if chunk == b'':
+                    break
+                if chunk is None:
+                    idle += 1
+                    if idle % idle_checks == 0 and await self.run(lambda: result.state) in ('FAILURE', 'REVOKED'):
+                        return
+                    if time.monotonic() - last_data > idle_timeout:  # e.g. the worker was killed
+                        logger.warning('Presentation job %s stopped writing its output', result.id)
+                        return
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                idle = 0
+                last_data = time.monotonic()
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        except Exception:
+            # closing the connection without the final chunk tells the client the output is incomplete
+            logger.exception('Exception detected in download')
+            return
+        finally:
+            await self.run(chunks.close)
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def download(self, job_uuid, scope, send):
+        from .utils import STREAMING
+
+        result = current_celery_app.AsyncResult(job_uuid)
+        output = await self.run(self.resolved_output, job_uuid)
+        if output is None and await self.run(lambda: result.state) == STREAMING:
+            return await self.follow(result, scope, send)
+
+        request_headers = dict(scope.get('headers', []))
+        accept_encoding = request_headers.get(b'accept-encoding', b'').decode('latin-1')
+        if_none_match = request_headers.get(b'if-none-match', b'').decode('latin-1')
+        try:
+            if output is None:
+                eng_uuid = await self.wait_for_result(job_uuid)
+                output = await self.run(self.resolved_output, job_uuid, eng_uuid)
+            url, chunks, headers = await self.run(self.resolve_download, output, accept_encoding,
+                                                  if_none_match)
+        except asyncio.TimeoutError:
+            if await self.run(lambda: result.state) == states.PENDING:  # unknown, or never started
+                return await self.respond(send, 404, b'Presentation job not found')
+            return await self.respond(send, 504, b'Presentation job did not finish in time')
+        except Exception:
+            if await self.run(lambda: result.state) == states.REVOKED:
+                return await self.respond(send, 410, b'Presentation job was cancelled')
+            logger.exception('Exception detected in download')
+            return await self.respond(send, 500, b'Presentation job failed')
+
+        if url:
+            return await self.respond(send, 302, headers={'Location': url})
+        if chunks is None:
+            return await self.respond(send, 304, headers=headers)
+
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': _encode_headers(headers.items())})
+        if scope['method'] == 'HEAD':
+            await self.run(chunks.close)
+            return await send({'type': 'http.response.body', 'body': b''})
+
+        try:
+            while True:
+                chunk = await self.run(next, chunks, None)
+                if chunk is None:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            await self.run(chunks.close)
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+async def _read_body(receive) -> bytes:
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body', False):
+            return body
+
+
+def _encode_headers(headers):
+    return [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in headers]
+
+
+def _wsgi_environ(scope, body) -> dict:
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = 'HTTP_{}'.format(name)
+            environ[key] = '{},{}'.format(environ[key], value) if key in environ else value
+    return environ
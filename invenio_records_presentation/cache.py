@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+""" Caches for Invenio Records Presentation outputs."""
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from celery import current_app as current_celery_app
+from flask import current_app
+from invenio_cache import current_cache
+
+OUTPUT_CACHE_PREFIX = 'invenio_presentation:output:'
+RESOLVED_OUTPUT_PREFIX = 'invenio_presentation:resolved:'
+
+UNUSABLE_JOB_STATES = ('FAILURE', 'REVOKED')
+
+
+def record_revision(record_uuid) -> Optional[int]:
+    """ Get current revision of a record without loading its metadata """
+    from invenio_records.models import RecordMetadata
+
+    return RecordMetadata.query \
+        .with_entities(RecordMetadata.version_id) \
+        .filter_by(id=record_uuid) \
+        .scalar()
+
+
+def output_cache_key(presentation_id: str, record_uuid, revision) -> str:
+    return '{}{}:{}:{}'.format(OUTPUT_CACHE_PREFIX, presentation_id, record_uuid, revision)
+
+
+def get_output_job(presentation_id: str, record_uuid, revision) -> Optional[str]:
+    """ Get ID of a job that prepares (or prepared) presentation of a record revision
+
+        :returns: job ID or None when there is no usable job in the cache
+    """
+    key = output_cache_key(presentation_id, record_uuid, revision)
+    job_id = current_cache.get(key)
+    if not job_id:
+        return None
+
+    if current_celery_app.AsyncResult(job_id).state in UNUSABLE_JOB_STATES:
+        current_cache.delete(key)
+        return None
+
+    return job_id
+
+
+def set_output_job(presentation_id: str, record_uuid, revision, job_id: str):
+    """ Remember a job preparing presentation of a record revision """
+    current_cache.set(output_cache_key(presentation_id, record_uuid, revision), job_id,
+                      timeout=current_app.config['INVENIO_RECORDS_PRESENTATION_OUTPUT_CACHE_TIMEOUT'])
+
+
+class _ResolvedOutputMemo(object):
+    """ Bounded in-process memo of resolved job outputs with a TTL """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self.lock:
+            entry = self.entries.get(job_id)
+            if entry is None:
+                return None
+            expires, output = entry
+            if expires < time.monotonic():
+                del self.entries[job_id]
+                return None
+            self.entries.move_to_end(job_id)
+            return output
+
+    def set(self, job_id: str, output: dict, ttl: int, max_size: int):
+        with self.lock:
+            self.entries[job_id] = (time.monotonic() + ttl, output)
+            self.entries.move_to_end(job_id)
+            while len(self.entries) > max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, job_id: str):
+        with self.lock:
+            self.entries.pop(job_id, None)
+
+
+_resolved_outputs = _ResolvedOutputMemo()
+
+
+def get_resolved_output(job_id: str) -> Optional[dict]:
+    """ Get output of a finished job resolved by an earlier download, without asking Celery or DB
+
+        Outputs of finished jobs do not change, so they are memoized in the process and shared
+        with other web workers through the cache.
+    """
+    output = _resolved_outputs.get(job_id)
+    if output is None:
+        output = current_cache.get(RESOLVED_OUTPUT_PREFIX + job_id)
+        if output is not None:
+            _resolved_outputs.set(job_id, output,
+                                  current_app.config['INVENIO_RECORDS_PRESENTATION_RESOLVED_OUTPUT_TTL'],
+                                  current_app.config['INVENIO_RECORDS_PRESENTATION_RESOLVED_OUTPUT_MEMO_SIZE'])
+    return output
+
+
+def set_resolved_output(job_id: str, output: dict):
+    """ Remember output (path or URI, mimetype, filename, size, hash...) of a finished job """
+    ttl = current_app.config['INVENIO_RECORDS_PRESENTATION_RESOLVED_OUTPUT_TTL']
+    _resolved_outputs.set(job_id, output, ttl,
+                          current_app.config['INVENIO_RECORDS_PRESENTATION_RESOLVED_OUTPUT_MEMO_SIZE'])
+    current_cache.set(RESOLVED_OUTPUT_PREFIX + job_id, output, timeout=ttl)
+
+
+def forget_resolved_output(job_id: str):
+    """ Drop a resolved output, e.g. when its artifact is gone """
+    _resolved_outputs.delete(job_id)
+    current_cache.delete(RESOLVED_OUTPUT_PREFIX + job_id)
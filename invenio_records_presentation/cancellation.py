@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+""" Cancellation of presentation jobs nobody waits for.
+
+    Every user (or anonymous session) whose ``prepare`` request returned a job counts as
+    one of its requesters, so a job coalesced from the output cache may have many of them.
+    A job is cancelled when all its requesters gave it up (``DELETE /job/<job_uuid>/``,
+    repeated calls of the same requester count once), or when none of them asked for its
+    status or output for ``INVENIO_RECORDS_PRESENTATION_CANCEL_IDLE`` seconds.
+    Pre-warming jobs prepare outputs for the cache, so they are never cancelled.
+
+    A run of a hedged job is also cancelled once another run claimed the job result.
+
+    Workers check cancellation between workflow tasks, long running tasks may check it
+    themselves with :meth:`.api.PresentationWorkflowObject.check_cancelled`, and the worker
+    removes the scratch of a cancelled job. Scratch is created by the first task needing it,
+    so jobs revoked before they started have none. The state is kept in the configured cache,
+    so like admission control it is approximate under races.
+"""
+import time
+
+from celery import current_app as current_celery_app
+from celery import states
+from flask import current_app
+from invenio_cache import current_cache
+
+from .admission import release_job
+from .errors import PresentationJobCancelled
+from .hedging import is_decided
+
+CANCEL_PREFIX = 'invenio_presentation:cancel:'
+
+CHECK_INTERVAL = 1
+""" Seconds for which the cancellation of a job is not checked again by the same task """
+
+
+def _key(kind: str, job_id: str) -> str:
+    return '{}{}:{}'.format(CANCEL_PREFIX, kind, job_id)
+
+
+def _timeout() -> int:
+    return current_app.config['INVENIO_RECORDS_PRESENTATION_OUTPUT_CACHE_TIMEOUT']
+
+
+def _requester_key(job_id: str, requester: str) -> str:
+    return '{}requester:{}:{}'.format(CANCEL_PREFIX, job_id, requester)
+
+
+def add_requester(job_id: str, requester: str):
+    """ Count a requester of a job, who is now waiting for it
+
+        :param requester: identity of the requester, e.g. its user id; it is counted once per job
+    """
+    if current_cache.add(_requester_key(job_id, requester), True, timeout=_timeout()):
+        key = _key('requesters', job_id)
+        if not current_cache.add(key, 1, timeout=_timeout()):
+            current_cache.cache.inc(key)
+    heartbeat(job_id)
+
+
+def pin_job(job_id: str):
+    """ Never cancel a job, e.g. because it prepares an output for the output cache """
+    current_cache.set(_key('pinned', job_id), True, timeout=_timeout())
+
+
+def heartbeat(*job_ids: str):
+    """ Record that requesters of jobs are still waiting for them """
+    if current_app.config['INVENIO_RECORDS_PRESENTATION_CANCEL_IDLE'] is None:
+        return
+    now = time.time()
+    current_cache.set_many({_key('heartbeat', job_id): now for job_id in job_ids}, timeout=_timeout())
+
+
+def cancel_job(job_id: str, requester: str) -> bool:
+    """ Give up a job on behalf of one of its requesters
+
+        Giving up a job again, or on behalf of someone who did not request it, changes nothing.
+
+        :returns: True if the job is cancelled, False if it is pinned or other requesters remain
+    """
+    from .cache import forget_resolved_output
+
+    key = _key('requesters', job_id)
+    remaining = None
+    if current_cache.get(key) is not None:
+        if not current_cache.delete(_requester_key(job_id, requester)):
+            return bool(current_cache.get(_key('cancelled', job_id)))
+        remaining = current_cache.cache.dec(key)
+    if current_cache.get(_key('pinned', job_id)) or (remaining is not None and remaining > 0):
+        return False
+
+    current_cache.set(_key('cancelled', job_id), True, timeout=_timeout())
+    current_celery_app.control.revoke(job_id)  # drop the job if no worker started it yet
+    if current_celery_app.AsyncResult(job_id).state == states.PENDING:
+        release_job(job_id)  # a revoked job never runs, so it would not release its in-flight slot
+    forget_resolved_output(job_id)
+    return True
+
+
+def is_cancelled(job_id: str) -> bool:
+    """ Was a job cancelled by its requesters, or did they stop waiting for it? """
+    cancelled, pinned, last_heartbeat = current_cache.get_many(
+        _key('cancelled', job_id), _key('pinned', job_id), _key('heartbeat', job_id))
+    if cancelled:
+        return True
+
+    idle = current_app.config['INVENIO_RECORDS_PRESENTATION_CANCEL_IDLE']
+    if idle is None or pinned or last_heartbeat is None:
+        return False  # not requested through the REST API
+    return time.time() - last_heartbeat > idle
+
+
+def check_cancelled(obj):
+    """ Stop a job if it was cancelled
+
+        Checks are throttled, so tasks may call this often, e.g. for every processed file.
+
+        :raises PresentationJobCancelled: if the job of the workflow object was cancelled
+    """
+    job_id = obj.extra_data.get('_job', None) or obj.extra_data.get('_hedge_of', None)
+    if not job_id:
+        return
+
+    now = time.monotonic()
+    if now - obj.__dict__.get('_cancel_checked', float('-inf')) < CHECK_INTERVAL:
+        return
+    obj.__dict__['_cancel_checked'] = now
+
+    if is_cancelled(job_id):
+        raise PresentationJobCancelled('Presentation job {} was cancelled'.format(job_id))
+    if is_decided(job_id):
+        raise PresentationJobCancelled('Presentation job {} was finished by another run'.format(job_id))
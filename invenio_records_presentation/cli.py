@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+""" CLI commands for Invenio Records Presentation."""
+import json
+import os
+import time
+from collections import OrderedDict
+from itertools import islice
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from .proxies import current_records_presentation
+
+
+@click.group()
+def presentation():
+    """Records presentation commands."""
+
+
+def _batches(iterable, batch_size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_all_record_ids(batch_size, after=None):
+    """ Stream ids of all records which are not deleted from DB using keyset pagination """
+    from invenio_db import db
+    from invenio_records.models import RecordMetadata
+
+    while True:
+        query = RecordMetadata.query.with_entities(RecordMetadata.id) \
+            .filter(RecordMetadata.json.isnot(None)) \
+            .order_by(RecordMetadata.id)
+        if after:
+            query = query.filter(RecordMetadata.id > after)
+        ids = [row.id for row in query.limit(batch_size)]
+        db.session.commit()  # do not keep a transaction open between batches
+        if not ids:
+            return
+        for record_id in ids:
+            yield record_id
+        after = ids[-1]
+
+
+def iter_query_record_ids(query, batch_size, after=None):
+    """ Stream ids of records matching a search query, ordered by id using search_after
+
+        Unlike a scroll, the order is the same in every run, so a build can resume after the last id.
+    """
+    from invenio_search.api import RecordsSearch
+
+    search = RecordsSearch().query('query_string', query=query).source(False).sort('_id')
+    while True:
+        page = search.extra(size=batch_size)
+        if after:
+            page = page.extra(search_after=[after])
+        hits = list(page.execute())
+        if not hits:
+            return
+        for hit in hits:
+            yield hit.meta.id
+        after = hits[-1].meta.id
+
+
+def iter_pid_record_ids(pids, batch_size, missing=None):
+    """ Stream ids of records identified by 'pid_type:pid_value' strings
+
+        :param missing: called with every PID which is malformed or not registered
+    """
+    from invenio_pidstore.models import PersistentIdentifier
+
+    for batch in _batches(pids, batch_size):
+        by_type = {}
+        for pid in batch:
+            pid = pid.strip()
+            pid_type, separator, pid_value = pid.partition(':')
+            if not separator:
+                if missing:
+                    missing(pid)
+                continue
+            by_type.setdefault(pid_type, []).append(pid_value)
+
+        for pid_type, pid_values in by_type.items():
+            query = PersistentIdentifier.query \
+                .with_entities(PersistentIdentifier.pid_value, PersistentIdentifier.object_uuid) \
+                .filter(PersistentIdentifier.pid_type == pid_type,
+                        PersistentIdentifier.pid_value.in_(pid_values))
+            found = set()
+            for row in query:
+                found.add(row.pid_value)
+                yield row.object_uuid
+            if missing:
+                for pid_value in pid_values:
+                    if pid_value not in found:
+                        missing('{}:{}'.format(pid_type, pid_value))
+
+
+class BuildCheckpoint(object):
+    """ Persistent progress of a bulk build
+
+        Only the longest prefix of dispatched records with all their jobs finished is
+        recorded, so that resuming never skips a record whose job did not finish. Builds
+        of PID lists resume from the offset, builds of all records or of a query after the
+        last id, as they list records ordered by id.
+    """
+
+    SAVE_INTERVAL = 5
+
+    def __init__(self, path, presentation_id):
+        self.path = path
+        self._saved = 0
+        self.offset = 0
+        self.last_id = None
+        self._pending = OrderedDict()  # offset -> [record_id, finished]
+
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if data.get('presentation') != presentation_id:
+                raise click.ClickException('Checkpoint {} belongs to presentation {}'
+                                           .format(path, data.get('presentation')))
+            self.offset = data['offset']
+            self.last_id = data['last_id']
+        self.presentation_id = presentation_id
+        self._next = self.offset
+
+    def dispatched(self, record_id) -> int:
+        position = self._next
+        self._pending[position] = [record_id, False]
+        self._next += 1
+        return position
+
+    def finished(self, position):
+        self._pending[position][1] = True
+        while self._pending.get(self.offset, (None, False))[1]:
+            record_id, _ = self._pending.pop(self.offset)
+            self.last_id = str(record_id)
+            self.offset += 1
+
+    def save(self, force=False):
+        if not self.path or not (force or time.time() - self._saved > self.SAVE_INTERVAL):
+            return
+        self._saved = time.time()
+        tmp_path = '{}.tmp'.format(self.path)
+        with open(tmp_path, 'w') as f:
+            json.dump({'presentation': self.presentation_id,
+                       'offset': self.offset,
+                       'last_id': self.last_id}, f)
+        os.replace(tmp_path, self.path)
+
+
+@presentation.command('build')
+@click.argument('presentation_id')
+@click.option('--query', '-q', default=None, help='Search query selecting records to be presented.')
+@click.option('--pid', '-p', 'pids', multiple=True, help='Record PID as pid_type:pid_value.')
+@click.option('--pid-file', type=click.File('r'), default=None,
+              help='File with one pid_type:pid_value per line.')
+@click.option('--batch-size', default=500, show_default=True, help='Records fetched from DB or search at once.')
+@click.option('--concurrency', default=50, show_default=True, help='Maximum number of jobs in flight.')
+@click.option('--checkpoint', type=click.Path(dir_okay=False), default=None,
+              help='File to store progress in and resume from.')
+@click.option('--queue', default=None, help='Celery queue of the presentation jobs.')
+@click.option('--force/--no-force', default=True, show_default=True,
+              help='Prepare presentations even if they are in the output cache.')
+@with_appcontext
+def build(presentation_id, query, pids, pid_file, batch_size, concurrency, checkpoint, queue,
+          force):
+    """Prepare presentation of many records."""
+    from celery import current_app as current_celery_app
+    from invenio_db import db
+
+    try:
+        pres = current_records_presentation.get_presentation(presentation_id)
+    except AttributeError as e:
+        raise click.BadParameter(str(e), param_hint='PRESENTATION_ID')
+
+    progress = BuildCheckpoint(checkpoint, presentation_id)
+    failures = []
+
+    if pids or pid_file:
+        pid_list = list(pids) + ([line for line in pid_file if line.strip()] if pid_file else [])
+        record_ids = islice(iter_pid_record_ids(pid_list, batch_size,
+                                                missing=lambda pid: failures.append((pid, None, 'PID not found'))),
+                            progress.offset, None)
+    elif query:
+        record_ids = iter_query_record_ids(query, batch_size, after=progress.last_id)
+    else:
+        record_ids = iter_all_record_ids(batch_size, after=progress.last_id)
+
+    task_options = dict(current_app.config['INVENIO_RECORDS_PRESENTATION_PREWARM_TASK_OPTIONS'])
+    if queue:
+        task_options['queue'] = queue
+
+    in_flight = OrderedDict()  # position -> (record_id, AsyncResult)
+    dispatched = 0
+    started = time.time()
+
+    def collect(block):
+        if not block(len(in_flight)):
+            return
+        db.session.commit()  # dispatches the jobs prepared so far
+        while in_flight:
+            done = [position for position, (_, result) in in_flight.items() if result.ready()]
+            for position in done:
+                record_id, result = in_flight.pop(position)
+                if result.failed():
+                    failures.append((record_id, result.task_id, str(result.info)))
+                progress.finished(position)
+            progress.save()
+            if not block(len(in_flight)):
+                return
+            if not done:
+                time.sleep(0.5)
+
+    for record_id in record_ids:
+        position = progress.dispatched(record_id)
+        job_id = None
+        try:
+            with db.session.begin_nested():
+                job_id = pres.prewarm(record_id, task_options=task_options, force=force)
+            if not job_id:
+                failures.append((record_id, None, 'Record not found'))
+        except Exception as e:
+            failures.append((record_id, None, str(e)))
+        dispatched += 1
+
+        if job_id:
+            in_flight[position] = (record_id, current_celery_app.AsyncResult(job_id))
+        else:
+            progress.finished(position)
+
+        if dispatched % batch_size == 0:
+            db.session.commit()
+        collect(block=lambda n: n >= concurrency)
+
+    collect(block=lambda n: n > 0)
+    db.session.commit()
+    progress.save(force=True)
+
+    elapsed = time.time() - started
+    click.echo('Prepared {} records in {:.1f}s ({:.2f} records/s), {} failed'
+               .format(dispatched, elapsed, dispatched / elapsed if elapsed else 0, len(failures)))
+    for record_id, job_id, error in failures:
+        click.secho('{} (job {}): {}'.format(record_id, job_id, error), fg='red', err=True)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+""" Compression of Invenio Records Presentation outputs."""
+import gzip
+import os
+import shutil
+from fnmatch import fnmatch
+from typing import Optional
+
+from flask import current_app
+from werkzeug.http import parse_accept_header
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+CHUNK_SIZE = 128000
+
+SUFFIXES = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+
+def available_encodings() -> tuple:
+    return ('gzip', 'zstd') if zstandard else ('gzip',)
+
+
+def encoding_for(mimetype: str) -> Optional[str]:
+    """ Get content encoding an output of a given mimetype should be stored with """
+    mimetype = mimetype.split(';', 1)[0].strip().lower()
+    for pattern, encoding in current_app.config['INVENIO_RECORDS_PRESENTATION_COMPRESSION'].items():
+        if fnmatch(mimetype, pattern):
+            if encoding not in available_encodings():
+                encoding = 'gzip'
+            return encoding
+    return None
+
+
+def compress_file(path: str, encoding: str) -> str:
+    """ Compress a file in place
+
+        :returns: path of the compressed file, which replaces the original one
+    """
+    compressed_path = path + SUFFIXES[encoding]
+    with open(path, 'rb') as src, open(compressed_path, 'wb') as dst:
+        if encoding == 'zstd':
+            zstandard.ZstdCompressor().copy_stream(src, dst)
+        else:
+            with gzip.GzipFile(filename='', mode='wb', fileobj=dst, mtime=0) as writer:
+                shutil.copyfileobj(src, writer, CHUNK_SIZE)
+    os.remove(path)
+    return compressed_path
+
+
+def iter_decompressed(fileobj, encoding: str, chunk_size=CHUNK_SIZE):
+    """ Stream decompressed contents of a compressed binary file object, closing it at the end """
+    with fileobj:
+        if encoding == 'zstd':
+            reader = zstandard.ZstdDecompressor().stream_reader(fileobj)
+        else:
+            reader = gzip.GzipFile(fileobj=fileobj, mode='rb')
+        with reader:
+            while True:
+                buf = reader.read(chunk_size)
+                if not buf:
+                    break
+                yield buf
+
+
+def accepts_encoding(accept_encoding: Optional[str], encoding: str) -> bool:
+    """ Does an Accept-Encoding header value allow a given content encoding? """
+    if not accept_encoding:
+        return False
+    return parse_accept_header(accept_encoding)[encoding] > 0
@@ -15,6 +15,18 @@ WORKFLOWS_OBJECT_CLASS = 'invenio_records_presentation.api.PresentationWorkflowO
 INVENIO_RECORDS_PRESENTATION_SCRATCH_LOCATION = None
 """ Location of temporary files created by presentation tasks. Defaults to: /tmp/ """
 
+INVENIO_RECORDS_PRESENTATION_TRANSIENT_SCRATCH_LOCATION = None
+""" Memory-backed location (e.g. /dev/shm) for small intermediate files of presentation tasks.
+    Files created with a size hint up to ``TRANSIENT_FILE_SIZE`` or marked as transient go there
+    and are removed when the job finishes. None keeps all files in the scratch location.
+"""
+
+INVENIO_RECORDS_PRESENTATION_TRANSIENT_SCRATCH_LIMIT = 64 * 1024 * 1024
+""" Bytes of the transient location a single job may use, further files go to the scratch location """
+
+INVENIO_RECORDS_PRESENTATION_TRANSIENT_FILE_SIZE = 1024 * 1024
+""" Largest size hint (in bytes) of a file created in the transient location """
+
 INVENIO_RECORDS_PRESENTATION_PERMISSIONS = dict(
     # presentation_id: {
     #   tasks: [
@@ -46,3 +58,180 @@ INVENIO_RECORDS_PRESENTATION_PERMISSIONS = dict(
 """ Define a tasks to be called for a certain record presentation
     and permissions to be checked before the presentation tasks are executed in a pipeline.
 """
+
+INVENIO_RECORDS_PRESENTATION_PREWARM = []
+""" Presentation ids to be prepared in advance whenever a record is created or updated.
+    Outputs of these presentations are shared through the output cache by all requesters,
+    so they should not depend on the requesting user.
+"""
+
+INVENIO_RECORDS_PRESENTATION_PREWARM_DEBOUNCE = 60
+""" Seconds to wait for further updates of a record before its presentations are pre-warmed """
+
+INVENIO_RECORDS_PRESENTATION_PREWARM_TASK_OPTIONS = dict()
+""" Celery options of pre-warming workflows, e.g. dict(queue='presentation-prewarm', priority=9) """
+
+INVENIO_RECORDS_PRESENTATION_PREWARM_MAX_QUEUE_LENGTH = 1000
+""" Drop pre-warming work when there is more messages than this waiting in the pre-warming queue """
+
+INVENIO_RECORDS_PRESENTATION_OUTPUT_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+""" Seconds for which a job preparing a record revision presentation is kept in the output cache """
+
+INVENIO_RECORDS_PRESENTATION_CANCEL_IDLE = 30 * 60
+""" Seconds after which a job requested through the REST API is cancelled if nobody asked for its
+    status or output in the meantime. None never cancels jobs automatically.
+"""
+
+INVENIO_RECORDS_PRESENTATION_PREVIEWS = dict()
+""" Small previews (thumbnails, text snippets) rendered while the request waits instead of by a workflow,
+    e.g. dict(thumbnail=dict(renderer='my_site.previews:first_page_png', mimetype='image/png',
+    filename='thumbnail.png')). A renderer is called as ``renderer(metadata, files)`` with the record
+    metadata and a list of dicts (key, path, mimetype, size) of the record files, where path is None
+    for files not on a local storage. It returns the preview as bytes. Renderers run in separate
+    render processes without an application context. Permissions of a preview are configured
+    in ``INVENIO_RECORDS_PRESENTATION_PERMISSIONS`` under its id.
+"""
+
+INVENIO_RECORDS_PRESENTATION_PREVIEW_WORKERS = 2
+""" Number of render processes of previews started by each web worker process """
+
+INVENIO_RECORDS_PRESENTATION_PREVIEW_TIMEOUT = 10
+""" Seconds a preview may render before its render process interrupts it and the request gets 503 """
+
+INVENIO_RECORDS_PRESENTATION_PREVIEW_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+""" Seconds for which a rendered preview of a record revision is cached """
+
+INVENIO_RECORDS_PRESENTATION_PREVIEW_MAX_CACHED_SIZE = 512 * 1024
+""" Largest preview (in bytes) kept in the cache, larger ones are rendered on every cache miss of a client """
+
+INVENIO_RECORDS_PRESENTATION_PREVIEW_MAX_AGE = 60 * 60
+""" Seconds clients may reuse a preview requested without a record revision. Previews requested
+    with ``?revision=`` never change and are cached by clients for a year.
+"""
+
+INVENIO_RECORDS_PRESENTATION_COMPRESSION = {
+    'text/*': 'gzip',
+    'application/json': 'gzip',
+    'application/*+json': 'gzip',
+    'application/x-ndjson': 'gzip',
+    'application/xml': 'gzip',
+    'application/*+xml': 'gzip',
+}
+""" Content encodings ('gzip' or 'zstd') presentation outputs are stored with, by mimetype pattern.
+    Outputs are served compressed to clients accepting the encoding, other clients get them
+    decompressed on the fly. 'zstd' needs the zstandard package and falls back to 'gzip'.
+"""
+
+INVENIO_RECORDS_PRESENTATION_STORAGE = 'invenio_records_presentation.storage.ScratchArtifactStorage'
+""" Storage of final presentation artifacts. The default keeps them in the scratch directory,
+    which must then be shared by workers and web nodes. Other storages (DirectoryArtifactStorage,
+    FilesRestArtifactStorage, S3ArtifactStorage) let workers use node-local scratch.
+"""
+
+INVENIO_RECORDS_PRESENTATION_STORAGE_OPTIONS = dict()
+""" Keyword arguments of the artifact storage, e.g. dict(bucket='presentations') for S3 """
+
+INVENIO_RECORDS_PRESENTATION_RATE_LIMITS = dict(
+    user=None,
+    ip=None,
+)
+""" Token buckets limiting presentation jobs started by a single user or IP address,
+    as (tokens per second, burst) tuples, e.g. dict(user=(0.5, 20), ip=(0.2, 10)).
+"""
+
+INVENIO_RECORDS_PRESENTATION_MAX_IN_FLIGHT = dict()
+""" Maximal number of jobs of a presentation queued or running at once, by presentation id """
+
+INVENIO_RECORDS_PRESENTATION_ADMISSION_TTL = 60 * 60
+""" Seconds after which an admitted job stops counting as in flight even if it was never released,
+    e.g. because its worker was killed. Should exceed the queueing plus running time of any job.
+"""
+
+INVENIO_RECORDS_PRESENTATION_MAX_QUEUE_LENGTH = None
+""" Reject new presentation jobs when there is more messages than this in the Celery queue """
+
+INVENIO_RECORDS_PRESENTATION_RETRY_AFTER = 30
+""" Retry-After seconds sent with presentation jobs rejected because of overload """
+
+INVENIO_RECORDS_PRESENTATION_HEDGE = dict()
+""" Presentation id -> percentile (0..1) of its runtimes after which a speculative duplicate
+    of a still running job is started, e.g. dict(pdf=0.95). The first run to finish wins.
+"""
+
+INVENIO_RECORDS_PRESENTATION_HEDGE_SAMPLES = 200
+""" Number of recent job runtimes kept per presentation to estimate the hedging delay """
+
+INVENIO_RECORDS_PRESENTATION_HEDGE_MIN_SAMPLES = 20
+""" Do not hedge jobs of presentations with fewer runtime samples than this """
+
+INVENIO_RECORDS_PRESENTATION_HEDGE_TASK_OPTIONS = dict()
+""" Celery options of speculative duplicates; duplicates are only started when their queue is empty """
+
+INVENIO_RECORDS_PRESENTATION_RESOURCE_CLASSES = dict(
+    # raster=dict(memory=4096, cpu=2, max_jobs=2),
+)
+""" Resource classes presentation workflows may declare (``resource_class`` of the workflow
+    factory): megabytes of memory and CPU weight one job needs, optionally the maximal number
+    of jobs of the class running at once on a node
+"""
+
+INVENIO_RECORDS_PRESENTATION_NODE_RESOURCES = dict(memory=None, cpu=None)
+""" Memory (megabytes) and CPU weight of a worker node shared by all its worker processes.
+    Physical memory and CPU count of the node are used when not given.
+"""
+
+INVENIO_RECORDS_PRESENTATION_LOCK_DIR = None
+""" Node-local directory of the resource ledger. Defaults to a subdirectory of the system temporary
+    directory; it must not be shared by nodes, since entries of dead processes are found by their PIDs.
+"""
+
+INVENIO_RECORDS_PRESENTATION_RESOURCE_RETRY_DELAY = 10
+""" Seconds after which a job deferred for lack of node resources is retried """
+
+INVENIO_RECORDS_PRESENTATION_RESOURCE_MAX_RETRIES = 360
+""" Number of times a job is deferred for lack of node resources before it fails """
+
+INVENIO_RECORDS_PRESENTATION_USAGE_FLUSH_INTERVAL = 60
+""" Seconds between writes of worker usage accounted by a worker process to the database """
+
+INVENIO_RECORDS_PRESENTATION_QUOTA = dict()
+""" Daily limits of a user summed over all presentations, e.g.
+    dict(cpu_seconds=3600, wall_seconds=None, artifact_bytes=10 * 1024 ** 3); None means unlimited
+"""
+
+INVENIO_RECORDS_PRESENTATION_ROLE_QUOTAS = dict()
+""" Role name -> daily limits overriding the default quota for members of the role,
+    only more generous limits (or None for unlimited) take effect
+"""
+
+INVENIO_RECORDS_PRESENTATION_RELEASE_SESSION = True
+""" End the DB transaction before each presentation task, so that workers do not hold
+    DB connections idle in transaction while tasks process files. Workflows started
+    directly (``prepare(delayed=False)``) never end the transaction of their caller.
+"""
+
+INVENIO_RECORDS_PRESENTATION_STATUS_MAX_JOBS = 500
+""" Maximal number of jobs a single bulk status request may ask for """
+
+INVENIO_RECORDS_PRESENTATION_RESOLVED_OUTPUT_TTL = 10 * 60
+""" Seconds for which outputs of finished jobs resolved by ``/download/`` are remembered """
+
+INVENIO_RECORDS_PRESENTATION_RESOLVED_OUTPUT_MEMO_SIZE = 1024
+""" Maximal number of resolved outputs remembered by each web worker process """
+
+INVENIO_RECORDS_PRESENTATION_STREAM_POLL_INTERVAL = 0.5
+""" Seconds between checks for new data of outputs downloaded while they are being written """
+
+INVENIO_RECORDS_PRESENTATION_STREAM_IDLE_TIMEOUT = 10 * 60
+""" Seconds without new data after which a download of an output being written is aborted,
+    e.g. because the worker writing it was killed
+"""
+
+INVENIO_RECORDS_PRESENTATION_FETCH_WORKERS = 4
+""" Number of record files fetched into scratch at once """
+
+INVENIO_RECORDS_PRESENTATION_FETCH_LINK = 'reflink'
+""" How record files on a local storage are put into scratch instead of copying them:
+    'reflink' (copy-on-write clone where the filesystem supports it), 'hardlink' (only
+    safe when no task modifies fetched files) or None to always copy.
+"""
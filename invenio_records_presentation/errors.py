@@ -21,5 +21,32 @@ class WorkflowsNotAuthenticated(WorkflowsError):
 class WorkflowAccessOutsideScratch(WorkflowsError):
     """ Accessing a file outside the scratch directory """
 
+class PresentationFileChecksumError(WorkflowsError):
+    """ Record file fetched into scratch does not match its stored checksum """
+
+class PresentationJobCancelled(WorkflowsError):
+    """ Presentation job was cancelled by its requesters """
+
+class PresentationResourcesExhausted(WorkflowsError):
+    """ Presentation job could not get resources of a worker node in time """
+
 class PresentationNotFound(Exception):
     """ Presentation for a given name not found """
+
+class PresentationAdmissionError(Exception):
+    """ Presentation job rejected because of the current load """
+
+    def __init__(self, message, status=429, retry_after=None):
+        super(PresentationAdmissionError, self).__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+class PresentationStreamError(Exception):
+    """ Job producing a streamed output failed """
+
+class PresentationPreviewError(Exception):
+    """ Preview could not be rendered """
+
+    def __init__(self, message, status=500):
+        super(PresentationPreviewError, self).__init__(message)
+        self.status = status
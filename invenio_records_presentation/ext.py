@@ -9,14 +9,24 @@
 
 from __future__ import absolute_import, print_function
 
+import logging
+import os
 import tempfile
 from functools import lru_cache
+from typing import Optional
 
 from invenio_workflows import workflows
 from werkzeug.utils import cached_property
+from workflow.errors import WorkflowDefinitionError
 
 from invenio_records_presentation.api import Presentation
 from . import config
+from .errors import PresentationNotFound
+from .outbox import init_outbox
+from .utils import obj_or_import_string
+from .workflows import PresentationWorkflow
+
+logger = logging.getLogger(__name__)
 
 
 class _RecordsPresentationState(object):
@@ -24,11 +34,47 @@ class _RecordsPresentationState(object):
     def __init__(self, app):
         self.app = app
         self.presentations = {}
+        self.previews = {}
 
     @lru_cache(maxsize=1)
     def init_presentations(self):
+        """ Resolve and check all presentations and their workflows
+
+            Runs once per process, when the application starts or on first use of a
+            presentation, so that misconfigured presentations fail early and dispatching
+            a job needs no imports or reflection.
+
+            :raises WorkflowDefinitionError: if a presentation is misconfigured
+        """
+        previews = self.app.config['INVENIO_RECORDS_PRESENTATION_PREVIEWS']
+        for presid in self.app.config['INVENIO_RECORDS_PRESENTATION_PERMISSIONS']:
+            if presid not in self.presentation_types and presid not in previews:
+                logger.warning('Permissions are configured for presentation %s without a workflow', presid)
+
         for presid in self.presentation_types.keys():
-            self.presentations[presid] = self.get_presentation(presid)
+            workflow = workflows[presid]
+            if isinstance(workflow, PresentationWorkflow):
+                workflow.compile(presid)
+            try:
+                self.presentations[presid] = Presentation(name=presid, workflow=workflow,
+                                                          **self.presentation_types[presid])
+            except (ImportError, AttributeError, TypeError, ValueError) as e:
+                raise WorkflowDefinitionError('Invalid permissions of {} presentation: {}'.format(presid, e), presid)
+
+        for preview_id, preview in previews.items():
+            if not preview.get('renderer'):
+                raise WorkflowDefinitionError('Preview {} has no renderer'.format(preview_id), preview_id)
+            try:
+                renderer = obj_or_import_string(preview['renderer'])
+            except (ImportError, AttributeError, ValueError) as e:
+                raise WorkflowDefinitionError('Invalid renderer of {} preview: {}'.format(preview_id, e), preview_id)
+            if not callable(renderer):
+                raise WorkflowDefinitionError('Renderer of {} preview is not callable'.format(preview_id), preview_id)
+            try:
+                self.previews[preview_id] = self._create_preview(preview_id)
+            except (ImportError, AttributeError, TypeError, ValueError) as e:
+                raise WorkflowDefinitionError('Invalid permissions of {} preview: {}'.format(preview_id, e),
+                                              preview_id)
 
     @cached_property
     def presentation_types(self) -> dict:
@@ -47,8 +93,23 @@ class _RecordsPresentationState(object):
 
         return location
 
+    @cached_property
+    def transient_scratch_location(self) -> Optional[str]:
+        location = self.app.config.get('INVENIO_RECORDS_PRESENTATION_TRANSIENT_SCRATCH_LOCATION', None)
+        if location and not os.path.isdir(location):
+            logger.warning('Transient scratch location %s does not exist, not using it', location)
+            return None
+        return location or None
+
+    @cached_property
+    def storage(self):
+        """ Storage of final presentation artifacts """
+        storage_class = obj_or_import_string(self.app.config['INVENIO_RECORDS_PRESENTATION_STORAGE'])
+        return storage_class(**self.app.config['INVENIO_RECORDS_PRESENTATION_STORAGE_OPTIONS'])
+
     def get_presentation(self, presentation_id: str) -> Presentation:
         """ Create presentation instance from app config """
+        self.init_presentations()
         presentation = self.presentations.get(presentation_id, None)
 
         if not presentation:
@@ -62,6 +123,26 @@ class _RecordsPresentationState(object):
 
         return presentation
 
+    def get_preview(self, preview_id: str) -> Presentation:
+        """ Get presentation of a preview, see :mod:`.previews`
+
+            :raises PresentationNotFound: if there is no such preview
+        """
+        self.init_presentations()
+        preview = self.previews.get(preview_id, None)
+
+        if not preview:
+            if preview_id not in self.app.config['INVENIO_RECORDS_PRESENTATION_PREVIEWS']:
+                raise PresentationNotFound('Invalid preview type: {}'.format(preview_id))
+            preview = self._create_preview(preview_id)
+            self.previews[preview_id] = preview
+
+        return preview
+
+    def _create_preview(self, preview_id: str) -> Presentation:
+        permissions = self.app.config['INVENIO_RECORDS_PRESENTATION_PERMISSIONS'].get(preview_id, [])
+        return Presentation(name=preview_id, permissions=permissions)
+
 
 class InvenioRecordsPresentation(object):
     """Invenio Records Presentation extension."""
@@ -76,9 +157,31 @@ class InvenioRecordsPresentation(object):
         self.init_config(app)
         state = _RecordsPresentationState(app)
         app.extensions['invenio-records-presentation'] = self
+        self.init_signals(app)
+        init_outbox()
+        self.init_validation(app, state)
 
         return state
 
+    def init_validation(self, app, state):
+        """Check all presentations when the application starts.
+
+        When workflows are registered by an extension initialized after this one,
+        presentations are checked on their first use instead.
+        """
+        if 'invenio-workflows' in app.extensions:
+            with app.app_context():
+                state.init_presentations()
+
+    def init_signals(self, app):
+        """Connect presentation pre-warming to record signals."""
+        if app.config['INVENIO_RECORDS_PRESENTATION_PREWARM']:
+            from invenio_records.signals import after_record_insert, after_record_update
+            from .receivers import prewarm_record_presentations
+
+            after_record_insert.connect(prewarm_record_presentations, sender=app, weak=False)
+            after_record_update.connect(prewarm_record_presentations, sender=app, weak=False)
+
     def init_config(self, app):
         """Initialize configuration.
 
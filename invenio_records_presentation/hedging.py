@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+""" Hedged (speculative) re-execution of straggling presentation jobs.
+
+    Runtimes of every presentation are sampled into the cache. Once a job runs longer
+    than the configured percentile of its presentation runtimes, a duplicate of the job
+    is started by another task. Both runs claim the job result when they finish and the
+    first claim wins, so clients keep using the job id returned by ``/prepare/``. The
+    claim also cancels the losing run: it stops before its next workflow task, see
+    :func:`.cancellation.check_cancelled`, and removes its scratch directory.
+"""
+import logging
+import os
+import shutil
+from typing import Optional
+
+from flask import current_app
+from invenio_cache import current_cache
+
+from .utils import transient_scratch_dir
+
+logger = logging.getLogger(__name__)
+
+HEDGING_PREFIX = 'invenio_presentation:hedging:'
+
+RESULT_TIMEOUT = 24 * 60 * 60
+""" Seconds for which the winner of a hedged job is remembered """
+
+
+def _runtimes_key(presentation_id: str) -> str:
+    return '{}runtimes:{}'.format(HEDGING_PREFIX, presentation_id)
+
+
+def _winner_key(job_id: str) -> str:
+    return '{}winner:{}'.format(HEDGING_PREFIX, job_id)
+
+
+def record_runtime(presentation_id: str, runtime: float):
+    """ Add a runtime sample of a presentation (updates from concurrent jobs may be lost) """
+    samples = current_app.config['INVENIO_RECORDS_PRESENTATION_HEDGE_SAMPLES']
+    runtimes = (current_cache.get(_runtimes_key(presentation_id)) or [])[-(samples - 1):]
+    runtimes.append(runtime)
+    current_cache.set(_runtimes_key(presentation_id), runtimes, timeout=0)
+
+
+def hedge_delay(presentation_id: str) -> Optional[float]:
+    """ Get seconds after which a job of a presentation should be hedged
+
+        :returns: None if the presentation is not hedged or has too few runtime samples yet
+    """
+    percentile = current_app.config['INVENIO_RECORDS_PRESENTATION_HEDGE'].get(presentation_id, None)
+    if percentile is None:
+        return None
+
+    runtimes = sorted(current_cache.get(_runtimes_key(presentation_id)) or [])
+    if len(runtimes) < current_app.config['INVENIO_RECORDS_PRESENTATION_HEDGE_MIN_SAMPLES']:
+        return None
+    return runtimes[min(len(runtimes) - 1, int(percentile * len(runtimes)))]
+
+
+def claimed_result(job_id: str) -> Optional[str]:
+    """ Get UUID of the engine of the run of a hedged job which claimed its result, if any """
+    return current_cache.get(_winner_key(job_id))
+
+
+def is_decided(job_id: str) -> bool:
+    """ Has a run of a hedged job already claimed its result? """
+    return claimed_result(job_id) is not None
+
+
+def claim_result(job_id: str, eng_uuid: str) -> str:
+    """ Claim result of a hedged job for a finished run
+
+        :returns: UUID of the engine whose result the job has, i.e. ``eng_uuid`` if this run won
+    """
+    key = _winner_key(job_id)
+    if current_cache.add(key, eng_uuid, timeout=RESULT_TIMEOUT):
+        return eng_uuid
+    return current_cache.get(key) or eng_uuid
+
+
+def remove_scratch(object_id: int):
+    """ Remove scratch directory of a job run whose output is not needed, e.g. a losing run of a hedged job """
+    from .api import PresentationWorkflowObject
+
+    obj = PresentationWorkflowObject.get(object_id)
+    scratch_dir = obj.extra_data.get('_scratch', None)
+    if scratch_dir and os.path.isdir(scratch_dir):
+        logger.info('Removing scratch %s of an unneeded job run', scratch_dir)
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    if scratch_dir and transient_scratch_dir(scratch_dir):
+        shutil.rmtree(transient_scratch_dir(scratch_dir), ignore_errors=True)
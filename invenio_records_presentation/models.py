@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+""" Database models of Invenio Records Presentation."""
+from invenio_db import db
+
+ANONYMOUS_USER_ID = 0
+""" User ID of usage of anonymous and system jobs, not NULL so that the unique constraint covers it """
+
+
+class PresentationUsage(db.Model):
+    """ Daily usage of presentation workers by a user and presentation """
+
+    __tablename__ = 'records_presentation_usage'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'presentation_id', 'day',
+                            name='uq_records_presentation_usage_user_presentation_day'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    user_id = db.Column(db.Integer, nullable=False, default=ANONYMOUS_USER_ID, index=True)
+    """ ID of the requesting user, :data:`ANONYMOUS_USER_ID` for anonymous and system jobs """
+
+    presentation_id = db.Column(db.String(255), nullable=False)
+
+    day = db.Column(db.Date, nullable=False, index=True)
+    """ UTC day the jobs finished """
+
+    jobs = db.Column(db.Integer, nullable=False, default=0)
+
+    cpu_seconds = db.Column(db.Float, nullable=False, default=0.0)
+
+    wall_seconds = db.Column(db.Float, nullable=False, default=0.0)
+
+    artifact_bytes = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+__all__ = ('PresentationUsage', )
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+""" Transactional dispatching of presentation jobs.
+
+    Jobs are collected in the DB session and sent to Celery only after the session
+    commits, so a worker never gets a job whose workflow object is not visible yet,
+    and no job is sent for a transaction that was rolled back. Jobs queued in a
+    savepoint which is rolled back are discarded, the rest of the transaction is not.
+"""
+import logging
+import uuid
+
+from invenio_db import db
+from sqlalchemy import event
+
+from .admission import release_job
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_KEY = 'invenio_records_presentation_outbox'
+COMMITTED_KEY = 'invenio_records_presentation_outbox_committed'
+
+
+def _boundary(transaction):
+    """ Get the savepoint or top-level transaction a (sub)transaction commits or rolls back with """
+    while transaction.parent is not None and not transaction.nested:
+        transaction = transaction.parent
+    return transaction
+
+
+def _within(transaction, ancestor) -> bool:
+    while transaction is not None:
+        if transaction is ancestor:
+            return True
+        transaction = transaction.parent
+    return False
+
+
+def enqueue_on_commit(task, args=(), kwargs=None, task_options=None):
+    """ Send a Celery task once the current DB transaction commits
+
+        :returns: AsyncResult of the task to be sent
+    """
+    task_options = dict(task_options or {})
+    task_id = task_options.setdefault('task_id', str(uuid.uuid4()))
+    session = db.session()
+    session.info.setdefault(OUTBOX_KEY, []).append(
+        [_boundary(session.transaction), task, args, kwargs or {}, task_options])
+    return task.AsyncResult(task_id)
+
+
+def _release(entries):
+    for _, _, _, _, task_options in entries:
+        release_job(task_options['task_id'])
+
+
+def _dispatch(entries):
+    # eager tasks must not run in the session which has just finished its transaction
+    registry = db.session.registry
+    session = registry()
+    registry.clear()
+    try:
+        for _, task, args, kwargs, task_options in entries:
+            try:
+                task.apply_async(args=args, kwargs=kwargs, **task_options)
+            except Exception:
+                logger.exception('Could not dispatch presentation job {}'.format(task_options['task_id']))
+                release_job(task_options['task_id'])
+    finally:
+        db.session.remove()
+        registry.set(session)
+
+
+def on_commit(session):
+    transaction = session.transaction
+    if transaction.nested:
+        # jobs of a released savepoint now belong to the enclosing transaction
+        parent = _boundary(transaction.parent)
+        for entry in session.info.get(OUTBOX_KEY, []):
+            if entry[0] is transaction:
+                entry[0] = parent
+    elif transaction.parent is None:
+        session.info[COMMITTED_KEY] = transaction
+
+
+def on_soft_rollback(session, previous_transaction):
+    boundary = _boundary(previous_transaction)
+    entries = session.info.get(OUTBOX_KEY, [])
+    discarded = [entry for entry in entries if _within(entry[0], boundary)]
+    if discarded:
+        session.info[OUTBOX_KEY] = [entry for entry in entries if not _within(entry[0], boundary)]
+        _release(discarded)
+
+
+def on_transaction_end(session, transaction):
+    if transaction.parent is not None:
+        return
+    committed = session.info.pop(COMMITTED_KEY, None) is transaction
+    entries = session.info.pop(OUTBOX_KEY, [])
+    if not entries:
+        return
+    if committed:
+        _dispatch(entries)
+    else:  # rolled back, or the session was closed without committing
+        _release(entries)
+
+
+def init_outbox():
+    """ Hook the outbox to DB session transactions """
+    if not event.contains(db.session, 'after_transaction_end', on_transaction_end):
+        event.listen(db.session, 'after_commit', on_commit)
+        event.listen(db.session, 'after_soft_rollback', on_soft_rollback)
+        event.listen(db.session, 'after_transaction_end', on_transaction_end)
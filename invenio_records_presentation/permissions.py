@@ -10,7 +10,6 @@ from functools import wraps
 
 from flask_login import current_user
 from invenio_access import Permission, action_factory
-from invenio_workflows import WorkflowEngine
 
 from invenio_records_presentation.errors import WorkflowsPermissionError, WorkflowsNotAuthenticated
 
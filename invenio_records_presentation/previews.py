@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+""" Preview presentations rendered synchronously by a pool of warm render processes.
+
+    Previews (thumbnails, text snippets...) are too small to be worth a workflow job, so they
+    are rendered while the request waits. Each web worker process starts a pool of render
+    processes which import all renderers (and their libraries) once and are reused for all
+    previews. Rendered previews are cached by record revision, which also gives their ETag.
+
+    A render process interrupts a render running longer than ``INVENIO_RECORDS_PRESENTATION_PREVIEW_TIMEOUT``
+    itself, so the pool never has to be restarted because of a slow renderer. Requests do not queue
+    behind each other: when all render processes are busy, the request is answered with 503.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from flask import current_app
+from invenio_cache import current_cache
+
+from .errors import PresentationPreviewError
+from .utils import obj_or_import_string, release_session
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_CACHE_PREFIX = 'invenio_presentation:preview:'
+
+_renderers = {}
+""" Renderers imported by a render process """
+
+_pool = None
+_pool_slots = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+TIMEOUT_GRACE = 1
+""" Seconds a request waits for a render process after its renderer should have been interrupted """
+
+
+class RenderTimeout(Exception):
+    """ Renderer ran longer than the preview timeout """
+
+
+def _interrupt_render(signum, frame):
+    raise RenderTimeout()
+
+
+def _warm_up(renderers: dict):
+    """ Import all renderers when a render process starts """
+    for preview_id, renderer in renderers.items():
+        _renderers[preview_id] = obj_or_import_string(renderer)
+
+
+def _ping():
+    return os.getpid()
+
+
+def _render(preview_id: str, metadata: dict, files: list, timeout: float) -> bytes:
+    # runs in the main thread of a render process, so the alarm interrupts only this render
+    signal.signal(signal.SIGALRM, _interrupt_render)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return _renderers[preview_id](metadata, files)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def render_pool() -> Tuple[ProcessPoolExecutor, threading.BoundedSemaphore]:
+    """ Get the render pool of this process, starting its render processes on first use
+
+        :returns: the pool and a semaphore with a slot for each of its render processes
+    """
+    global _pool, _pool_slots, _pool_pid
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():  # not inherited from a forking parent
+            workers = current_app.config['INVENIO_RECORDS_PRESENTATION_PREVIEW_WORKERS']
+            renderers = {preview_id: conf['renderer']
+                         for preview_id, conf in current_app.config['INVENIO_RECORDS_PRESENTATION_PREVIEWS'].items()}
+            # spawned, so that render processes do not inherit DB connections of the web worker
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_warm_up, initargs=(renderers,))
+            _pool_slots = threading.BoundedSemaphore(workers)
+            _pool_pid = os.getpid()
+            for _ in range(workers):
+                _pool.submit(_ping)
+        return _pool, _pool_slots
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """ Stop using a broken render pool and terminate its remaining render processes """
+    global _pool
+
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    for process in list((getattr(pool, '_processes', None) or {}).values()):
+        if process.is_alive():
+            process.terminate()
+    pool.shutdown(wait=False)
+
+
+def preview_etag(preview_id: str, record_uuid: str, revision: int) -> str:
+    """ Entity tag of a preview of a record revision """
+    renderer = current_app.config['INVENIO_RECORDS_PRESENTATION_PREVIEWS'][preview_id]['renderer']
+    key = '{}:{}:{}:{}'.format(preview_id, getattr(renderer, '__qualname__', renderer), record_uuid, revision)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def preview_input(record_uuid: str) -> Tuple[dict, list]:
+    """ Get metadata and files of a record passed to a renderer """
+    from invenio_records.models import RecordMetadata
+
+    from .api import PresentationWorkflowObject
+
+    metadata = RecordMetadata.query.with_entities(RecordMetadata.json).filter_by(id=record_uuid).scalar() or {}
+
+    obj = PresentationWorkflowObject.create_job()  # never stored, only lists the record files
+    obj.extra_data['_record'] = record_uuid
+    files = []
+    for object_version in obj.iter_files():
+        uri = object_version.file.uri
+        files.append({
+            'key': object_version.key,
+            'path': uri if uri and os.path.isfile(uri) else None,
+            'mimetype': object_version.mimetype,
+            'size': object_version.file.size,
+        })
+    return metadata, files
+
+
+def render_preview(preview_id: str, record_uuid: str, revision: int) -> bytes:
+    """ Get a preview of a record revision, rendering it in the render pool if it is not cached
+
+        :raises PresentationPreviewError: if the preview could not be rendered in time,
+            or all render processes are busy
+    """
+    key = '{}{}:{}:{}'.format(PREVIEW_CACHE_PREFIX, preview_id, record_uuid, revision)
+    data: Optional[bytes] = current_cache.get(key)
+    if data is not None:
+        return data
+
+    metadata, files = preview_input(record_uuid)
+    release_session()  # do not hold a DB connection while the preview renders
+
+    pool, slots = render_pool()
+    if not slots.acquire(blocking=False):
+        raise PresentationPreviewError('All preview render processes are busy', status=503)
+    timeout = current_app.config['INVENIO_RECORDS_PRESENTATION_PREVIEW_TIMEOUT']
+    future = None
+    try:
+        future = pool.submit(_render, preview_id, metadata, files, timeout)
+        # the slot is free once the render process is, even if this request gave up waiting for it
+        future.add_done_callback(lambda f: slots.release())
+        data = future.result(timeout=timeout + TIMEOUT_GRACE)
+    except (RenderTimeout, FutureTimeoutError):
+        logger.warning('Preview %s of %s timed out', preview_id, record_uuid)
+        raise PresentationPreviewError('Preview {} of {} is taking too long'.format(preview_id, record_uuid),
+                                       status=503)
+    except BrokenProcessPool:
+        logger.exception('Preview render process died, restarting the render pool')
+        _discard_pool(pool)
+        raise PresentationPreviewError('Preview {} of {} could not be rendered'.format(preview_id, record_uuid),
+                                       status=503)
+    except Exception:
+        logger.exception('Rendering preview %s of %s failed', preview_id, record_uuid)
+        raise PresentationPreviewError('Preview {} of {} could not be rendered'.format(preview_id, record_uuid))
+    finally:
+        if future is None:
+            slots.release()
+
+    if len(data) <= current_app.config['INVENIO_RECORDS_PRESENTATION_PREVIEW_MAX_CACHED_SIZE']:
+        current_cache.set(key, data, timeout=current_app.config['INVENIO_RECORDS_PRESENTATION_PREVIEW_CACHE_TIMEOUT'])
+    return data
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+""" Signal receivers for Invenio Records Presentation."""
+from flask import current_app
+
+
+def prewarm_record_presentations(sender, record=None, **kwargs):
+    """ Schedule pre-warming of configured presentations of a created or updated record """
+    from .tasks import schedule_prewarm
+
+    if record is None or record.id is None:
+        return
+
+    for presentation_id in current_app.config['INVENIO_RECORDS_PRESENTATION_PREWARM']:
+        schedule_prewarm(presentation_id, str(record.id))
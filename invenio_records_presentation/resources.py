@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+""" Resource classes of presentations and their enforcement on worker nodes.
+
+    A presentation workflow may declare a resource class (memory and CPU weight of one
+    job, see ``INVENIO_RECORDS_PRESENTATION_RESOURCE_CLASSES``). All worker processes of
+    a node share a ledger of running jobs in a lock-protected file, so the jobs never
+    reserve more than the node capacity. Entries of crashed processes are dropped.
+    Jobs that do not fit are deferred back to the queue instead of being started.
+"""
+import fcntl
+import json
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Optional
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+RESOURCES = ('memory', 'cpu')
+
+
+def node_capacity() -> dict:
+    """ Get resources of this node usable by presentation jobs """
+    capacity = dict(current_app.config['INVENIO_RECORDS_PRESENTATION_NODE_RESOURCES'])
+    if capacity.get('memory') is None:
+        capacity['memory'] = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+    if capacity.get('cpu') is None:
+        capacity['cpu'] = os.cpu_count() or 1
+    return capacity
+
+
+def resource_class(presentation_id: str) -> Optional[dict]:
+    """ Get resource class of a presentation, None if it has none """
+    from invenio_workflows import workflows
+
+    name = getattr(workflows.get(presentation_id, None), 'resource_class', None)
+    if not name:
+        return None
+    return dict(current_app.config['INVENIO_RECORDS_PRESENTATION_RESOURCE_CLASSES'][name], name=name)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextmanager
+def locked_ledger():
+    """ Lock the ledger of jobs running on this node and yield it for modification """
+    # node-local, entries are checked against PIDs of this node
+    lock_dir = current_app.config['INVENIO_RECORDS_PRESENTATION_LOCK_DIR'] or os.path.join(
+        tempfile.gettempdir(), 'invenio_presentation_locks')
+    os.makedirs(lock_dir, exist_ok=True)
+    path = os.path.join(lock_dir, 'resources.json')
+
+    with open(os.path.join(lock_dir, 'resources.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(path) as f:
+                ledger = json.load(f)
+        except (OSError, ValueError):
+            ledger = {}
+        ledger = {job_id: entry for job_id, entry in ledger.items() if _alive(entry['pid'])}
+
+        yield ledger
+
+        with open(path + '.tmp', 'w') as f:
+            json.dump(ledger, f)
+        os.replace(path + '.tmp', path)
+
+
+def acquire_resources(job_id: str, presentation_id: str) -> bool:
+    """ Reserve node resources for a job of a presentation
+
+        A single job is always admitted to an idle node, even if it needs more than the
+        node capacity, so that it does not wait forever.
+
+        :returns: False if the job does not fit on the node now and should be deferred
+    """
+    needs = resource_class(presentation_id)
+    if needs is None:
+        return True
+
+    capacity = node_capacity()
+    with locked_ledger() as ledger:
+        if ledger:
+            for resource in RESOURCES:
+                used = sum(entry.get(resource, 0) for entry in ledger.values())
+                if used + needs.get(resource, 0) > capacity[resource]:
+                    return False
+            same_class = sum(1 for entry in ledger.values() if entry['class'] == needs['name'])
+            if needs.get('max_jobs') is not None and same_class >= needs['max_jobs']:
+                return False
+
+        ledger[job_id] = {'pid': os.getpid(), 'class': needs['name'],
+                          'memory': needs.get('memory', 0), 'cpu': needs.get('cpu', 0)}
+    return True
+
+
+def release_resources(job_id: str, presentation_id: str):
+    """ Return node resources reserved by a job """
+    if resource_class(presentation_id) is None:
+        return
+    try:
+        with locked_ledger() as ledger:
+            ledger.pop(job_id, None)
+    except OSError:
+        logger.exception('Could not release resources of presentation job {}'.format(job_id))
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+""" Batched status lookups of presentation jobs.
+
+    States of all jobs are fetched with a single multi-get from the Celery result backend
+    (when it is a key-value store) and the last objects of their workflow engines with a
+    single query, instead of an ``AsyncResult`` and a ``WorkflowEngine`` per job.
+"""
+from datetime import datetime, timezone
+from typing import Optional
+from uuid import UUID
+
+from celery import current_app as current_celery_app
+from celery import states
+from celery.backends.base import KeyValueStoreBackend
+from celery.utils.iso8601 import parse_iso8601
+from invenio_db import db
+from invenio_workflows.models import WorkflowObjectModel
+from sqlalchemy import func
+
+
+def _as_utc(value) -> Optional[datetime]:
+    """ Convert a timestamp to a naive UTC datetime, the form used by Celery and Invenio models """
+    if value is None:
+        return None
+    if not isinstance(value, datetime):
+        value = parse_iso8601(str(value))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[datetime]:
+    """ Parse a cursor returned by a previous status call
+
+        :raises ValueError: if the cursor is invalid
+    """
+    return _as_utc(cursor) if cursor else None
+
+
+def fetch_job_metas(job_ids: list) -> dict:
+    """ Get result backend metadata of jobs, using a single multi-get if possible """
+    backend = current_celery_app.backend
+    if not isinstance(backend, KeyValueStoreBackend):
+        return {job_id: backend.get_task_meta(job_id) for job_id in job_ids}
+
+    values = backend.mget([backend.get_key_for_task(job_id) for job_id in job_ids])
+    if isinstance(values, dict):
+        values = [values.get(backend.get_key_for_task(job_id)) for job_id in job_ids]
+
+    metas = {}
+    for job_id, value in zip(job_ids, values):
+        if value:
+            metas[job_id] = backend.decode_result(value)
+        else:
+            metas[job_id] = {'status': states.PENDING, 'result': None, 'date_done': None}
+    return metas
+
+
+def fetch_last_objects(eng_uuids: list) -> dict:
+    """ Get the last workflow object of each engine with a single query """
+    if not eng_uuids:
+        return {}
+    last_ids = db.session.query(func.max(WorkflowObjectModel.id)) \
+        .filter(WorkflowObjectModel.id_workflow.in_(eng_uuids)) \
+        .group_by(WorkflowObjectModel.id_workflow)
+    objects = WorkflowObjectModel.query.filter(WorkflowObjectModel.id.in_(last_ids.subquery()))
+    return {str(obj.id_workflow): obj for obj in objects}
+
+
+def _engine_uuid(result) -> Optional[str]:
+    try:
+        return str(UUID(result, version=4))
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def job_statuses(job_ids: list, since: Optional[datetime] = None) -> dict:
+    """ Get states of many presentation jobs at once
+
+        :param job_ids: Celery task ids of the jobs
+        :param since: report only jobs that changed after this naive UTC time
+        :returns: dict of job id -> ``{'status': ..., 'info': ...}`` like ``/status/<job_uuid>/``
+    """
+    metas = fetch_job_metas(job_ids)
+    eng_uuids = {job_id: _engine_uuid(meta.get('result'))
+                 for job_id, meta in metas.items() if meta['status'] == states.SUCCESS}
+    objects = fetch_last_objects([eng_uuid for eng_uuid in eng_uuids.values() if eng_uuid])
+
+    statuses = {}
+    for job_id, meta in metas.items():
+        obj = objects.get(eng_uuids.get(job_id))
+        changed = max(filter(None, (_as_utc(meta.get('date_done')), obj.modified if obj else None)),
+                      default=None)
+        if since is not None and (changed is None or changed <= since):
+            continue
+
+        if obj is not None:
+            info = {'current_data': obj.data,
+                    'created': obj.created,
+                    'modified': obj.modified}
+        else:
+            info = str(meta.get('result'))
+        statuses[job_id] = {'status': meta['status'], 'info': info}
+    return statuses
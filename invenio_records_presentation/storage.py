@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+""" Storage backends for final presentation artifacts.
+
+    Presentation tasks work in a (preferably node-local) scratch directory. Only the final
+    output of a job is handed to the configured artifact storage, which must be reachable
+    from all web nodes serving ``/download/``.
+"""
+import os
+import shutil
+from typing import Optional
+
+from .utils import session_owned
+
+
+class ArtifactStorage(object):
+    """ Base class of presentation artifact storages """
+
+    local = False
+    """ Are artifacts kept in the job scratch directory? """
+
+    def __init__(self, **options):
+        self.options = options
+
+    def store(self, path: str, key: str, mimetype: str, encoding: Optional[str] = None) -> str:
+        """ Store a local file as an artifact
+
+            :param path: path of the file in the job scratch directory
+            :param key: content-addressed name of the artifact; artifacts with the same key have
+                the same contents, so a storage may keep a single copy of them
+            :param mimetype: mimetype of the artifact contents
+            :param encoding: content encoding of the artifact, if compressed
+            :returns: URI of the stored artifact
+        """
+        raise NotImplementedError()
+
+    def open(self, uri: str):
+        """ Open a stored artifact as a binary file-like object """
+        raise NotImplementedError()
+
+    def url(self, uri: str, mimetype: str, content_disposition: str) -> Optional[str]:
+        """ Get URL clients may download an artifact from directly, if the storage supports it """
+        return None
+
+    def remove(self, uri: str):
+        """ Remove a stored artifact, which may be shared by all jobs with identical output """
+        raise NotImplementedError()
+
+
+class ScratchArtifactStorage(ArtifactStorage):
+    """ Artifacts are kept in the job scratch directory, which must be shared with web nodes """
+
+    local = True
+
+    def store(self, path, key, mimetype, encoding=None):
+        return path
+
+    def open(self, uri):
+        return open(uri, 'rb')
+
+    def remove(self, uri):
+        if os.path.exists(uri):
+            os.remove(uri)
+
+
+class DirectoryArtifactStorage(ArtifactStorage):
+    """ Artifacts are copied into a directory, e.g. a shared filesystem mount
+
+        :param root: directory the artifacts are stored in
+    """
+
+    def __init__(self, root, **options):
+        super(DirectoryArtifactStorage, self).__init__(**options)
+        self.root = root
+
+    def _path(self, uri):
+        path = os.path.realpath(os.path.join(self.root, uri))
+        if not path.startswith(os.path.realpath(self.root) + os.sep):
+            raise ValueError('Artifact {} is outside of storage root'.format(uri))
+        return path
+
+    def store(self, path, key, mimetype, encoding=None):
+        target = self._path(key)
+        if os.path.exists(target):
+            return key
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_target = '{}.{}.tmp'.format(target, os.getpid())
+        shutil.copyfile(path, tmp_target)
+        os.replace(tmp_target, target)
+        return key
+
+    def open(self, uri):
+        return open(self._path(uri), 'rb')
+
+    def remove(self, uri):
+        path = self._path(uri)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class FilesRestArtifactStorage(ArtifactStorage):
+    """ Artifacts are stored as file instances in an invenio-files-rest location
+
+        :param location: name of the location, the default location is used if not given
+    """
+
+    def __init__(self, location=None, **options):
+        super(FilesRestArtifactStorage, self).__init__(**options)
+        self.location = location
+
+    def store(self, path, key, mimetype, encoding=None):
+        from invenio_db import db
+        from invenio_files_rest.models import FileInstance, Location
+
+        location = Location.get_by_name(self.location) if self.location else Location.get_default()
+        with db.session.begin_nested():
+            file_instance = FileInstance.create()
+            with open(path, 'rb') as f:
+                file_instance.set_contents(f, default_location=location.uri)
+        if session_owned():  # otherwise the caller commits its own transaction
+            db.session.commit()
+        return str(file_instance.id)
+
+    def open(self, uri):
+        from invenio_files_rest.models import FileInstance
+
+        return FileInstance.get(uri).storage().open()
+
+    def remove(self, uri):
+        from invenio_db import db
+        from invenio_files_rest.models import FileInstance
+
+        file_instance = FileInstance.get(uri)
+        if file_instance:
+            file_instance.storage().delete()
+            db.session.delete(file_instance)
+            db.session.commit()
+
+
+class S3ArtifactStorage(ArtifactStorage):
+    """ Artifacts are uploaded to an S3-compatible object store (needs boto3)
+
+        :param bucket: name of the bucket the artifacts are stored in
+        :param prefix: key prefix of the artifacts
+        :param presigned: redirect downloads to presigned URLs instead of streaming them
+        :param expires: lifetime of presigned URLs in seconds
+        :param client_options: options of ``boto3.client('s3')``, e.g. endpoint_url
+    """
+
+    def __init__(self, bucket, prefix='', presigned=True, expires=300, client_options=None,
+                 **options):
+        super(S3ArtifactStorage, self).__init__(**options)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.presigned = presigned
+        self.expires = expires
+        self.client_options = client_options or {}
+
+    @property
+    def client(self):
+        if not hasattr(self, '_client'):
+            import boto3
+
+            self._client = boto3.client('s3', **self.client_options)
+        return self._client
+
+    def store(self, path, key, mimetype, encoding=None):
+        extra_args = {'ContentType': mimetype}
+        if encoding:
+            extra_args['ContentEncoding'] = encoding
+        uri = self.prefix + key
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=uri)
+            return uri
+        except self.client.exceptions.ClientError:
+            pass
+        self.client.upload_file(path, self.bucket, uri, ExtraArgs=extra_args)
+        return uri
+
+    def open(self, uri):
+        return self.client.get_object(Bucket=self.bucket, Key=uri)['Body']
+
+    def url(self, uri, mimetype, content_disposition):
+        if not self.presigned:
+            return None
+        return self.client.generate_presigned_url('get_object', ExpiresIn=self.expires, Params={
+            'Bucket': self.bucket,
+            'Key': uri,
+            'ResponseContentType': mimetype,
+            'ResponseContentDisposition': content_disposition,
+        })
+
+    def remove(self, uri):
+        self.client.delete_object(Bucket=self.bucket, Key=uri)
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+""" Celery tasks for Invenio Records Presentation."""
+import logging
+import shutil
+import time
+import uuid
+
+from celery import current_app as current_celery_app
+from celery import shared_task, states
+from celery.exceptions import Ignore
+from celery.signals import task_revoked, worker_process_shutdown
+from flask import current_app
+from invenio_cache import current_cache
+from invenio_db import db
+
+from .accounting import account_job, cpu_time, flush_usage
+from .admission import release_job
+from .cancellation import is_cancelled
+from .errors import PresentationResourcesExhausted
+from .hedging import claim_result, claimed_result, hedge_delay, is_decided, record_runtime, remove_scratch
+from .proxies import current_records_presentation
+from .resources import acquire_resources, release_resources
+from .utils import job_owns_session, pool_metrics, queue_length, transient_scratch_dir
+
+logger = logging.getLogger(__name__)
+
+PREWARM_DEBOUNCE_PREFIX = 'invenio_presentation:prewarm:'
+
+PREWARM_SATURATED_KEY = 'invenio_presentation:prewarm_saturated'
+
+SATURATION_CHECK_INTERVAL = 5
+""" Seconds for which record signals reuse the last known saturation of the pre-warming queue """
+
+
+def prewarm_saturated(cached=False) -> bool:
+    """ Is the queue of pre-warming workflows too long to accept more work?
+
+        :param cached: reuse the answer of a recent check instead of asking the broker
+    """
+    if cached:
+        saturated = current_cache.get(PREWARM_SATURATED_KEY)
+        if saturated is not None:
+            return saturated
+
+    queue = current_app.config['INVENIO_RECORDS_PRESENTATION_PREWARM_TASK_OPTIONS'].get('queue', None)
+    saturated = queue_length(queue) >= current_app.config['INVENIO_RECORDS_PRESENTATION_PREWARM_MAX_QUEUE_LENGTH']
+    current_cache.set(PREWARM_SATURATED_KEY, saturated, timeout=SATURATION_CHECK_INTERVAL)
+    return saturated
+
+
+def schedule_prewarm(presentation_id: str, record_uuid: str):
+    """ Pre-warm presentation of a record once it stops being updated
+
+        Every call supersedes the previously scheduled pre-warming of the same record,
+        so only the last of many updates in the debounce window gets rendered.
+    """
+    if prewarm_saturated(cached=True):  # called in record signals, so avoid a broker round-trip each time
+        logger.warning('Presentation queue saturated, not pre-warming {} of {}'
+                       .format(presentation_id, record_uuid))
+        return
+
+    debounce = current_app.config['INVENIO_RECORDS_PRESENTATION_PREWARM_DEBOUNCE']
+    token = uuid.uuid4().hex
+    current_cache.set('{}{}:{}'.format(PREWARM_DEBOUNCE_PREFIX, presentation_id, record_uuid),
+                      token, timeout=debounce * 2 + 60)
+    prewarm_presentation.apply_async(args=(presentation_id, record_uuid, token), countdown=debounce)
+
+
+@shared_task(ignore_result=True)
+def prewarm_presentation(presentation_id: str, record_uuid: str, token: str):
+    """ Enqueue pre-warming workflow of a record presentation unless it was superseded """
+    key = '{}{}:{}'.format(PREWARM_DEBOUNCE_PREFIX, presentation_id, record_uuid)
+    if current_cache.get(key) != token:
+        return
+    current_cache.delete(key)
+
+    if prewarm_saturated():
+        logger.warning('Presentation queue saturated, not pre-warming {} of {}'
+                       .format(presentation_id, record_uuid))
+        return
+
+    presentation = current_records_presentation.get_presentation(presentation_id)
+    presentation.prewarm(record_uuid,
+                         task_options=current_app.config['INVENIO_RECORDS_PRESENTATION_PREWARM_TASK_OPTIONS'])
+    db.session.commit()
+
+
+def remove_transient_scratch(object_id: int):
+    """ Remove the transient tier of a job scratch, also when its workflow failed """
+    from .api import PresentationWorkflowObject
+
+    try:
+        scratch_dir = PresentationWorkflowObject.get(object_id).extra_data.get('_scratch', None)
+        transient_dir = transient_scratch_dir(scratch_dir) if scratch_dir else None
+    except Exception:
+        logger.exception('Could not find transient scratch of presentation job object %s', object_id)
+        return
+    if transient_dir:
+        shutil.rmtree(transient_dir, ignore_errors=True)
+
+
+@shared_task(bind=True, ignore_result=False)
+def run_presentation(self, workflow_name: str, object_id: int, **kwargs):
+    """ Run a presentation workflow
+
+        :returns: UUID of the workflow engine that ran the workflow
+        :raises PresentationResourcesExhausted: if the job was deferred too many times for lack of resources
+    """
+    from invenio_workflows.tasks import start
+
+    job_id = self.request.id
+    resources_key = job_id or str(object_id)
+    if not acquire_resources(resources_key, workflow_name):
+        max_retries = current_app.config['INVENIO_RECORDS_PRESENTATION_RESOURCE_MAX_RETRIES']
+        if self.request.retries >= max_retries:
+            release_job(job_id)
+            raise PresentationResourcesExhausted('Presentation job {} did not get node resources in {} attempts'
+                                                 .format(job_id, max_retries + 1))
+        logger.info('Deferring presentation job %s, node resources are exhausted', job_id)
+        raise self.retry(countdown=current_app.config['INVENIO_RECORDS_PRESENTATION_RESOURCE_RETRY_DELAY'],
+                         max_retries=max_retries)
+
+    try:
+        current_records_presentation.init_presentations()  # once per worker process
+        delay = hedge_delay(workflow_name) if job_id else None
+        if delay is not None:
+            hedge_presentation.apply_async(args=(workflow_name, object_id, job_id), countdown=delay,
+                                           **current_app.config['INVENIO_RECORDS_PRESENTATION_HEDGE_TASK_OPTIONS'])
+
+        started, cpu_started = time.monotonic(), cpu_time()
+        try:
+            with job_owns_session():
+                eng_uuid = start(workflow_name, object_id=object_id, **kwargs)
+        except Exception:
+            if job_id and is_cancelled(job_id):
+                logger.info('Presentation job %s was cancelled', job_id)
+                remove_scratch(object_id)
+                self.update_state(state=states.REVOKED)
+                raise Ignore()
+            if delay is not None and is_decided(job_id):
+                logger.info('Presentation job %s was finished by its hedged run', job_id)
+                remove_scratch(object_id)
+                return claimed_result(job_id)
+            raise
+        finally:
+            account_job(workflow_name, object_id, cpu_time() - cpu_started, time.monotonic() - started)
+        record_runtime(workflow_name, time.monotonic() - started)
+
+        if delay is not None:
+            winner = claim_result(job_id, eng_uuid)
+            if winner != eng_uuid:
+                remove_scratch(object_id)
+            return winner
+        return eng_uuid
+    finally:
+        remove_transient_scratch(object_id)
+        release_resources(resources_key, workflow_name)
+        release_job(job_id)
+        logger.debug('DB pool after presentation job %s: %s', job_id, pool_metrics())
+
+
+@shared_task(ignore_result=True)
+def hedge_presentation(workflow_name: str, object_id: int, job_id: str):
+    """ Run a duplicate of a straggling presentation job, see :mod:`.hedging`
+
+        The duplicate works on its own copy of the job object, so it has its own scratch.
+    """
+    current_records_presentation.init_presentations()  # once per worker process
+    if is_decided(job_id) or is_cancelled(job_id) or run_presentation.AsyncResult(job_id).ready():
+        return
+    queue = current_app.config['INVENIO_RECORDS_PRESENTATION_HEDGE_TASK_OPTIONS'].get('queue', None)
+    if queue_length(queue) > 0:
+        logger.info('Not hedging presentation job %s, there is no spare capacity', job_id)
+        return
+
+    hedge_key = '{}:hedge'.format(job_id)
+    if not acquire_resources(hedge_key, workflow_name):
+        logger.info('Not hedging presentation job %s, node resources are exhausted', job_id)
+        return
+    try:
+        _run_hedge(workflow_name, object_id, job_id)
+    finally:
+        release_resources(hedge_key, workflow_name)
+
+
+def _run_hedge(workflow_name: str, object_id: int, job_id: str):
+    from invenio_workflows.tasks import start
+
+    from .api import PresentationWorkflowObject
+
+    original = PresentationWorkflowObject.get(object_id)
+    duplicate = PresentationWorkflowObject.create_job()
+    duplicate.extra_data.update({key: original.extra_data[key] for key in ('_record', '_user', '_request')
+                                 if key in original.extra_data})
+    duplicate.extra_data['_hedge_of'] = job_id
+    db.session.add(duplicate.model)
+    db.session.commit()
+
+    logger.info('Hedging straggling presentation job %s', job_id)
+    started, cpu_started = time.monotonic(), cpu_time()
+    try:
+        with job_owns_session():
+            eng_uuid = start(workflow_name, data=[duplicate])
+    except Exception:
+        if is_cancelled(job_id) or is_decided(job_id):  # cancelled, or the original run won
+            remove_scratch(duplicate.id)
+            return
+        raise
+    finally:
+        account_job(workflow_name, duplicate.id, cpu_time() - cpu_started, time.monotonic() - started)
+        remove_transient_scratch(duplicate.id)
+    if claim_result(job_id, eng_uuid) == eng_uuid:
+        run_presentation.backend.store_result(job_id, eng_uuid, states.SUCCESS)
+    else:
+        remove_scratch(duplicate.id)
+
+
+@worker_process_shutdown.connect
+def flush_usage_on_shutdown(**kwargs):
+    """ Write usage accounted by a worker process before it exits """
+    app = getattr(current_celery_app, 'flask_app', None)
+    if app is not None:
+        with app.app_context():
+            flush_usage()
+
+
+@task_revoked.connect
+def release_revoked_job(sender=None, request=None, **kwargs):
+    """ Release in-flight slot of a revoked presentation job, which never reaches its cleanup """
+    if getattr(sender, 'name', None) != run_presentation.name or request is None:
+        return
+    app = getattr(current_celery_app, 'flask_app', None)
+    if app is not None:
+        with app.app_context():
+            release_job(request.id)
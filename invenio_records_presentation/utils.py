@@ -6,15 +6,26 @@
 # under the terms of the MIT License; see LICENSE file for more details.
 
 """ Utils for Invenio Records Presentation."""
+import hashlib
+import logging
 import os
+import re
 import shutil
 import tempfile
+import threading
+import unicodedata
+from contextlib import contextmanager
+from typing import Optional
+from urllib.parse import quote
 
+from flask import current_app
 from six import string_types
 from werkzeug.utils import import_string
 
 from invenio_records_presentation.errors import WorkflowAccessOutsideScratch
 
+logger = logging.getLogger(__name__)
+
 
 def obj_or_import_string(value, default=None):
     """Import string or return object."""
@@ -25,22 +36,182 @@ def obj_or_import_string(value, default=None):
     return default
 
 
+STREAMING = 'STREAMING'
+""" Celery state of jobs whose output can be downloaded while it is being written """
+
+STREAM_COMPLETE_SUFFIX = '.complete'
+STREAM_FAILED_SUFFIX = '.failed'
+
+
+def follow_file(path: str, chunk_size=128000):
+    """ Read a file that is being written until its completion marker appears
+
+        Yields None whenever no more data is available yet, so that the caller
+        can wait in a way suitable for it.
+
+        :raises PresentationStreamError: when the writer marks the file as failed
+    """
+    from .errors import PresentationStreamError
+
+    with open(path, 'rb') as f:
+        while True:
+            buf = f.read(chunk_size)
+            if buf:
+                yield buf
+            elif os.path.exists(path + STREAM_COMPLETE_SUFFIX):
+                # the writer might have finished after our last read
+                buf = f.read(chunk_size)
+                if not buf:
+                    return
+                yield buf
+            elif os.path.exists(path + STREAM_FAILED_SUFFIX):
+                raise PresentationStreamError('Writing of {} failed'.format(path))
+            else:
+                yield None
+
+
+def queue_length(queue_name=None) -> int:
+    """ Get number of messages waiting in a Celery queue (the default one if not given) """
+    from celery import current_app as current_celery_app
+
+    queue_name = queue_name or current_celery_app.conf.task_default_queue
+    try:
+        with current_celery_app.connection_or_acquire() as conn:
+            return conn.default_channel.queue_declare(queue=queue_name, passive=True).message_count
+    except Exception:
+        logger.exception('Could not determine length of the {} queue'.format(queue_name))
+        return 0
+
+
+def _ascii_filename(name: str) -> str:
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[\x00-\x1f\x7f"\\]', '_', name).strip()
+
+
+def content_disposition(filename: str, disposition='inline') -> str:
+    """ Get Content-Disposition header value of a file (RFC 6266)
+
+        Non-ASCII filenames are sent as RFC 5987 ``filename*`` with an ASCII ``filename``
+        fallback for old clients.
+    """
+    stem, ext = os.path.splitext(filename)
+    ext = _ascii_filename(ext)
+    fallback = (_ascii_filename(stem) or 'download') + (ext if ext.strip('.') else '')
+    if fallback == filename:
+        return '{}; filename="{}"'.format(disposition, fallback)
+    return '{}; filename="{}"; filename*=UTF-8\'\'{}'.format(disposition, fallback,
+                                                             quote(filename, safe='!#$&+-.^_`|~'))
+
+
+def file_digest(path: str, algorithm='sha256', chunk_size=1024 * 1024) -> tuple:
+    """ Get hex digest and size of a file """
+    digest = hashlib.new(algorithm)
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            buf = f.read(chunk_size)
+            if not buf:
+                break
+            digest.update(buf)
+            size += len(buf)
+    return digest.hexdigest(), size
+
+
+_job_state = threading.local()
+
+
+@contextmanager
+def job_owns_session():
+    """ Mark the current thread as running a presentation job which owns its DB session
+
+        Only such jobs (run by a worker) may commit the session in the middle of a workflow.
+        A workflow started directly, e.g. by ``prepare(delayed=False)`` in a web request,
+        shares the session with its caller, whose transaction must not be committed halfway.
+    """
+    previous = getattr(_job_state, 'owns_session', False)
+    _job_state.owns_session = True
+    try:
+        yield
+    finally:
+        _job_state.owns_session = previous
+
+
+def session_owned() -> bool:
+    """ Does a presentation job running in the current thread own the DB session? """
+    return getattr(_job_state, 'owns_session', False)
+
+
+def release_session(*instances):
+    """ End the current DB transaction, returning its connection to the pool
+
+        Objects loaded in the session stay usable without being refreshed, so a long
+        running task does not hold a connection idle in transaction.
+
+        :param instances: model instances whose expired attributes are loaded first
+    """
+    from invenio_db import db
+    from sqlalchemy import inspect
+
+    session = db.session()
+    for instance in instances:
+        state = inspect(instance)
+        if state.session is session and state.expired_attributes:
+            session.refresh(instance, attribute_names=list(state.expired_attributes))
+    expire_on_commit = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
+        session.commit()
+    finally:
+        session.expire_on_commit = expire_on_commit
+
+
+def pool_metrics() -> dict:
+    """ Get usage of the DB connection pool of the current process """
+    from invenio_db import db
+
+    pool = db.engine.pool
+    metrics = {'pool': type(pool).__name__}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        if hasattr(pool, name):
+            metrics[name] = getattr(pool, name)()
+    return metrics
+
+
+def transient_scratch_dir(scratch_dir: str) -> Optional[str]:
+    """ Directory of the memory-backed tier of a job scratch directory, None if not configured """
+    from .proxies import current_records_presentation
+
+    root = current_records_presentation.transient_scratch_location
+    if not root:
+        return None
+    return os.path.join(root, os.path.basename(os.path.normpath(scratch_dir)))
+
+
 class ScratchDirectory:
+    """ Working directory of a presentation job
+
+        Files go to the scratch location, unless a transient location is configured and the
+        file is small (by its size hint) or marked as transient. Then it is created in a
+        memory-backed directory of the job, within a per-job limit. The transient directory
+        is removed when the job finishes, so only intermediate files may be created there.
+    """
     id = 0
 
     def __init__(self, scratch_dir=None):
         from .proxies import current_records_presentation
 
         self.scratch_root = current_records_presentation.scratch_location
+        self._size_hints = {}
 
         if scratch_dir:
             self.scratch_dir = scratch_dir
             self.validate_dir(scratch_dir)
-            for _, _, files in os.walk(self.scratch_dir):
-                for file in files:
-                    fileid = int(file.split('_', 1)[0])
-                    if fileid >= self.id:
-                        self.id = fileid + 1
+            for directory in filter(None, (self.scratch_dir, self.transient_dir)):
+                for _, _, files in os.walk(directory):
+                    for file in files:
+                        prefix = file.split('_', 1)[0]
+                        if prefix.isdigit() and int(prefix) >= self.id:
+                            self.id = int(prefix) + 1
         else:
             self.scratch_dir = tempfile.mkdtemp(prefix='invenio_presentation_',
                                                 dir=self.scratch_root)
@@ -66,22 +237,104 @@ class ScratchDirectory:
     def full_path(self, name):
         return os.path.join(self.scratch_dir, name)
 
+    @property
+    def transient_dir(self) -> Optional[str]:
+        return transient_scratch_dir(self.scratch_dir)
+
+    def is_transient(self, path: str) -> bool:
+        transient_dir = self.transient_dir
+        return bool(transient_dir) and os.path.realpath(path).startswith(os.path.realpath(transient_dir) + os.sep)
+
     @staticmethod
     def from_path(path):
         return ScratchDirectory(scratch_dir=path)
 
-    def create_file(self, task_name=None, pass_fh=False, suffix=None):
-        fd, path = tempfile.mkstemp(dir=self.dir_path, prefix='{}{}'
-                                    .format(self._next(), task_name),
+    def _transient_usage(self, transient_dir: str) -> int:
+        """ Bytes used in the transient tier, counting files not written yet by their size hints """
+        used = 0
+        for root, _, files in os.walk(transient_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    size = os.lstat(path).st_size
+                except OSError:
+                    continue  # removed in the meantime
+                used += max(size, self._size_hints.get(path, 0))
+        return used
+
+    def _use_transient(self, transient: Optional[bool], size_hint: Optional[int]) -> bool:
+        transient_dir = self.transient_dir
+        if transient is False or not transient_dir:
+            return False
+        if not transient and (size_hint is None
+                              or size_hint > current_app.config['INVENIO_RECORDS_PRESENTATION_TRANSIENT_FILE_SIZE']):
+            return False
+
+        needed = self._transient_usage(transient_dir) + (size_hint or 0)
+        if needed > current_app.config['INVENIO_RECORDS_PRESENTATION_TRANSIENT_SCRATCH_LIMIT'] \
+                or (size_hint or 0) >= shutil.disk_usage(os.path.dirname(transient_dir)).free:
+            logger.debug('Transient scratch %s is full, creating file in %s', transient_dir, self.scratch_dir)
+            return False
+        os.makedirs(transient_dir, exist_ok=True)
+        return True
+
+    def create_file(self, task_name=None, pass_fh=False, suffix=None, size_hint=None, transient=None):
+        """ Create a new empty file in the job scratch
+
+            :param size_hint: expected size of the file in bytes, small files go to the transient tier
+            :param transient: True to prefer the transient tier regardless of size (intermediate files),
+                False to always use the scratch location (outputs)
+        """
+        use_transient = self._use_transient(transient, size_hint)
+        fd, path = tempfile.mkstemp(dir=self.transient_dir if use_transient else self.dir_path,
+                                    prefix='{}{}'.format(self._next(), task_name),
                                     suffix=suffix)
+        if use_transient and size_hint:
+            self._size_hints[path] = size_hint
         if pass_fh:
             return os.fdopen(fd, "wb"), path
         else:
             os.close(fd)
             return path
 
+    @contextmanager
+    def json_writer(self, task_name=None, suffix='.json', transient=None, **json_options):
+        """ Write a JSON file incrementally, see :class:`.writers.JSONStreamWriter` """
+        from .writers import JSONStreamWriter
+
+        fh, path = self.create_file(task_name=task_name, pass_fh=True, suffix=suffix, transient=transient)
+        with fh:
+            yield JSONStreamWriter(fh, path=path, **json_options)
+
+    @contextmanager
+    def xml_writer(self, task_name=None, suffix='.xml', transient=None):
+        """ Write an XML file incrementally, see :class:`.writers.XMLStreamWriter` """
+        from .writers import XMLStreamWriter
+
+        fh, path = self.create_file(task_name=task_name, pass_fh=True, suffix=suffix, transient=transient)
+        with fh:
+            writer = XMLStreamWriter(fh, path=path)
+            yield writer
+            writer.close()
+
     def create_directory(self):
         return self._next()
 
+    def promote(self, path: str) -> str:
+        """ Move a file from the transient tier to the scratch location, e.g. when it becomes an output """
+        if not self.is_transient(path):
+            return path
+        target = os.path.join(self.scratch_dir, os.path.relpath(path, self.transient_dir))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(path, target)
+        return target
+
+    def remove_transient(self):
+        """ Remove the transient tier of the job scratch """
+        transient_dir = self.transient_dir
+        if transient_dir:
+            shutil.rmtree(transient_dir, ignore_errors=True)
+
     def remove(self):
+        self.remove_transient()
         shutil.rmtree(self.scratch_dir)
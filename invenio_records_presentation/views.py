@@ -9,24 +9,35 @@
 
 from __future__ import absolute_import, print_function
 
+import os
 import time
 import traceback
-from functools import wraps
+from datetime import datetime, timedelta
+from functools import partial, wraps
 import logging
-from uuid import UUID
+from typing import TYPE_CHECKING, Optional
+from uuid import UUID, uuid4
 
-from celery._state import app_or_default
-from celery.result import AsyncResult, result_from_tuple
-from flask import Blueprint, jsonify, abort, request, Response, current_app
+from celery import current_app as current_celery_app
+from celery import states
+from flask import Blueprint, jsonify, abort, request, Response, current_app, redirect, session, url_for
 from flask_login import current_user
-from invenio_pidstore.models import PersistentIdentifier
-from invenio_userprofiles import UserProfile
+from invenio_db import db
 from invenio_workflows import WorkflowEngine
+from werkzeug.http import parse_etags, quote_etag
 from workflow.errors import WorkflowDefinitionError
 
-from .api import Presentation, PresentationWorkflowObject
-from .errors import PresentationNotFound, WorkflowsPermissionError
+from .api import Presentation
+from .cache import forget_resolved_output, get_resolved_output, set_resolved_output
+from .cancellation import add_requester, heartbeat
+from .compression import accepts_encoding, iter_decompressed
+from .errors import PresentationAdmissionError, PresentationNotFound, PresentationPreviewError, \
+    PresentationStreamError, WorkflowsNotAuthenticated, WorkflowsPermissionError
 from .proxies import current_records_presentation
+from .utils import STREAMING, content_disposition, follow_file
+
+if TYPE_CHECKING:
+    from celery.result import AsyncResult
 
 logger = logging.getLogger(__name__)
 
@@ -49,9 +60,7 @@ def pass_result(f):
     @wraps(f)
     def decorate(*args, **kwargs):
         job_uuid = kwargs.pop('job_uuid')
-        Result = app_or_default(None).AsyncResult
-        result = Result(job_uuid, parent=None)
-        # result: AsyncResult = result_from_tuple([[job_uuid, None], None])
+        result = current_celery_app.AsyncResult(job_uuid, parent=None)
         # if result is None:
         #     abort(400, 'Invalid job UUID')
 
@@ -95,6 +104,8 @@ def index():
 @blueprint.route('/prepare/<string:pid_type>/<string:pid>/<string:presentation_id>/', methods=('POST',))
 @with_presentations
 def pid_prepare(pid_type: str, pid: str, presentation_id: str):
+    from invenio_pidstore.models import PersistentIdentifier
+
     pid_record = PersistentIdentifier.query.filter_by(pid_type=pid_type, pid_value=pid).one_or_none()
     if pid_record:
         return prepare(str(pid_record.object_uuid), presentation_id=presentation_id)
@@ -102,12 +113,10 @@ def pid_prepare(pid_type: str, pid: str, presentation_id: str):
         abort(404, 'Record with PID {}:{} not found'.format(pid_type, pid_type))
 
 
-@blueprint.route('/prepare/<string:record_uuid>/<string:presentation_id>/', methods=('POST',))
-@with_presentations
-@pass_presentation
-def prepare(record_uuid: str, presentation: Presentation):
+def current_user_meta() -> dict:
+    """ Metadata of the user calling current request """
     if current_user.is_anonymous:
-        user_meta = {
+        return {
             'id': None,
             'email': None,
             'login_ip': None,
@@ -116,30 +125,53 @@ def prepare(record_uuid: str, presentation: Presentation):
             'full_name': 'Anonymous',
             'username': None
         }
-    else:
-        profile_meta = {}
-        profile: UserProfile = UserProfile.get_by_userid(current_user.id)
-        if profile:
-            profile_meta = {
-                'full_name': profile.full_name,
-                'username': profile.username,
-            }
-        user_meta = {
-            'id': current_user.id,
-            'email': current_user.email,
-            'current_ip': str(request.remote_addr),
-            'login_ip': str(current_user.current_login_ip),
-            'roles': [{'id': role.id, 'name': role.name} for role in current_user.roles]
+
+    from invenio_userprofiles import UserProfile
+
+    profile_meta = {}
+    profile: UserProfile = UserProfile.get_by_userid(current_user.id)
+    if profile:
+        profile_meta = {
+            'full_name': profile.full_name,
+            'username': profile.username,
         }
-        user_meta.update(profile_meta)
+    user_meta = {
+        'id': current_user.id,
+        'email': current_user.email,
+        'current_ip': str(request.remote_addr),
+        'login_ip': str(current_user.current_login_ip),
+        'roles': [{'id': role.id, 'name': role.name} for role in current_user.roles]
+    }
+    user_meta.update(profile_meta)
+    return user_meta
+
+
+def requester_id() -> str:
+    """ Identity of the client calling current request, see :mod:`.cancellation` """
+    if not current_user.is_anonymous:
+        return 'user:{}'.format(current_user.id)
+    return 'session:{}'.format(session.setdefault('presentation_requester', uuid4().hex))
+
+
+@blueprint.route('/prepare/<string:record_uuid>/<string:presentation_id>/', methods=('POST',))
+@with_presentations
+@pass_presentation
+def prepare(record_uuid: str, presentation: Presentation):
+    user_meta = current_user_meta()
     headers = {k: v for k, v in request.headers}
 
     try:
         result = presentation.prepare(record_uuid, user_meta, headers, delayed=True)
-        if isinstance(result, AsyncResult):
-            return jsonify({'job_id': result.task_id})
-        else:
-            return jsonify({'job_id': result})
+        db.session.commit()
+        job_id = getattr(result, 'task_id', result)  # AsyncResult or job id
+        add_requester(job_id, requester_id())
+        return jsonify({'job_id': job_id})
+    except PresentationAdmissionError as e:
+        response = jsonify({'message': str(e)})
+        response.status_code = e.status
+        if e.retry_after:
+            response.headers['Retry-After'] = str(e.retry_after)
+        return response
     except WorkflowsPermissionError as e:
         logger.exception('Exception detected in prepare')
         abort(403, e)
@@ -148,9 +180,74 @@ def prepare(record_uuid: str, presentation: Presentation):
         abort(400, 'There was an error in the {} workflow definition'.format(presentation.name))
 
 
+@blueprint.route('/preview/<string:record_uuid>/<string:preview_id>/')
+@with_presentations
+def preview(record_uuid: str, preview_id: str):
+    """ Get a preview of a record rendered synchronously, see :mod:`.previews`
+
+        With ``?revision=`` of the current record revision the response never changes and
+        clients may cache it for good; other revisions are redirected to the current one.
+    """
+    from invenio_access import Permission
+
+    from .cache import record_revision
+    from .permissions import check_permission
+    from .previews import preview_etag, render_preview
+
+    try:
+        presentation = current_records_presentation.get_preview(preview_id)
+    except PresentationNotFound:
+        abort(404, 'Invalid preview type')
+    try:
+        if presentation.permissions:
+            check_permission(Permission(*presentation.permissions))
+    except WorkflowsNotAuthenticated:
+        abort(401)
+    except WorkflowsPermissionError:
+        abort(403)
+
+    try:
+        record_uuid = str(UUID(record_uuid))
+    except ValueError:
+        abort(404, 'Record not found')
+    revision = record_revision(record_uuid)
+    if revision is None:
+        abort(404, 'Record not found')
+    requested_revision = request.args.get('revision', type=int)
+    if requested_revision is not None and requested_revision != revision:
+        return redirect(url_for('.preview', record_uuid=record_uuid, preview_id=preview_id, revision=revision))
+
+    etag = preview_etag(preview_id, record_uuid, revision)
+    if requested_revision is not None:
+        max_age = 'max-age=31536000, immutable'
+    else:
+        max_age = 'max-age={}'.format(current_app.config['INVENIO_RECORDS_PRESENTATION_PREVIEW_MAX_AGE'])
+    headers = {
+        'ETag': quote_etag(etag),
+        'Cache-Control': '{}, {}'.format('private' if presentation.permissions else 'public', max_age),
+    }
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+
+    try:
+        data = render_preview(preview_id, record_uuid, revision)
+    except PresentationPreviewError as e:
+        abort(e.status, str(e))
+
+    conf = current_app.config['INVENIO_RECORDS_PRESENTATION_PREVIEWS'][preview_id]
+    headers.update({
+        'Content-Type': conf.get('mimetype', 'application/octet-stream'),
+        'Content-disposition': content_disposition(conf.get('filename', preview_id)),
+        'Content-Security-Policy': "object-src 'self';",
+        'Content-Length': str(len(data)),
+    })
+    return Response(data, headers=headers)
+
+
 @blueprint.route('/status/<string:job_uuid>/')
 @pass_result
-def status(result: AsyncResult):
+def status(result: 'AsyncResult'):
+    heartbeat(result.id)
     if result.state == 'FAILURE':
         print(result.traceback)
     try:
@@ -168,40 +265,242 @@ def status(result: AsyncResult):
     return jsonify({'status': result.state, 'info': info})
 
 
-import unicodedata
-def strip_accents(s):
-   return ''.join(c for c in unicodedata.normalize('NFD', s)
-                  if unicodedata.category(c) != 'Mn')
+@blueprint.route('/status/', methods=('POST',))
+def bulk_status():
+    """ Get states of many jobs at once
 
+        Accepts ``{"jobs": [job_uuid, ...], "since": cursor}``, where the optional cursor
+        was returned by a previous call and limits the response to jobs changed since then.
+    """
+    from .status import job_statuses, parse_cursor
 
-@blueprint.route('/download/<string:job_uuid>/')
+    payload = request.get_json(silent=True) or {}
+    job_ids = payload.get('jobs')
+    if not isinstance(job_ids, list) or not job_ids:
+        abort(400, 'A list of job UUIDs is required')
+    if len(job_ids) > current_app.config['INVENIO_RECORDS_PRESENTATION_STATUS_MAX_JOBS']:
+        abort(400, 'Too many jobs requested')
+    try:
+        job_ids = [str(UUID(job_id)) for job_id in job_ids]
+        since = parse_cursor(payload.get('since'))
+    except (TypeError, ValueError, AttributeError):
+        abort(400, 'Invalid job UUID or cursor')
+
+    cursor = datetime.utcnow().isoformat()  # taken first, so no change is missed by the next call
+    heartbeat(*job_ids)
+    return jsonify({'jobs': job_statuses(list(dict.fromkeys(job_ids)), since=since), 'cursor': cursor})
+
+
+@blueprint.route('/job/<string:job_uuid>/', methods=('DELETE',))
 @pass_result
-def download(result: AsyncResult):
-    for i in range(10):
-        try:
-            time.sleep(1)
-            eng_uuid = result.get()  # Will wait until task has completed
-            break
-        except:
-            traceback.print_exc()
-            if i == 9:
-                raise
-            time.sleep(5)
+def cancel(result: 'AsyncResult'):
+    """ Give up a job, cancelling it unless other requesters wait for it, see :mod:`.cancellation` """
+    from .cancellation import cancel_job
+
+    if result.ready():
+        abort(409, 'Presentation job already finished')
+    return jsonify({'job_id': result.id, 'cancelled': cancel_job(result.id, requester_id())})
+
+
+@blueprint.route('/usage/')
+def usage():
+    """ Report worker usage of presentations (superusers only)
+
+        Query arguments: ``since`` and ``until`` (ISO dates, the last 30 days by default)
+        and ``group_by`` (one of user, role, presentation, day).
+    """
+    from invenio_access import Permission
+    from invenio_access.permissions import superuser_access
+
+    from .accounting import usage_report
+
+    if not Permission(superuser_access).can():
+        abort(403)
+
+    group_by = request.args.get('group_by', 'user')
+    if group_by not in ('user', 'role', 'presentation', 'day'):
+        abort(400, 'Invalid group_by')
+    try:
+        until = datetime.strptime(request.args['until'], '%Y-%m-%d').date() \
+            if 'until' in request.args else datetime.utcnow().date()
+        since = datetime.strptime(request.args['since'], '%Y-%m-%d').date() \
+            if 'since' in request.args else until - timedelta(days=30)
+    except ValueError:
+        abort(400, 'Invalid date, use YYYY-MM-DD')
+
+    return jsonify({'since': since.isoformat(), 'until': until.isoformat(), 'group_by': group_by,
+                    'usage': usage_report(since, until, group_by)})
 
+
+def job_output(eng_uuid: str) -> dict:
+    """ Get the output of a finished presentation job, with an absolute path """
     engine = WorkflowEngine.from_uuid(eng_uuid)
-    object = PresentationWorkflowObject(engine.objects[-1])
+    object = engine.objects[-1]
+    output = dict(object.data)
+    if not output.get('uri'):
+        output['path'] = os.path.join(object.extra_data['_scratch'], output['path'])
+    return output
 
-    data_path = object.scratch.full_path(object.data['path'])
 
-    def serve():
-        with open(data_path, 'rb') as f:
-            while True:
-                buf = f.read(128000)
-                if not buf:
-                    break
+def download_headers(output: dict) -> dict:
+    return {
+        'Content-Type': output['mimetype'],
+        'Content-disposition': output.get('content_disposition') or content_disposition(output['filename']),
+        'Content-Security-Policy': "object-src 'self';"
+    }
+
+
+def iter_file(fileobj, chunk_size=128000):
+    """ Stream contents of a binary file object, closing it at the end """
+    with fileobj:
+        while True:
+            buf = fileobj.read(chunk_size)
+            if not buf:
+                break
+            yield buf
+
+
+def _negotiate_encoding(output: dict, accept_encoding, headers):
+    encoding = output.get('encoding', None)
+    if not encoding:
+        return True
+
+    headers['Vary'] = 'Accept-Encoding'
+    if accepts_encoding(accept_encoding, encoding):
+        headers['Content-Encoding'] = encoding
+        return True
+    return False
+
+
+def output_etag(output: dict, accept_encoding=None) -> Optional[str]:
+    """ Get entity tag of a job output as it will be sent to the client, if its hash is known """
+    sha256 = output.get('sha256', None)
+    if not sha256:
+        return None
+    if _negotiate_encoding(output, accept_encoding, {}):
+        return sha256
+    return '{}-identity'.format(sha256)  # decompressed on the fly
+
+
+def not_modified(output: dict, accept_encoding=None, if_none_match=None):
+    """ Get headers of a 304 response if the client already has the job output """
+    etag = output_etag(output, accept_encoding)
+    if not etag or not if_none_match or not parse_etags(if_none_match).contains(etag):
+        return None
+    headers = {'ETag': quote_etag(etag)}
+    if output.get('encoding', None):
+        headers['Vary'] = 'Accept-Encoding'
+    return headers
+
+
+def download_redirect(output: dict, accept_encoding=None):
+    """ Get URL the job output may be downloaded from directly, if the artifact storage has one """
+    uri = output.get('uri', None)
+    if not uri or not _negotiate_encoding(output, accept_encoding, {}):
+        return None
+
+    headers = download_headers(output)
+    return current_records_presentation.storage.url(uri, headers['Content-Type'],
+                                                    headers['Content-disposition'])
+
+
+def download_body(output: dict, accept_encoding=None):
+    """ Get response body chunks and headers of a job output
+
+        Compressed outputs are sent as they are stored if the client accepts their encoding,
+        otherwise they are decompressed on the fly.
+    """
+    headers = download_headers(output)
+    uri = output.get('uri', None)
+    if uri:
+        fileobj = current_records_presentation.storage.open(uri)
+    else:
+        fileobj = open(output['path'], 'rb')
+
+    etag = output_etag(output, accept_encoding)
+    if etag:
+        headers['ETag'] = quote_etag(etag)
+        if output.get('size', None) is not None and etag == output['sha256']:
+            headers['Content-Length'] = str(output['size'])
+
+    if _negotiate_encoding(output, accept_encoding, headers):
+        return iter_file(fileobj), headers
+    return iter_decompressed(fileobj, output['encoding']), headers
+
+
+def follow_body(result: 'AsyncResult', idle_checks=10):
+    """ Stream a job output which is still being written, until the job finishes, fails or stalls """
+    app = current_app._get_current_object()  # the body is iterated outside of the request context
+    poll_interval = app.config['INVENIO_RECORDS_PRESENTATION_STREAM_POLL_INTERVAL']
+    idle_timeout = app.config['INVENIO_RECORDS_PRESENTATION_STREAM_IDLE_TIMEOUT']
+    output = result.info
+    path = output['path']
+
+    def follow():
+        idle = 0
+        last_data = last_heartbeat = time.monotonic()
+        for buf in follow_file(path):
+            if time.monotonic() - last_heartbeat >= poll_interval:
+                with app.app_context():
+                    heartbeat(result.task_id)  # the client is still downloading, do not cancel the job
+                last_heartbeat = time.monotonic()
+            if buf is not None:
+                idle = 0
+                last_data = time.monotonic()
                 yield buf
+                continue
 
-    return Response(serve(), mimetype=object.data['mimetype'], headers={
-        'Content-disposition': 'inline; filename=\"{}\"'.format(strip_accents(object.data['filename'])),
-        'Content-Security-Policy': "object-src 'self';"
-    })
+            idle += 1
+            if idle % idle_checks == 0 and result.state in ('FAILURE', 'REVOKED'):
+                raise PresentationStreamError('Presentation job {} failed'.format(result.task_id))
+            if time.monotonic() - last_data > idle_timeout:  # e.g. the worker was killed
+                raise PresentationStreamError('Presentation job {} stopped writing its output'
+                                              .format(result.task_id))
+            time.sleep(poll_interval)
+
+    return follow(), download_headers(output)
+
+
+@blueprint.route('/download/<string:job_uuid>/')
+@pass_result
+def download(result: 'AsyncResult'):
+    heartbeat(result.id)
+    output = get_resolved_output(result.id)
+    if output is None:
+        if result.state == STREAMING:
+            body, headers = follow_body(result)
+            return Response(body, headers=headers)
+
+        for i in range(10):
+            try:
+                time.sleep(1)
+                # Will wait until task has completed, the client is still waiting, so do not cancel it
+                eng_uuid = result.get(on_interval=partial(heartbeat, result.id))
+                break
+            except:
+                if result.state == states.REVOKED:
+                    abort(410, 'Presentation job was cancelled')
+                traceback.print_exc()
+                if i == 9:
+                    raise
+                time.sleep(5)
+
+        output = job_output(eng_uuid)
+        set_resolved_output(result.id, output)
+
+    accept_encoding = request.headers.get('Accept-Encoding')
+    headers = not_modified(output, accept_encoding, request.headers.get('If-None-Match'))
+    if headers:
+        return Response(status=304, headers=headers)
+
+    url = download_redirect(output, accept_encoding)
+    if url:
+        return redirect(url)
+
+    try:
+        body, headers = download_body(output, accept_encoding)
+    except FileNotFoundError:
+        forget_resolved_output(result.id)
+        abort(404, 'Presentation output is no longer available')
+
+    return Response(body, headers=headers)
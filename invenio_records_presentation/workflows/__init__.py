@@ -6,17 +6,109 @@
 # under the terms of the MIT License; see LICENSE file for more details.
 
 """ Presentation workflow."""
+import inspect
+from functools import wraps
+
+from flask import current_app
+from workflow.errors import WorkflowDefinitionError
+
+from ..cancellation import check_cancelled
+from ..utils import obj_or_import_string, release_session, session_owned
+from .output import finalize_output
+
+
+def check_task(task, workflow_name: str):
+    """ Check that a task can be called by the workflow engine as ``task(obj, eng)`` """
+    if not callable(task):
+        raise WorkflowDefinitionError('Task {} of {} workflow is not callable'.format(task, workflow_name),
+                                      workflow_name)
+    try:
+        signature = inspect.signature(task)
+    except (TypeError, ValueError):  # pragma: no cover
+        return  # builtins without an introspectable signature
+    try:
+        signature.bind(None, None)
+    except TypeError:
+        raise WorkflowDefinitionError('Task {} of {} workflow must accept (obj, eng) arguments'
+                                      .format(getattr(task, '__name__', task), workflow_name), workflow_name)
+
+
+def cancellable(task):
+    """ Stop the workflow before a task if its job was cancelled, see :mod:`..cancellation` """
+    @wraps(task)
+    def run_task(obj, eng):
+        check_cancelled(obj)
+        return task(obj, eng)
+    return run_task
+
+
+def session_released(task):
+    """ Run a task without holding a DB connection if the job owns its session, see :func:`release_session` """
+    @wraps(task)
+    def run_task(obj, eng):
+        if session_owned():
+            release_session(obj.model)
+            obj.session_released = True
+        return task(obj, eng)
+    return run_task
+
+
+def compile_tasks(task_list: list, workflow_name: str) -> list:
+    """ Resolve import strings of tasks (including nested task lists) and check their signatures """
+    compiled = []
+    for task in task_list:
+        if isinstance(task, (list, tuple)):
+            compiled.append(compile_tasks(task, workflow_name))
+            continue
+        try:
+            task = obj_or_import_string(task)
+        except ImportError as e:
+            raise WorkflowDefinitionError('Task {} of {} workflow could not be imported: {}'
+                                          .format(task, workflow_name, e), workflow_name)
+        check_task(task, workflow_name)
+        compiled.append(task)
+    return compiled
 
 
 class PresentationWorkflow(object):
     workflow = []
 
-    def __init__(self, task_list: list):
-        self.workflow = task_list
+    def __init__(self, task_list: list, resource_class=None):
+        """ :param task_list: task callables or their import strings
+            :param resource_class: name of the resource class of the workflow jobs
+        """
+        self.task_list = list(task_list)
+        self.resource_class = resource_class
+        self.workflow = self.task_list + [finalize_output]
+        self.compiled = False
+
+    def compile(self, workflow_name: str) -> 'PresentationWorkflow':
+        """ Resolve and check all tasks once, so that running the workflow does no imports """
+        if not self.compiled:
+            if self.resource_class and self.resource_class not in \
+                    current_app.config['INVENIO_RECORDS_PRESENTATION_RESOURCE_CLASSES']:
+                raise WorkflowDefinitionError('Unknown resource class {} of {} workflow'
+                                              .format(self.resource_class, workflow_name), workflow_name)
+            workflow = [cancellable(task) if callable(task) else task
+                        for task in compile_tasks(self.task_list, workflow_name) + [finalize_output]]
+            if current_app.config['INVENIO_RECORDS_PRESENTATION_RELEASE_SESSION']:
+                workflow = [session_released(task) if callable(task) else task for task in workflow]
+            self.workflow = workflow
+            self.compiled = True
+        return self
+
+
+def presentation_workflow_factory(task_list: list, resource_class=None) -> PresentationWorkflow:
+    return PresentationWorkflow(task_list=task_list, resource_class=resource_class)
+
 
+def presentation_dag_factory(tasks: list, output=None, max_workers=None,
+                             resource_class=None) -> PresentationWorkflow:
+    """ Create a presentation workflow running tasks declared by ``dag_task`` as a DAG """
+    from .dag import dag_runner
 
-def presentation_workflow_factory(task_list: list) -> PresentationWorkflow:
-    return PresentationWorkflow(task_list=task_list)
+    return PresentationWorkflow(task_list=[dag_runner(tasks, output=output, max_workers=max_workers)],
+                                resource_class=resource_class)
 
 
-__all__ = ('PresentationWorkflow', 'presentation_workflow_factory')
+__all__ = ('PresentationWorkflow', 'presentation_workflow_factory', 'presentation_dag_factory')
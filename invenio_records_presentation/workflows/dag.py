@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+""" Presentation workflows defined as a DAG of tasks.
+
+    DAG tasks declare the named values they consume and produce. Tasks whose inputs are
+    ready run concurrently on a thread pool, so the workflow takes as long as its critical
+    path. The initial ``obj.data`` is available as the ``data`` input::
+
+        @dag_task(outputs=('thumbnail',))
+        def make_thumbnail(obj, eng):
+            ...
+
+        @dag_task(inputs=('thumbnail', 'sheet'), outputs=('package',))
+        def make_package(obj, eng, thumbnail, sheet):
+            ...
+
+        example = presentation_dag_factory([make_thumbnail, make_sheet, make_package])
+
+    A task with a single output returns its value; a task with more outputs returns a dict
+    of them. The output of the last task becomes ``obj.data`` unless ``output`` is given.
+
+    Concurrent tasks share ``obj``, so they pass values through their outputs rather than
+    ``obj.data``, and change ``obj.extra_data`` only while holding ``obj.extra_data_lock``::
+
+        with obj.extra_data_lock:
+            obj.extra_data['pages'] = obj.extra_data.get('pages', 0) + pages
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from flask import current_app
+from workflow.errors import WorkflowDefinitionError
+
+from ..cancellation import check_cancelled
+
+# DAG errors are raised with no workflow name (None), a DAG does not know the workflow it becomes
+
+INITIAL_INPUT = 'data'
+
+
+class DAGTask(object):
+    """ Presentation task with declared inputs and outputs """
+
+    def __init__(self, func, inputs=(), outputs=()):
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+
+    @property
+    def name(self) -> str:
+        return self.func.__name__
+
+    def run(self, app, obj, eng, values: dict) -> dict:
+        with app.app_context():
+            result = self.func(obj, eng, **{name: values[name] for name in self.inputs})
+
+        if len(self.outputs) == 1:
+            return {self.outputs[0]: result}
+        if not self.outputs:
+            return {}
+        if not isinstance(result, dict) or set(result) != set(self.outputs):
+            raise WorkflowDefinitionError('Task {} must return a dict of {}'.format(self.name, self.outputs), None)
+        return result
+
+
+def dag_task(inputs=(), outputs=()):
+    """ Declare inputs and outputs of a DAG presentation task """
+    def decorator(func):
+        func.dag_task = DAGTask(func, inputs=inputs, outputs=outputs)
+        return func
+    return decorator
+
+
+def _as_dag_task(task) -> DAGTask:
+    if isinstance(task, DAGTask):
+        return task
+    if hasattr(task, 'dag_task'):
+        return task.dag_task
+    raise WorkflowDefinitionError('Task {} does not declare its inputs and outputs'.format(task), None)
+
+
+def validate_dag(tasks: list, output=None):
+    """ Check that every input and the output are produced exactly once and there are no cycles """
+    producers = {INITIAL_INPUT: None}
+    for task in tasks:
+        for name in task.outputs:
+            if name in producers:
+                raise WorkflowDefinitionError('Value {} is produced more than once'.format(name), None)
+            producers[name] = task
+    if output is not None and output not in producers:
+        raise WorkflowDefinitionError('Output {} of the DAG is not produced by any task'.format(output), None)
+
+    available = {INITIAL_INPUT}
+    remaining = list(tasks)
+    while remaining:
+        ready = [task for task in remaining if set(task.inputs) <= available]
+        if not ready:
+            missing = {name for task in remaining for name in task.inputs} - set(producers)
+            raise WorkflowDefinitionError('Missing inputs {}'.format(missing) if missing
+                                          else 'Tasks {} form a cycle'.format([t.name for t in remaining]), None)
+        for task in ready:
+            remaining.remove(task)
+            available.update(task.outputs)
+
+
+def dag_runner(tasks: list, output=None, max_workers=None):
+    """ Create a workflow task running given tasks as a DAG """
+    tasks = [_as_dag_task(task) for task in tasks]
+    if not tasks:
+        raise WorkflowDefinitionError('DAG has no tasks', None)
+
+    if output is None:
+        if len(tasks[-1].outputs) != 1:
+            raise WorkflowDefinitionError('Output of the DAG must be given explicitly', None)
+        output = tasks[-1].outputs[0]
+    validate_dag(tasks, output)
+
+    def run_dag(obj, eng):
+        """ Run presentation tasks as a DAG, independent branches concurrently """
+        app = current_app._get_current_object()
+        obj.scratch  # create the scratch directory before tasks run in parallel
+
+        values = {INITIAL_INPUT: obj.data}
+        remaining = list(tasks)
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers or len(tasks)) as executor:
+            while remaining or running:
+                if remaining:
+                    check_cancelled(obj)
+                for task in [task for task in remaining if all(name in values for name in task.inputs)]:
+                    remaining.remove(task)
+                    running[executor.submit(task.run, app, obj, eng, values)] = task
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    running.pop(future)
+                    values.update(future.result())
+
+        obj.data = values[output]
+        return obj
+
+    return run_dag
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+""" Presentation tasks working with files of the presented record."""
+import fcntl
+import hashlib
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from invenio_workflows import WorkflowEngine
+
+from invenio_records_presentation.errors import PresentationFileChecksumError
+
+FICLONE = 0x40049409
+""" Linux ioctl creating a copy-on-write clone (reflink) of a file """
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_manifest_entry(object_version) -> dict:
+    file_instance = object_version.file
+    return {
+        'key': object_version.key,
+        'version_id': str(object_version.version_id),
+        'mimetype': object_version.mimetype,
+        'size': file_instance.size,
+        'checksum': file_instance.checksum,
+    }
+
+
+def write_files_manifest(obj, eng: WorkflowEngine):
+    """ Write a JSON manifest of all record files into scratch and pass its path on """
+    with obj.scratch.json_writer(task_name='files_manifest') as writer:
+        with writer.object():
+            writer.value(str(obj.extra_data['_record']), key='record')
+            with writer.array(key='files'):
+                for object_version in obj.iter_files():
+                    writer.value(file_manifest_entry(object_version))
+
+    obj.data = writer.path
+    return obj
+
+
+def _link(source: str, target: str, mode: str) -> bool:
+    """ Try to link a local storage file into scratch instead of copying it """
+    if mode == 'hardlink':
+        try:
+            os.remove(target)
+            os.link(source, target)
+            return True
+        except OSError:
+            return False
+
+    if mode == 'reflink':
+        try:
+            with open(source, 'rb') as src, open(target, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return True
+        except OSError:
+            return False
+
+    return False
+
+
+def _fetch_file(app, file_instance, target: str, link_mode: str) -> str:
+    """ Copy a file instance into scratch, verifying its checksum on the way """
+    if file_instance.uri and os.path.isfile(file_instance.uri) \
+            and _link(file_instance.uri, target, link_mode):
+        # the link shares its data with the stored file, which was checksummed when stored
+        return file_instance.checksum
+
+    algo, expected = (file_instance.checksum or 'md5:').split(':', 1)
+    digest = hashlib.new(algo)
+    with app.app_context():
+        with file_instance.storage().open() as src, open(target, 'wb') as dst:
+            while True:
+                buf = src.read(CHUNK_SIZE)
+                if not buf:
+                    break
+                digest.update(buf)
+                dst.write(buf)
+
+    checksum = '{}:{}'.format(algo, digest.hexdigest())
+    if expected and digest.hexdigest() != expected:
+        raise PresentationFileChecksumError('Checksum of file {} is {}, expected {}'
+                                            .format(file_instance.id, checksum, file_instance.checksum))
+    return checksum
+
+
+def fetch_record_files(obj, eng: WorkflowEngine):
+    """ Fetch all record files into scratch concurrently and pass a key -> path mapping on
+
+        Files already fetched by earlier tasks of the workflow are not fetched again.
+    """
+    app = current_app._get_current_object()
+    link_mode = app.config['INVENIO_RECORDS_PRESENTATION_FETCH_LINK']
+    fetched = dict(obj.extra_data.get('_fetched', {}))
+    scratch = obj.scratch
+
+    with ThreadPoolExecutor(max_workers=app.config['INVENIO_RECORDS_PRESENTATION_FETCH_WORKERS']) as executor:
+        futures = {}
+        for object_version in obj.iter_files():
+            file_instance = object_version.file
+            previous = fetched.get(object_version.key)
+            if previous and previous['checksum'] == file_instance.checksum \
+                    and os.path.exists(previous['path']):
+                continue
+
+            name, ext = os.path.splitext(os.path.basename(object_version.key))
+            target = scratch.create_file(task_name=re.sub(r'[^\w.-]', '_', name), suffix=ext,
+                                         size_hint=file_instance.size)
+            futures[object_version.key] = (target, executor.submit(_fetch_file, app, file_instance,
+                                                                   target, link_mode))
+
+        for key, (target, future) in futures.items():
+            fetched[key] = {'path': target, 'checksum': future.result()}
+
+    with obj.extra_data_lock:
+        obj.extra_data['_fetched'] = fetched
+    obj.data = {key: entry['path'] for key, entry in fetched.items()}
+    return obj
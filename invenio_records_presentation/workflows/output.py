@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+""" Tasks finalizing the output of every Presentation workflow."""
+import json
+import mimetypes
+import os
+from typing import Optional
+
+from invenio_records_presentation.compression import SUFFIXES, compress_file, encoding_for
+from invenio_records_presentation.utils import STREAM_COMPLETE_SUFFIX, STREAM_FAILED_SUFFIX, \
+    content_disposition, file_digest
+
+MANIFEST_NAME = 'manifest.json'
+""" Name of the artifact manifest written into the job scratch directory """
+
+
+def is_output_file(data) -> bool:
+    return isinstance(data, dict) and 'path' in data and 'mimetype' in data
+
+
+def artifact_entry(path: str, mimetype: Optional[str] = None, encoding: Optional[str] = None) -> dict:
+    """ Describe a file produced by a presentation job """
+    sha256, size = file_digest(path)
+    if mimetype is None:
+        mimetype, encoding = mimetypes.guess_type(path)
+    return {
+        'name': os.path.basename(path),
+        'sha256': sha256,
+        'size': size,
+        'mimetype': mimetype or 'application/octet-stream',
+        'encoding': encoding,
+    }
+
+
+def write_artifact_manifest(obj, output: Optional[dict]) -> list:
+    """ Write a manifest of all files the job produced in its scratch directory
+
+        Record files fetched into scratch are inputs, not artifacts, so they are left out.
+        The manifest is kept in ``extra_data['_manifest']`` too.
+    """
+    scratch = obj.scratch
+    inputs = {os.path.realpath(entry['path']) for entry in obj.extra_data.get('_fetched', {}).values()}
+    output_path = os.path.realpath(scratch.full_path(output['path'])) if output else None
+
+    artifacts = []
+    for root, _, files in os.walk(scratch.dir_path):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            real_path = os.path.realpath(path)
+            if real_path in inputs or name == MANIFEST_NAME \
+                    or name.endswith((STREAM_COMPLETE_SUFFIX, STREAM_FAILED_SUFFIX)):
+                continue
+            if real_path == output_path:
+                entry = dict(artifact_entry(path, output['mimetype'], output.get('encoding')), output=True)
+            else:
+                entry = artifact_entry(path)
+            entry['name'] = os.path.relpath(path, scratch.dir_path)
+            artifacts.append(entry)
+
+    with open(scratch.full_path(MANIFEST_NAME), 'w') as f:
+        json.dump(artifacts, f, indent=2)
+    with obj.extra_data_lock:
+        obj.extra_data['_manifest'] = artifacts
+    return artifacts
+
+
+def artifact_key(output: dict) -> str:
+    """ Content-addressed storage key of an output, identical outputs of different jobs share it """
+    ext = os.path.splitext(output.get('filename', ''))[1]
+    if output.get('encoding'):
+        ext += SUFFIXES.get(output['encoding'], '')
+    return '{}/{}{}'.format(output['sha256'][:2], output['sha256'], ext)
+
+
+def finalize_output(obj, eng):
+    """ Store the output file produced by presentation tasks in its final form """
+    output = dict(obj.data) if is_output_file(obj.data) else None
+    if output and not output.get('encoding') and not output.get('streaming'):
+        encoding = encoding_for(output['mimetype'])
+        if encoding:
+            output['path'] = compress_file(obj.scratch.full_path(output['path']), encoding)
+            output['encoding'] = encoding
+
+    manifest = []
+    if obj.extra_data.get('_scratch'):
+        scratch = obj.scratch
+        if output and not output.get('uri'):
+            output['path'] = scratch.promote(scratch.full_path(output['path']))
+        scratch.remove_transient()
+        manifest = write_artifact_manifest(obj, output)
+    if output is None:
+        return obj
+
+    if not output.get('content_disposition'):
+        output['content_disposition'] = content_disposition(output['filename'])
+    if not output.get('sha256'):
+        entry = next((entry for entry in manifest if entry.get('output')), None) \
+            or artifact_entry(obj.scratch.full_path(output['path']), output['mimetype'])
+        output['sha256'] = entry['sha256']
+        output['size'] = entry['size']
+
+    if not output.get('uri'):
+        from invenio_records_presentation.proxies import current_records_presentation
+
+        storage = current_records_presentation.storage
+        scratch = obj.scratch
+        path = scratch.full_path(output['path'])
+        output['uri'] = storage.store(path, artifact_key(output), output['mimetype'], output.get('encoding'))
+        if not storage.local:
+            scratch.remove()
+
+    obj.data = output
+    return obj
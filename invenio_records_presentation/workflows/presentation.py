@@ -24,7 +24,7 @@ def print_data(obj, eng: WorkflowEngine):
 
 def create_example_file(obj, eng: WorkflowEngine):
     # creates an example input file and passes a path to it
-    input = obj.scratch.create_file(task_name='example_input')
+    input = obj.scratch.create_file(task_name='example_input', transient=True)
     with open(input, 'w') as tf:
         tf.write("example file\n")
 
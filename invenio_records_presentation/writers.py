@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+""" Incremental writers of presentation files.
+
+    The writers let tasks serialize arbitrarily large records (e.g. file manifests of
+    records with tens of thousands of files) while keeping only the currently written
+    item in memory::
+
+        with obj.scratch.json_writer(task_name='manifest') as writer:
+            with writer.object():
+                writer.value(str(record_id), key='id')
+                with writer.array(key='files'):
+                    for file in obj.iter_files():
+                        writer.value({'key': file.key, 'size': file.file.size})
+"""
+import json
+from contextlib import contextmanager
+from xml.sax.saxutils import XMLGenerator
+
+
+class JSONStreamWriter(object):
+    """ Writes a JSON document incrementally into a binary file """
+
+    def __init__(self, fh, path=None, **json_options):
+        self.fh = fh
+        self.path = path
+        self.json_options = json_options
+        self._stack = []  # [is_object, is_first] of every open container
+        self._started = False
+
+    def _write(self, data: str):
+        self.fh.write(data.encode('utf-8'))
+
+    def _begin_item(self, key):
+        if not self._stack:
+            if key is not None:
+                raise ValueError('The top-level JSON value can not have a key')
+            if self._started:
+                raise ValueError('A JSON document has a single top-level value')
+            self._started = True
+            return
+        is_object, is_first = self._stack[-1]
+        if is_object and key is None:
+            raise ValueError('Values inside a JSON object need a key')
+        if not is_object and key is not None:
+            raise ValueError('Values inside a JSON array can not have a key')
+        if not is_first:
+            self._write(',')
+        self._stack[-1][1] = False
+        if is_object:
+            self._write(json.dumps(str(key)) + ':')
+
+    def value(self, value, key=None):
+        """ Write a complete value (which must fit in memory) """
+        self._begin_item(key)
+        self._write(json.dumps(value, **self.json_options))
+
+    def start_object(self, key=None):
+        self._begin_item(key)
+        self._write('{')
+        self._stack.append([True, True])
+
+    def end_object(self):
+        self._stack.pop()
+        self._write('}')
+
+    def start_array(self, key=None):
+        self._begin_item(key)
+        self._write('[')
+        self._stack.append([False, True])
+
+    def end_array(self):
+        self._stack.pop()
+        self._write(']')
+
+    @contextmanager
+    def object(self, key=None):
+        self.start_object(key)
+        yield self
+        self.end_object()
+
+    @contextmanager
+    def array(self, key=None):
+        self.start_array(key)
+        yield self
+        self.end_array()
+
+
+class XMLStreamWriter(object):
+    """ Writes an XML document incrementally into a binary file """
+
+    def __init__(self, fh, path=None, encoding='utf-8'):
+        self.fh = fh
+        self.path = path
+        self._generator = XMLGenerator(fh, encoding, short_empty_elements=True)
+        self._generator.startDocument()
+
+    def start_element(self, name, attrs=None):
+        self._generator.startElement(name, attrs or {})
+
+    def end_element(self, name):
+        self._generator.endElement(name)
+
+    def text(self, content):
+        self._generator.characters(str(content))
+
+    def element(self, name, content=None, attrs=None):
+        """ Write a complete element with an optional text content """
+        self.start_element(name, attrs)
+        if content is not None:
+            self.text(content)
+        self.end_element(name)
+
+    @contextmanager
+    def container(self, name, attrs=None):
+        self.start_element(name, attrs)
+        yield self
+        self.end_element(name)
+
+    def close(self):
+        self._generator.endDocument()
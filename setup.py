@@ -46,6 +46,9 @@ extras_require = {
         'invenio-db[postgresql]>={}'.format(invenio_db_version),
     ],
     'tests': tests_require,
+    'zstd': [
+        'zstandard>=0.11.0',
+    ],
 }
 
 extras_require['all'] = []
@@ -65,6 +68,7 @@ install_requires = [
     'invenio-records-rest>=1.1.0',
     'arrow>=0.12.1',
     'invenio-rest>=1.0.0',
+    'invenio-cache>=1.0.0',
     'invenio-workflows>=7.0.3',
     'invenio-records>=1.0.1'
 ]
@@ -101,7 +105,19 @@ setup(
         ],
         'invenio_base.api_blueprints': [
             'invenio_records_presentation = invenio_records_presentation.views:blueprint',
-        ]
+        ],
+        'flask.commands': [
+            'presentation = invenio_records_presentation.cli:presentation',
+        ],
+        'invenio_celery.tasks': [
+            'invenio_records_presentation = invenio_records_presentation.tasks',
+        ],
+        'invenio_db.models': [
+            'invenio_records_presentation = invenio_records_presentation.models',
+        ],
+        'invenio_db.alembic': [
+            'invenio_records_presentation = invenio_records_presentation:alembic',
+        ],
     },
     extras_require=extras_require,
     install_requires=install_requires,
@@ -8,3 +8,65 @@
 """Common pytest fixtures and plugins."""
 
 from __future__ import absolute_import, print_function
+
+import os
+import shutil
+import tempfile
+
+import pytest
+from flask import Flask
+from flask_celeryext import FlaskCeleryExt
+from invenio_cache import InvenioCache
+from invenio_db import InvenioDB
+from invenio_db import db as db_
+from invenio_workflows import InvenioWorkflows
+
+from invenio_records_presentation import InvenioRecordsPresentation
+
+
+@pytest.fixture()
+def instance_path():
+    """Temporary instance path."""
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+
+@pytest.fixture()
+def base_app(instance_path):
+    """Flask application fixture."""
+    app = Flask('testapp', instance_path=instance_path)
+    app.config.update(
+        SECRET_KEY='test',
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI=os.environ.get('SQLALCHEMY_DATABASE_URI', 'sqlite://'),
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        CACHE_TYPE='simple',
+        CELERY_TASK_ALWAYS_EAGER=True,
+        CELERY_TASK_EAGER_PROPAGATES=True,
+        CELERY_RESULT_BACKEND='cache',
+        CELERY_CACHE_BACKEND='memory',
+        INVENIO_RECORDS_PRESENTATION_SCRATCH_LOCATION=instance_path,
+    )
+    FlaskCeleryExt(app)
+    InvenioDB(app)
+    InvenioCache(app)
+    InvenioWorkflows(app)
+    InvenioRecordsPresentation(app)
+    return app
+
+
+@pytest.fixture()
+def app(base_app):
+    """Flask application with an application context."""
+    with base_app.app_context():
+        yield base_app
+
+
+@pytest.fixture()
+def db(app):
+    """Database with all tables created."""
+    db_.create_all()
+    yield db_
+    db_.session.remove()
+    db_.drop_all()
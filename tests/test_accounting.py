@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of accounting of worker usage and daily quotas."""
+
+from __future__ import absolute_import, print_function
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from invenio_records_presentation import accounting
+from invenio_records_presentation.accounting import flush_usage, usage_report, usage_today, user_quota
+from invenio_records_presentation.admission import check_quota
+from invenio_records_presentation.errors import PresentationAdmissionError
+from invenio_records_presentation.models import ANONYMOUS_USER_ID, PresentationUsage
+
+
+def usage(jobs=1, cpu_seconds=2.0, wall_seconds=3.0, artifact_bytes=100):
+    return dict(jobs=jobs, cpu_seconds=cpu_seconds, wall_seconds=wall_seconds, artifact_bytes=artifact_bytes)
+
+
+@pytest.fixture()
+def pending(db, monkeypatch):
+    """Usage accounted by this process and not written yet."""
+    pending = {}
+    monkeypatch.setattr(accounting, '_pending', pending)
+    return pending
+
+
+def test_flush_usage(pending):
+    """Usage is added to the daily rows of users, including anonymous usage."""
+    today = datetime.utcnow().date()
+    for _ in range(2):
+        pending[(1, 'pdf', today)] = usage()
+        pending[(ANONYMOUS_USER_ID, 'pdf', today)] = usage()
+        flush_usage()
+        assert not pending
+
+    rows = PresentationUsage.query.order_by(PresentationUsage.user_id).all()
+    assert [(row.user_id, row.jobs, row.cpu_seconds, row.artifact_bytes) for row in rows] == [
+        (ANONYMOUS_USER_ID, 2, 4.0, 200), (1, 2, 4.0, 200)]
+
+
+def test_anonymous_usage_unique(db):
+    """Concurrent workers can not insert two rows of anonymous usage of the same day."""
+    today = datetime.utcnow().date()
+    db.session.add(PresentationUsage(presentation_id='pdf', day=today, **usage()))
+    db.session.commit()
+    db.session.add(PresentationUsage(presentation_id='pdf', day=today, **usage()))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+    db.session.rollback()
+
+
+def test_cpu_time():
+    """CPU time of the current thread grows while it computes."""
+    started = accounting.cpu_time()
+    sum(i * i for i in range(10 ** 6))
+    assert accounting.cpu_time() > started
+
+
+def test_quota(app, pending):
+    """Users exceeding their daily quota are rejected, roles may have more generous quotas."""
+    app.config['INVENIO_RECORDS_PRESENTATION_QUOTA'] = dict(cpu_seconds=3, wall_seconds=None)
+    app.config['INVENIO_RECORDS_PRESENTATION_ROLE_QUOTAS'] = dict(staff=dict(cpu_seconds=None),
+                                                                  students=dict(cpu_seconds=1))
+    user = {'id': 1, 'roles': []}
+    staff = {'id': 1, 'roles': [{'name': 'staff'}]}
+    assert user_quota(user) == dict(cpu_seconds=3)
+    assert user_quota({'id': 1, 'roles': [{'name': 'students'}]}) == dict(cpu_seconds=3)
+    assert user_quota(staff) == {}
+
+    check_quota(user)
+    pending[(1, 'pdf', datetime.utcnow().date())] = usage(cpu_seconds=4.0)
+    flush_usage()
+    app.extensions['invenio-cache'].cache.clear()
+    assert usage_today(1)['cpu_seconds'] == 4.0
+
+    with pytest.raises(PresentationAdmissionError) as e:
+        check_quota(user)
+    assert e.value.status == 429
+    check_quota(staff)
+    check_quota({'id': None})
+
+
+def test_usage_report(pending):
+    """Usage is summed by user or presentation, anonymous usage is reported without a user."""
+    today = datetime.utcnow().date()
+    pending[(1, 'pdf', today)] = usage()
+    pending[(ANONYMOUS_USER_ID, 'pdf', today)] = usage()
+    pending[(1, 'zip', today)] = usage(jobs=2)
+    flush_usage()
+
+    report = usage_report(today, today, 'user')
+    assert [(entry['user'], entry['jobs']) for entry in report] == [(None, 1), (1, 3)]
+    report = usage_report(today, today, 'presentation')
+    assert [(entry['presentation'], entry['jobs']) for entry in report] == [('pdf', 2), ('zip', 2)]
+
+
+@pytest.mark.parametrize('superuser,status', [(True, 200), (False, 403)])
+def test_usage_view(base_app, db, pending, monkeypatch, superuser, status):
+    """Usage is reported to superusers only."""
+    import invenio_access
+
+    from invenio_records_presentation.views import blueprint
+
+    class Permission(object):
+        def __init__(self, *needs):
+            pass
+
+        def can(self):
+            return superuser
+
+    monkeypatch.setattr(invenio_access, 'Permission', Permission)
+    base_app.register_blueprint(blueprint)
+    pending[(1, 'pdf', datetime.utcnow().date())] = usage()
+    flush_usage()
+
+    with base_app.test_client() as client:
+        response = client.get('/presentation/1.0/usage/?group_by=presentation')
+        assert response.status_code == status
+        if superuser:
+            assert [entry['presentation'] for entry in response.json['usage']] == ['pdf']
+            assert client.get('/presentation/1.0/usage/?group_by=nothing').status_code == 400
+            assert client.get('/presentation/1.0/usage/?since=yesterday').status_code == 400
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of admission control."""
+
+from __future__ import absolute_import, print_function
+
+import pytest
+
+from invenio_records_presentation import admission
+from invenio_records_presentation.admission import admit_job, release_job
+from invenio_records_presentation.errors import PresentationAdmissionError
+
+
+@pytest.fixture()
+def limited_app(app):
+    """Application with at most two pdf jobs in flight."""
+    app.config['INVENIO_RECORDS_PRESENTATION_MAX_IN_FLIGHT'] = dict(pdf=2)
+    return app
+
+
+def test_admit_reject_release(limited_app):
+    """Jobs over the in-flight limit are rejected until a slot is released."""
+    first = admit_job('pdf', {})
+    admit_job('pdf', {})
+    with pytest.raises(PresentationAdmissionError) as e:
+        admit_job('pdf', {})
+    assert e.value.status == 503
+    assert e.value.retry_after == limited_app.config['INVENIO_RECORDS_PRESENTATION_RETRY_AFTER']
+
+    admit_job('zip', {})  # other presentations are not limited
+
+    release_job(first)
+    admit_job('pdf', {})
+
+
+def test_release_twice(limited_app):
+    """Releasing a job again does not free a slot of another job."""
+    first = admit_job('pdf', {})
+    admit_job('pdf', {})
+    release_job(first)
+    release_job(first)
+    admit_job('pdf', {})
+    with pytest.raises(PresentationAdmissionError):
+        admit_job('pdf', {})
+
+
+def test_admission_expires(limited_app, monkeypatch):
+    """Jobs never released stop counting once their admission expires."""
+    now = [1000.0]
+    monkeypatch.setattr(admission.time, 'time', lambda: now[0])
+    admit_job('pdf', {})
+    admit_job('pdf', {})
+    with pytest.raises(PresentationAdmissionError):
+        admit_job('pdf', {})
+
+    now[0] += limited_app.config['INVENIO_RECORDS_PRESENTATION_ADMISSION_TTL'] + 1
+    admit_job('pdf', {})
+
+
+def test_rate_limits(app):
+    """Users over their token bucket are rejected with Retry-After."""
+    app.config['INVENIO_RECORDS_PRESENTATION_RATE_LIMITS'] = dict(user=(0.1, 2), ip=None)
+    admit_job('pdf', {'id': 1})
+    admit_job('pdf', {'id': 1})
+    with pytest.raises(PresentationAdmissionError) as e:
+        admit_job('pdf', {'id': 1})
+    assert e.value.status == 429
+    assert 0 < e.value.retry_after <= 10
+
+    admit_job('pdf', {'id': 2})
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of the ASGI variant of the presentation REST API."""
+
+from __future__ import absolute_import, print_function
+
+import asyncio
+
+import pytest
+from celery import states
+from celery.exceptions import TaskRevokedError
+
+from invenio_records_presentation import asgi
+from invenio_records_presentation.asgi import PresentationASGIApp
+
+
+class Result(object):
+    """Result of a job in a given state."""
+
+    def __init__(self, job_id, state):
+        self.id = job_id
+        self.state = state
+
+    def ready(self):
+        return self.state in states.READY_STATES
+
+    def get(self, propagate=True):
+        raise TaskRevokedError()
+
+
+class CeleryApp(object):
+    """Celery application whose jobs are all in the same state."""
+
+    def __init__(self, state):
+        self.state = state
+
+    def AsyncResult(self, job_id):
+        return Result(job_id, self.state)
+
+
+def download(app, job_id='job'):
+    """Download the output of a job, returning the response status and body."""
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': '/presentation/1.0/download/{}/'.format(job_id),
+             'headers': []}
+    asyncio.run(app(scope, None, send))
+    return messages[0]['status'], b''.join(message.get('body', b'') for message in messages[1:])
+
+
+@pytest.mark.parametrize('state,status', [
+    (states.PENDING, 404),
+    (states.STARTED, 504),
+    (states.REVOKED, 410),
+])
+def test_download_unfinished(base_app, monkeypatch, state, status):
+    """Downloads of unknown, slow and cancelled jobs do not wait forever."""
+    beats = []
+    monkeypatch.setattr(asgi, 'current_celery_app', CeleryApp(state))
+    monkeypatch.setattr(PresentationASGIApp, 'heartbeat', lambda self, job_id: beats.append(job_id))
+    app = PresentationASGIApp(base_app, poll_interval=0.01, wait_timeout=0.05)
+
+    assert download(app)[0] == status
+    if state in states.UNREADY_STATES:
+        assert beats and set(beats) == {'job'}
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of the resolved output cache."""
+
+from __future__ import absolute_import, print_function
+
+import pytest
+
+from invenio_records_presentation import cache
+from invenio_records_presentation.cache import forget_resolved_output, get_resolved_output, \
+    set_resolved_output
+
+
+class Clock(object):
+    """Monotonic clock moved by tests."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    """Clock of the resolved output memo."""
+    clock = Clock()
+    monkeypatch.setattr(cache.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture()
+def memo(app, monkeypatch):
+    """Empty in-process memo of resolved outputs keeping at most two of them for a minute."""
+    app.config.update(
+        INVENIO_RECORDS_PRESENTATION_RESOLVED_OUTPUT_TTL=60,
+        INVENIO_RECORDS_PRESENTATION_RESOLVED_OUTPUT_MEMO_SIZE=2,
+    )
+    memo = cache._ResolvedOutputMemo()
+    monkeypatch.setattr(cache, '_resolved_outputs', memo)
+    return memo
+
+
+def test_memo_expires(memo, clock):
+    """Memoized outputs expire after their TTL."""
+    memo.set('job', {'path': 'output.pdf'}, ttl=60, max_size=2)
+    clock.now += 59
+    assert memo.get('job') == {'path': 'output.pdf'}
+    clock.now += 2
+    assert memo.get('job') is None
+    assert 'job' not in memo.entries
+
+
+def test_memo_evicts_least_recently_used(memo, clock):
+    """The memo keeps the most recently used outputs only."""
+    memo.set('first', {'path': 'first.pdf'}, ttl=60, max_size=2)
+    memo.set('second', {'path': 'second.pdf'}, ttl=60, max_size=2)
+    assert memo.get('first') is not None
+    memo.set('third', {'path': 'third.pdf'}, ttl=60, max_size=2)
+    assert list(memo.entries) == ['first', 'third']
+    assert memo.get('second') is None
+
+
+def test_shared_resolved_output(memo, clock):
+    """Outputs resolved by other processes are taken from the shared cache."""
+    set_resolved_output('job', {'path': 'output.pdf'})
+    memo.delete('job')  # resolved by another web worker
+    assert get_resolved_output('job') == {'path': 'output.pdf'}
+    assert memo.get('job') == {'path': 'output.pdf'}
+
+    forget_resolved_output('job')
+    assert get_resolved_output('job') is None
+
+
+def test_missing_artifact(base_app, memo, tmpdir):
+    """Downloading a resolved output whose artifact is gone answers 404 and drops the output."""
+    from invenio_records_presentation.views import blueprint
+
+    base_app.register_blueprint(blueprint)
+    set_resolved_output('job', {'path': str(tmpdir.join('output.pdf')), 'mimetype': 'application/pdf',
+                                'filename': 'output.pdf'})
+
+    with base_app.test_client() as client:
+        assert client.get('/presentation/1.0/download/job/').status_code == 404
+    assert get_resolved_output('job') is None
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of cancellation of jobs nobody waits for."""
+
+from __future__ import absolute_import, print_function
+
+import pytest
+from celery import states
+
+from invenio_records_presentation import cancellation
+from invenio_records_presentation.admission import admit_job
+from invenio_records_presentation.cancellation import add_requester, cancel_job, check_cancelled, heartbeat, \
+    is_cancelled, pin_job
+from invenio_records_presentation.errors import PresentationAdmissionError, PresentationJobCancelled
+
+
+class Result(object):
+    """Result of a job in a given state."""
+
+    def __init__(self, state):
+        self.state = state
+
+
+class Control(object):
+    """Remote control recording revoked jobs."""
+
+    def __init__(self):
+        self.revoked = []
+
+    def revoke(self, job_id):
+        self.revoked.append(job_id)
+
+
+class CeleryApp(object):
+    """Celery application whose jobs are all in the same state."""
+
+    def __init__(self, state=states.PENDING):
+        self.state = state
+        self.control = Control()
+
+    def AsyncResult(self, job_id):
+        return Result(self.state)
+
+
+class JobObject(object):
+    """Workflow object of a job."""
+
+    def __init__(self, job_id):
+        self.extra_data = {'_job': job_id}
+
+
+@pytest.fixture()
+def celery_app(app, monkeypatch):
+    """Celery application not connected to any broker."""
+    celery_app = CeleryApp()
+    monkeypatch.setattr(cancellation, 'current_celery_app', celery_app)
+    return celery_app
+
+
+def test_cancel_last_requester(celery_app):
+    """Jobs are cancelled when all their requesters gave them up."""
+    add_requester('job', 'user:1')
+    add_requester('job', 'user:2')
+    add_requester('job', 'user:2')  # counted once
+    assert not cancel_job('job', 'user:1')
+    assert not is_cancelled('job')
+    assert cancel_job('job', 'user:2')
+    assert is_cancelled('job')
+    assert celery_app.control.revoked == ['job']
+
+
+def test_cancel_repeated(celery_app):
+    """Requesters repeating their cancellation do not give up the job for others."""
+    add_requester('job', 'user:1')
+    add_requester('job', 'session:a')
+    for _ in range(3):
+        assert not cancel_job('job', 'user:1')
+        assert not cancel_job('job', 'user:3')  # never requested the job
+    assert not is_cancelled('job')
+
+    assert cancel_job('job', 'session:a')
+    assert cancel_job('job', 'session:a')  # already cancelled
+    assert celery_app.control.revoked == ['job']
+
+
+def test_pinned_job(celery_app):
+    """Pinned jobs are never cancelled."""
+    add_requester('job', 'user:1')
+    pin_job('job')
+    assert not cancel_job('job', 'user:1')
+    assert not is_cancelled('job')
+    assert celery_app.control.revoked == []
+
+
+def test_idle_job(app, monkeypatch):
+    """Jobs are cancelled when nobody asked for them for a while."""
+    now = [1000.0]
+    monkeypatch.setattr(cancellation.time, 'time', lambda: now[0])
+    idle = app.config['INVENIO_RECORDS_PRESENTATION_CANCEL_IDLE']
+    assert not is_cancelled('job')  # not requested through the REST API
+
+    add_requester('job', 'user:1')
+    now[0] += idle
+    assert not is_cancelled('job')
+    heartbeat('job')
+    now[0] += idle
+    assert not is_cancelled('job')
+    now[0] += 1
+    assert is_cancelled('job')
+
+    app.config['INVENIO_RECORDS_PRESENTATION_CANCEL_IDLE'] = None
+    assert not is_cancelled('job')
+
+
+def test_check_cancelled(celery_app):
+    """Workflow tasks are stopped when their job is cancelled."""
+    add_requester('job', 'user:1')
+    check_cancelled(JobObject('job'))
+    cancel_job('job', 'user:1')
+    with pytest.raises(PresentationJobCancelled):
+        check_cancelled(JobObject('job'))
+
+
+@pytest.mark.parametrize('state,released', [(states.PENDING, True), (states.STARTED, False)])
+def test_cancel_releases_admission(app, celery_app, state, released):
+    """Jobs cancelled before they started release their in-flight slot."""
+    app.config['INVENIO_RECORDS_PRESENTATION_MAX_IN_FLIGHT'] = dict(pdf=1)
+    celery_app.state = state
+    job_id = admit_job('pdf', {})
+    add_requester(job_id, 'user:1')
+    assert cancel_job(job_id, 'user:1')
+
+    if released:
+        admit_job('pdf', {})
+    else:
+        with pytest.raises(PresentationAdmissionError):
+            admit_job('pdf', {})
+
+
+def test_revoked_job_releases_admission(app, monkeypatch):
+    """Jobs revoked on a worker release their in-flight slot."""
+    from celery import current_app as current_celery_app
+
+    from invenio_records_presentation.tasks import release_revoked_job, run_presentation
+
+    monkeypatch.setattr(current_celery_app, 'flask_app', app)  # the worker of this application
+    app.config['INVENIO_RECORDS_PRESENTATION_MAX_IN_FLIGHT'] = dict(pdf=1)
+    job_id = admit_job('pdf', {})
+    release_revoked_job(sender=run_presentation, request=type('Request', (object,), {'id': job_id}))
+    admit_job('pdf', {})
+
+
+def test_anonymous_requester(base_app):
+    """Anonymous requesters are identified by their session."""
+    from flask_login import LoginManager
+
+    from invenio_records_presentation.views import requester_id
+
+    LoginManager(base_app)
+    with base_app.test_request_context():
+        requester = requester_id()
+        assert requester.startswith('session:')
+        assert requester_id() == requester
+    with base_app.test_request_context():
+        assert requester_id() != requester
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of CLI helpers."""
+
+from __future__ import absolute_import, print_function
+
+import uuid
+
+import pytest
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
+
+from invenio_records_presentation.cli import iter_all_record_ids, iter_pid_record_ids, iter_query_record_ids
+
+
+def test_iter_pid_record_ids(db):
+    """Records of known PIDs are streamed, unknown and malformed PIDs reported."""
+    record_uuid = uuid.uuid4()
+    PersistentIdentifier.create('recid', '1', object_type='rec', object_uuid=record_uuid,
+                                status=PIDStatus.REGISTERED)
+    db.session.commit()
+
+    missing = []
+    record_ids = list(iter_pid_record_ids(['recid:1\n', 'recid:2', 'doi:1', 'garbage'], 2,
+                                          missing=missing.append))
+    assert record_ids == [record_uuid]
+    assert sorted(missing) == ['doi:1', 'garbage', 'recid:2']
+
+
+def test_iter_all_record_ids(db):
+    """Records are streamed in batches ordered by id, deleted records are skipped."""
+    from invenio_records.models import RecordMetadata
+
+    record_ids = sorted(uuid.uuid4() for _ in range(5))
+    for record_id in record_ids:
+        db.session.add(RecordMetadata(id=record_id, json={}))
+    deleted = RecordMetadata(id=uuid.uuid4(), json={})
+    db.session.add(deleted)
+    db.session.commit()
+    deleted.json = None  # soft-deleted like Record.delete() does
+    db.session.commit()
+
+    assert list(iter_all_record_ids(2)) == record_ids
+    assert list(iter_all_record_ids(2, after=record_ids[2])) == record_ids[3:]
+
+
+class Hit(object):
+    """Search hit of a record."""
+
+    def __init__(self, record_id):
+        self.meta = type('Meta', (object,), {'id': record_id})
+
+
+class RecordsSearch(object):
+    """Search over records sorted by id, in a random order unless sorted."""
+
+    record_ids = []
+
+    def __init__(self, params=None):
+        self.params = params or {}
+
+    def query(self, *args, **kwargs):
+        return self
+
+    def source(self, *args):
+        return self
+
+    def sort(self, field):
+        return RecordsSearch(dict(self.params, sort=field))
+
+    def extra(self, **kwargs):
+        return RecordsSearch(dict(self.params, **kwargs))
+
+    def execute(self):
+        record_ids = sorted(self.record_ids) if self.params.get('sort') == '_id' else list(self.record_ids)
+        if 'search_after' in self.params:
+            record_ids = [record_id for record_id in record_ids if record_id > self.params['search_after'][0]]
+        return [Hit(record_id) for record_id in record_ids[:self.params['size']]]
+
+
+def test_iter_query_record_ids(monkeypatch):
+    """Records matching a query are streamed ordered by id, so a build can resume after the last one."""
+    search_api = pytest.importorskip('invenio_search.api')
+    monkeypatch.setattr(search_api, 'RecordsSearch', RecordsSearch)
+    record_ids = [str(uuid.uuid4()) for _ in range(5)]
+    monkeypatch.setattr(RecordsSearch, 'record_ids', record_ids)
+
+    assert list(iter_query_record_ids('title:x', 2)) == sorted(record_ids)
+    assert list(iter_query_record_ids('title:x', 2, after=sorted(record_ids)[1])) == sorted(record_ids)[2:]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of output compression."""
+
+from __future__ import absolute_import, print_function
+
+import pytest
+
+from invenio_records_presentation.compression import accepts_encoding, compress_file, encoding_for, \
+    iter_decompressed
+
+
+@pytest.mark.parametrize('header,encoding,accepted', [
+    (None, 'gzip', False),
+    ('', 'gzip', False),
+    ('gzip', 'gzip', True),
+    ('deflate, gzip;q=0.5', 'gzip', True),
+    ('gzip;q=0', 'gzip', False),
+    ('*', 'gzip', True),
+    ('*;q=0', 'gzip', False),
+    ('gzip, deflate, br', 'zstd', False),
+    ('br, zstd', 'zstd', True),
+])
+def test_accepts_encoding(header, encoding, accepted):
+    """Test Accept-Encoding negotiation."""
+    assert accepts_encoding(header, encoding) is accepted
+
+
+def test_encoding_for(app):
+    """Test content encoding of stored outputs by mimetype."""
+    app.config['INVENIO_RECORDS_PRESENTATION_COMPRESSION'] = {'text/*': 'gzip', 'application/json': 'gzip'}
+    assert encoding_for('text/plain; charset=utf-8') == 'gzip'
+    assert encoding_for('Application/JSON') == 'gzip'
+    assert encoding_for('application/pdf') is None
+
+
+def test_compress_roundtrip(tmpdir):
+    """Compressed files stream back their original contents."""
+    path = tmpdir.join('output.txt')
+    path.write_binary(b'presentation ' * 10000)
+
+    compressed_path = compress_file(str(path), 'gzip')
+    assert compressed_path.endswith('.gz')
+    assert not path.exists()
+    assert b''.join(iter_decompressed(open(compressed_path, 'rb'), 'gzip')) == b'presentation ' * 10000
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of DAG presentation workflows."""
+
+from __future__ import absolute_import, print_function
+
+import threading
+
+import pytest
+from workflow.errors import WorkflowDefinitionError
+
+from invenio_records_presentation.workflows.dag import DAGTask, dag_runner, dag_task, validate_dag
+
+
+def task(name, inputs=(), outputs=()):
+    def func(obj, eng, **values):
+        return None
+    func.__name__ = name
+    return DAGTask(func, inputs=inputs, outputs=outputs)
+
+
+def test_validate_dag():
+    """Valid DAGs pass in any task order."""
+    validate_dag([task('package', ('thumbnail', 'sheet'), ('package',)),
+                  task('thumbnail', ('data',), ('thumbnail',)),
+                  task('sheet', (), ('sheet',))], output='package')
+
+
+@pytest.mark.parametrize('tasks,output', [
+    ([task('a', (), ('x',)), task('b', (), ('x',))], None),
+    ([task('a', (), ('data',))], None),
+    ([task('a', ('missing',), ('x',))], None),
+    ([task('a', ('y',), ('x',)), task('b', ('x',), ('y',))], None),
+    ([task('a', (), ('x',))], 'y'),
+])
+def test_invalid_dag(tasks, output):
+    """Duplicate producers, missing inputs, cycles and unknown outputs are rejected."""
+    with pytest.raises(WorkflowDefinitionError):
+        validate_dag(tasks, output=output)
+
+
+def test_dag_runner_output():
+    """The output must be given when the last task does not have a single output."""
+    with pytest.raises(WorkflowDefinitionError):
+        dag_runner([task('a', (), ('x', 'y'))])
+    with pytest.raises(WorkflowDefinitionError):
+        dag_runner([task('a', (), ('x',))], output='y')
+    with pytest.raises(WorkflowDefinitionError):
+        dag_runner([])
+
+
+class DAGObject(object):
+    """Workflow object of a job not started through the REST API."""
+
+    scratch = None
+
+    def __init__(self, data):
+        self.data = data
+        self.extra_data = {}
+        self.extra_data_lock = threading.RLock()
+
+
+def test_run_dag(app):
+    """Tasks get their inputs and the output becomes the object data."""
+    @dag_task(outputs=('words',))
+    def split(obj, eng, data):
+        return data.split()
+
+    @dag_task(inputs=('data',), outputs=('length', 'upper'))
+    def measure(obj, eng, data):
+        return {'length': len(data), 'upper': data.upper()}
+
+    @dag_task(inputs=('words', 'length', 'upper'), outputs=('summary',))
+    def summarize(obj, eng, words, length, upper):
+        with obj.extra_data_lock:
+            obj.extra_data['summarized'] = True
+        return '{} {} {}'.format(len(words), length, upper)
+
+    split.dag_task.inputs = ('data',)
+    obj = DAGObject('a b c')
+    assert dag_runner([split, measure, summarize])(obj, None) is obj
+    assert obj.data == '3 5 A B C'
+    assert obj.extra_data == {'summarized': True}
+
+    obj = DAGObject('a b c')
+    dag_runner([split, measure, summarize], output='upper')(obj, None)
+    assert obj.data == 'A B C'
+
+
+def test_run_dag_invalid_result(app):
+    """Tasks with more outputs must return all of them."""
+    @dag_task(outputs=('x', 'y'))
+    def broken(obj, eng):
+        return {'x': 1}
+
+    with pytest.raises(WorkflowDefinitionError):
+        dag_runner([broken], output='x')(DAGObject(None), None)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of the extension and validation of presentations."""
+
+from __future__ import absolute_import, print_function
+
+import pytest
+from flask import Flask
+from invenio_workflows import InvenioWorkflows
+from workflow.errors import WorkflowDefinitionError
+
+from invenio_records_presentation import InvenioRecordsPresentation
+from invenio_records_presentation.workflows import presentation_workflow_factory
+
+
+def passthrough(obj, eng):
+    """Workflow task doing nothing."""
+
+
+def no_arguments():
+    """Workflow task with a wrong signature."""
+
+
+@pytest.fixture()
+def lazy_app(instance_path):
+    """Application initializing workflows after presentations."""
+    app = Flask('testapp', instance_path=instance_path)
+    ext = InvenioRecordsPresentation(app)
+    InvenioWorkflows(app, entry_point_group=None)
+    with app.app_context():
+        yield app, ext
+
+
+def test_extension(app):
+    """Test extension initialization."""
+    assert 'invenio-records-presentation' in app.extensions
+    assert app.config['INVENIO_RECORDS_PRESENTATION_STREAM_POLL_INTERVAL']
+
+
+def test_validate_on_first_use(lazy_app):
+    """Presentations of workflows registered later are checked on first use."""
+    app, ext = lazy_app
+    app.extensions['invenio-workflows'].register_workflow(
+        'text', presentation_workflow_factory(['{}:passthrough'.format(__name__)]))
+
+    presentation = ext.get_presentation('text')
+    assert presentation.name == 'text'
+    assert ext.get_presentation('text') is presentation
+    with pytest.raises(AttributeError):
+        ext.get_presentation('unknown')
+
+
+@pytest.mark.parametrize('task', ['{}:no_arguments'.format(__name__), 'no.such.module:task', 42])
+def test_invalid_task(lazy_app, task):
+    """Workflows with tasks which can not be imported or called are rejected."""
+    app, ext = lazy_app
+    app.extensions['invenio-workflows'].register_workflow('broken', presentation_workflow_factory([task]))
+
+    with pytest.raises(WorkflowDefinitionError) as e:
+        ext.get_presentation('broken')
+    assert e.value.workflow_name == 'broken'
+
+
+def render(metadata, files):
+    """Preview renderer."""
+    return b''
+
+
+@pytest.mark.parametrize('renderer', ['{}:render'.format(__name__), render])
+def test_valid_renderer(lazy_app, renderer):
+    """Previews with importable renderers are created."""
+    app, ext = lazy_app
+    app.config['INVENIO_RECORDS_PRESENTATION_PREVIEWS'] = {'thumbnail': {'renderer': renderer}}
+
+    assert ext.get_preview('thumbnail').name == 'thumbnail'
+
+
+@pytest.mark.parametrize('renderer', [None, 'no.such.module:render', '{}:missing'.format(__name__), 42])
+def test_invalid_renderer(lazy_app, renderer):
+    """Previews with renderers which can not be imported or called are rejected."""
+    app, ext = lazy_app
+    app.config['INVENIO_RECORDS_PRESENTATION_PREVIEWS'] = {'thumbnail': {'renderer': renderer}}
+
+    with pytest.raises(WorkflowDefinitionError) as e:
+        ext.init_presentations()
+    assert e.value.workflow_name == 'thumbnail'
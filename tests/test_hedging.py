@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of hedged re-execution of straggling jobs."""
+
+from __future__ import absolute_import, print_function
+
+import pytest
+
+from invenio_records_presentation import tasks
+from invenio_records_presentation.cancellation import check_cancelled
+from invenio_records_presentation.errors import PresentationJobCancelled
+from invenio_records_presentation.hedging import claim_result, hedge_delay, is_decided, record_runtime
+
+
+class JobObject(object):
+    """Workflow object of a run of a hedged job."""
+
+    def __init__(self, **extra_data):
+        self.extra_data = extra_data
+
+
+class Presentations(object):
+    """Extension counting initializations of presentations."""
+
+    def __init__(self):
+        self.initialized = 0
+
+    def init_presentations(self):
+        self.initialized += 1
+
+
+@pytest.fixture()
+def hedged_app(app, monkeypatch):
+    """Application hedging pdf jobs slower than 90 % of the last ones."""
+    app.config.update(
+        INVENIO_RECORDS_PRESENTATION_HEDGE=dict(pdf=0.9),
+        INVENIO_RECORDS_PRESENTATION_HEDGE_MIN_SAMPLES=5,
+    )
+    presentations = Presentations()
+    monkeypatch.setattr(tasks, 'current_records_presentation', presentations)
+    return app
+
+
+def test_hedge_delay(hedged_app):
+    """Jobs are hedged after the configured percentile of runtimes, once there are enough samples."""
+    assert hedge_delay('zip') is None
+    for runtime in range(1, 5):
+        record_runtime('pdf', runtime)
+    assert hedge_delay('pdf') is None
+    for runtime in range(5, 11):
+        record_runtime('pdf', runtime)
+    assert hedge_delay('pdf') == 10
+
+
+def test_first_claim_wins(hedged_app):
+    """The first finished run gets the job result and cancels the other one."""
+    check_cancelled(JobObject(_job='job'))
+    check_cancelled(JobObject(_hedge_of='job'))
+    assert not is_decided('job')
+
+    assert claim_result('job', 'duplicate') == 'duplicate'
+    assert claim_result('job', 'original') == 'duplicate'
+    assert is_decided('job')
+    with pytest.raises(PresentationJobCancelled):
+        check_cancelled(JobObject(_job='job'))
+
+
+def test_hedge_initializes_presentations(hedged_app):
+    """Hedging tasks compile the presentation workflows like presentation jobs do."""
+    claim_result('job', 'original')
+    tasks.hedge_presentation('pdf', 1, 'job')
+    assert tasks.current_records_presentation.initialized == 1
+
+
+def test_losing_run_stops(hedged_app, monkeypatch):
+    """The original run stopped by the claim of its hedged run returns the winning result."""
+    import invenio_workflows.tasks
+    from celery import current_app as current_celery_app
+
+    def start(workflow_name, object_id, **kwargs):
+        claim_result('job', 'duplicate')  # the hedged run finishes first
+        raise PresentationJobCancelled()
+
+    removed = []
+    monkeypatch.setattr(current_celery_app, 'flask_app', hedged_app)  # the worker of this application
+    monkeypatch.setattr(invenio_workflows.tasks, 'start', start)
+    monkeypatch.setattr(tasks, 'hedge_delay', lambda workflow_name: 10)
+    monkeypatch.setattr(tasks.hedge_presentation, 'apply_async', lambda **kwargs: None)
+    monkeypatch.setattr(tasks, 'account_job', lambda *args: None)
+    monkeypatch.setattr(tasks, 'remove_scratch', removed.append)
+    monkeypatch.setattr(tasks, 'remove_transient_scratch', lambda object_id: None)
+
+    result = tasks.run_presentation.apply(args=('pdf', 1), task_id='job')
+    assert result.get() == 'duplicate'
+    assert removed == [1]
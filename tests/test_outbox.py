@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of transactional dispatching of presentation jobs."""
+
+from __future__ import absolute_import, print_function
+
+import pytest
+from celery import shared_task
+
+from invenio_records_presentation import outbox
+from invenio_records_presentation.outbox import enqueue_on_commit
+
+dispatched = []
+
+
+@shared_task
+def remember(value):
+    """Remember a dispatched value, using the DB like presentation jobs do."""
+    from invenio_db import db
+    db.session.execute('SELECT 1')
+    db.session.commit()
+    dispatched.append(value)
+
+
+@pytest.fixture()
+def released(db, monkeypatch):
+    """Jobs whose admission was released."""
+    del dispatched[:]
+    released = []
+    monkeypatch.setattr(outbox, 'release_job', released.append)
+    return released
+
+
+def test_dispatch_on_commit(db, released):
+    """Jobs are sent when the transaction commits."""
+    enqueue_on_commit(remember, args=('a',))
+    db.session.flush()
+    assert dispatched == []
+
+    db.session.commit()
+    assert dispatched == ['a']
+    assert released == []
+
+    db.session.execute('SELECT 1')  # the session is usable after eager jobs committed
+    db.session.commit()
+    assert dispatched == ['a']
+
+
+def test_discard_on_rollback(db, released):
+    """Jobs of a rolled back transaction are released and never sent."""
+    result = enqueue_on_commit(remember, args=('a',))
+    db.session.rollback()
+    db.session.commit()
+    assert dispatched == []
+    assert released == [result.id]
+
+
+def test_discard_on_close(db, released):
+    """Jobs of a session closed without commit are released and never sent."""
+    result = enqueue_on_commit(remember, args=('a',))
+    db.session.close()
+    db.session.commit()
+    assert dispatched == []
+    assert released == [result.id]
+
+
+def test_savepoint_rollback(db, released):
+    """Only jobs queued in a rolled back savepoint are discarded."""
+    enqueue_on_commit(remember, args=('a',))
+    with pytest.raises(ValueError):
+        with db.session.begin_nested():
+            result = enqueue_on_commit(remember, args=('b',))
+            raise ValueError()
+    assert released == [result.id]
+
+    with db.session.begin_nested():
+        enqueue_on_commit(remember, args=('c',))
+    assert dispatched == []  # releasing a savepoint does not send its jobs
+
+    db.session.commit()
+    assert dispatched == ['a', 'c']
+    assert released == [result.id]
+
+
+def test_dispatch_failure(db, released, monkeypatch):
+    """Admission of jobs which could not be sent is released."""
+    def fail(*args, **kwargs):
+        raise IOError('broker unavailable')
+
+    monkeypatch.setattr(remember, 'apply_async', fail)
+    result = enqueue_on_commit(remember, args=('a',))
+    db.session.commit()
+    assert released == [result.id]
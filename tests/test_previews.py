@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of previews rendered in the render pool."""
+
+from __future__ import absolute_import, print_function
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from invenio_records_presentation import previews
+from invenio_records_presentation.errors import PresentationPreviewError
+
+
+def slow_render(metadata, files):
+    """Renderer which never finishes in time."""
+    time.sleep(60)
+    return b'slow'
+
+
+def fast_render(metadata, files):
+    """Renderer taking a moment."""
+    time.sleep(0.2)
+    return b'fast'
+
+
+class RenderProcess(object):
+    """Render process of a fake render pool."""
+
+    def __init__(self):
+        self.terminated = False
+
+    def is_alive(self):
+        return not self.terminated
+
+    def terminate(self):
+        self.terminated = True
+
+
+class RenderPool(object):
+    """Render pool whose renders fail with a given error or never finish."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.shut_down = False
+        self._processes = {1: RenderProcess(), 2: RenderProcess()}
+
+    def submit(self, fn, *args):
+        future = Future()
+        if self.error:
+            future.set_exception(self.error)
+        return future
+
+    def shutdown(self, wait=True):
+        self.shut_down = True
+
+
+@pytest.fixture()
+def preview_app(app, monkeypatch):
+    """Application rendering previews of records without metadata and files."""
+    app.config['INVENIO_RECORDS_PRESENTATION_PREVIEWS'] = {
+        'slow': {'renderer': '{}:slow_render'.format(__name__)},
+        'fast': {'renderer': '{}:fast_render'.format(__name__)},
+    }
+    monkeypatch.setattr(previews, 'preview_input', lambda record_uuid: ({}, []))
+    return app
+
+
+@pytest.fixture()
+def fake_pool(preview_app, monkeypatch):
+    """Replace the render pool of this process with a fake one with two slots."""
+    def use(pool):
+        slots = threading.BoundedSemaphore(2)
+        monkeypatch.setattr(previews, '_pool', pool)
+        monkeypatch.setattr(previews, 'render_pool', lambda: (pool, slots))
+        return slots
+    return use
+
+
+def test_discard_broken_pool(preview_app, fake_pool):
+    """Render pools whose render processes died are discarded."""
+    pool = RenderPool(BrokenProcessPool())
+    slots = fake_pool(pool)
+
+    with pytest.raises(PresentationPreviewError) as e:
+        previews.render_preview('fast', 'record', 1)
+    assert e.value.status == 503
+    assert previews._pool is None
+    assert pool.shut_down
+    assert all(process.terminated for process in pool._processes.values())
+    assert slots.acquire(blocking=False) and slots.acquire(blocking=False)
+
+
+def test_busy_pool(preview_app, fake_pool, monkeypatch):
+    """Requests are rejected instead of queued when all render processes are busy."""
+    preview_app.config['INVENIO_RECORDS_PRESENTATION_PREVIEW_TIMEOUT'] = 0.01
+    monkeypatch.setattr(previews, 'TIMEOUT_GRACE', 0)
+    pool = RenderPool()  # renders never finish
+    fake_pool(pool)
+    for _ in range(2):
+        with pytest.raises(PresentationPreviewError, match='taking too long'):
+            previews.render_preview('slow', 'record', 1)
+    with pytest.raises(PresentationPreviewError, match='busy') as e:
+        previews.render_preview('fast', 'record', 1)
+    assert e.value.status == 503
+    assert previews._pool is pool  # stuck renders do not restart the pool
+
+
+def test_timeout_while_rendering(preview_app):
+    """A render timing out does not disturb renders running at the same time."""
+    preview_app.config['INVENIO_RECORDS_PRESENTATION_PREVIEW_WORKERS'] = 3
+    preview_app.config['INVENIO_RECORDS_PRESENTATION_PREVIEW_TIMEOUT'] = 1
+    previews._pool = None
+    pool, slots = previews.render_pool()
+    try:
+        for _ in range(3):
+            pool.submit(previews._ping).result(timeout=60)  # wait until renderers are imported
+
+        def render(request):
+            number, preview_id = request
+            with preview_app.app_context():
+                try:
+                    return previews.render_preview(preview_id, 'record{}'.format(number), 1)
+                except PresentationPreviewError as e:
+                    return e.status
+
+        with ThreadPoolExecutor(3) as requests:
+            results = list(requests.map(render, enumerate(['slow', 'fast', 'fast'])))
+        assert results == [503, b'fast', b'fast']
+
+        assert previews.render_pool() == (pool, slots)  # the pool was not restarted
+        assert all(process.is_alive() for process in pool._processes.values())
+        assert previews.render_preview('fast', 'other', 1) == b'fast'
+    finally:
+        previews._pool = None
+        pool.shutdown()
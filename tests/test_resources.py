@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of resource classes enforced on worker nodes."""
+
+from __future__ import absolute_import, print_function
+
+import os
+import tempfile
+
+import pytest
+
+from invenio_records_presentation import resources
+from invenio_records_presentation.resources import acquire_resources, locked_ledger, release_resources
+from invenio_records_presentation.workflows import presentation_workflow_factory
+
+
+def passthrough(obj, eng):
+    """Workflow task doing nothing."""
+
+
+@pytest.fixture()
+def node_app(app, instance_path):
+    """Node with 4 GB of memory and 2 CPUs running raster jobs."""
+    app.config.update(
+        INVENIO_RECORDS_PRESENTATION_RESOURCE_CLASSES=dict(raster=dict(memory=2048, cpu=1, max_jobs=3)),
+        INVENIO_RECORDS_PRESENTATION_NODE_RESOURCES=dict(memory=4096, cpu=2),
+        INVENIO_RECORDS_PRESENTATION_LOCK_DIR=os.path.join(instance_path, 'locks'),
+    )
+    workflows = app.extensions['invenio-workflows']
+    workflows.register_workflow('raster', presentation_workflow_factory([passthrough], resource_class='raster'))
+    workflows.register_workflow('text', presentation_workflow_factory([passthrough]))
+    return app
+
+
+def test_acquire_release(node_app):
+    """Jobs are deferred while the node is full."""
+    assert acquire_resources('a', 'raster')
+    assert acquire_resources('b', 'raster')
+    assert not acquire_resources('c', 'raster')
+    assert acquire_resources('d', 'text')  # no resource class
+
+    release_resources('a', 'raster')
+    assert acquire_resources('c', 'raster')
+
+
+def test_dead_processes(node_app, monkeypatch):
+    """Resources of jobs of dead processes are reclaimed."""
+    assert acquire_resources('a', 'raster')
+    assert acquire_resources('b', 'raster')
+    monkeypatch.setattr(resources, '_alive', lambda pid: False)
+    assert acquire_resources('c', 'raster')
+
+
+def test_ledger_is_node_local(app):
+    """The ledger defaults to the temporary directory, not the shared scratch location."""
+    with locked_ledger():
+        pass
+    assert os.path.exists(os.path.join(tempfile.gettempdir(), 'invenio_presentation_locks', 'resources.lock'))
+    assert not os.path.exists(os.path.join(app.config['INVENIO_RECORDS_PRESENTATION_SCRATCH_LOCATION'],
+                                           'invenio_presentation_locks'))
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of the transient tier of job scratch directories."""
+
+from __future__ import absolute_import, print_function
+
+import os
+
+import pytest
+
+from invenio_records_presentation import tasks
+from invenio_records_presentation.api import PresentationOutputFile, PresentationWorkflowObject
+from invenio_records_presentation.storage import ScratchArtifactStorage
+from invenio_records_presentation.workflows.output import finalize_output
+
+
+@pytest.fixture()
+def transient_app(app, tmpdir, monkeypatch):
+    """Application with a transient scratch location of 100 bytes per job."""
+    location = tmpdir.mkdir('transient')
+    app.config.update(
+        INVENIO_RECORDS_PRESENTATION_TRANSIENT_SCRATCH_LOCATION=str(location),
+        INVENIO_RECORDS_PRESENTATION_TRANSIENT_SCRATCH_LIMIT=100,
+        INVENIO_RECORDS_PRESENTATION_TRANSIENT_FILE_SIZE=60,
+    )
+    ext = app.extensions['invenio-records-presentation']
+    monkeypatch.setitem(ext.__dict__, 'transient_scratch_location', str(location))
+    monkeypatch.setitem(ext.__dict__, 'storage', ScratchArtifactStorage())
+    return app
+
+
+def test_transient_limit(transient_app):
+    """Files go to the scratch location once the transient tier of the job is full."""
+    scratch = PresentationWorkflowObject.create_job().scratch
+
+    small = scratch.create_file(task_name='small', size_hint=50)
+    assert scratch.is_transient(small)
+    large = scratch.create_file(task_name='large', size_hint=70)
+    assert not scratch.is_transient(large)  # larger than the transient file size
+    over_limit = scratch.create_file(task_name='over_limit', size_hint=60)
+    assert not scratch.is_transient(over_limit)  # 50 + 60 bytes are over the job limit
+    intermediate = scratch.create_file(task_name='intermediate', transient=True)
+    assert scratch.is_transient(intermediate)
+    output = scratch.create_file(task_name='output', size_hint=10, transient=False)
+    assert not scratch.is_transient(output)
+
+    assert os.path.dirname(over_limit) == scratch.dir_path
+    scratch.remove()
+    assert not os.path.exists(scratch.transient_dir)
+
+
+def test_finalize_promotes_output(transient_app):
+    """Output created in the transient tier is moved to the scratch location, the tier is removed."""
+    obj = PresentationWorkflowObject.create_job()
+    scratch = obj.scratch
+    intermediate = scratch.create_file(task_name='intermediate', transient=True)
+    path = scratch.create_file(task_name='output', suffix='.png', size_hint=4)
+    with open(path, 'wb') as f:
+        f.write(b'data')
+    assert scratch.is_transient(path)
+    obj.data = PresentationOutputFile(path=path, mimetype='image/png', filename='output.png')
+
+    finalize_output(obj, None)
+    assert os.path.dirname(obj.data['uri']) == scratch.dir_path
+    with open(obj.data['uri'], 'rb') as f:
+        assert f.read() == b'data'
+    assert not os.path.exists(intermediate)
+    assert not os.path.exists(scratch.transient_dir)
+    assert [entry['name'] for entry in obj.extra_data['_manifest']] == [os.path.basename(obj.data['uri'])]
+
+
+def test_transient_removed_on_failure(transient_app, monkeypatch):
+    """The transient tier of a job is removed when its workflow fails."""
+    import invenio_workflows.tasks
+    from celery import current_app as current_celery_app
+
+    obj = PresentationWorkflowObject.create_job()
+    scratch = obj.scratch
+
+    def start(workflow_name, object_id, **kwargs):
+        scratch.create_file(task_name='intermediate', transient=True)
+        raise RuntimeError('workflow failed')
+
+    monkeypatch.setattr(current_celery_app, 'flask_app', transient_app)  # the worker of this application
+    monkeypatch.setattr(invenio_workflows.tasks, 'start', start)
+    monkeypatch.setattr(PresentationWorkflowObject, 'get', classmethod(lambda cls, object_id: obj))
+    monkeypatch.setattr(tasks, 'account_job', lambda *args: None)
+
+    with pytest.raises(RuntimeError):
+        tasks.run_presentation.apply(args=('pdf', 1), task_id='job')
+    assert not os.path.exists(scratch.transient_dir)
+    assert os.path.isdir(scratch.dir_path)  # kept for inspecting the failure
+    scratch.remove()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of artifact storages."""
+
+from __future__ import absolute_import, print_function
+
+import os
+
+import pytest
+
+from invenio_records_presentation.api import PresentationOutputFile, PresentationWorkflowObject
+from invenio_records_presentation.storage import DirectoryArtifactStorage, FilesRestArtifactStorage, \
+    S3ArtifactStorage, ScratchArtifactStorage
+from invenio_records_presentation.utils import job_owns_session
+from invenio_records_presentation.views import download_redirect
+from invenio_records_presentation.workflows.output import finalize_output
+
+
+@pytest.fixture()
+def artifact(tmpdir):
+    """File produced by a job."""
+    path = tmpdir.join('output.txt')
+    path.write_binary(b'data')
+    return str(path)
+
+
+@pytest.fixture()
+def use_storage(app, monkeypatch):
+    """Make the presentation extension use a storage."""
+    ext = app.extensions['invenio-records-presentation']
+
+    def use(storage):
+        monkeypatch.setitem(ext.__dict__, 'storage', storage)
+        return storage
+    return use
+
+
+def test_directory_storage(artifact, tmpdir):
+    """Artifacts are copied into the storage root once per key."""
+    storage = DirectoryArtifactStorage(root=str(tmpdir.join('artifacts')))
+    uri = storage.store(artifact, 'ab/abcd.txt', 'text/plain')
+    assert uri == 'ab/abcd.txt'
+    with storage.open(uri) as f:
+        assert f.read() == b'data'
+
+    with open(artifact, 'wb') as f:
+        f.write(b'changed')
+    assert storage.store(artifact, 'ab/abcd.txt', 'text/plain') == uri  # same key, same contents
+    with storage.open(uri) as f:
+        assert f.read() == b'data'
+
+    storage.remove(uri)
+    storage.remove(uri)
+    assert not os.path.exists(str(tmpdir.join('artifacts', 'ab', 'abcd.txt')))
+
+    with pytest.raises(ValueError):
+        storage.open('../output.txt')
+
+
+def test_scratch_storage(artifact):
+    """Artifacts stay in the job scratch."""
+    storage = ScratchArtifactStorage()
+    assert storage.local
+    assert storage.store(artifact, 'ab/abcd.txt', 'text/plain') == artifact
+    assert storage.url(artifact, 'text/plain', 'inline') is None
+    storage.remove(artifact)
+    assert not os.path.exists(artifact)
+
+
+@pytest.fixture()
+def location(base_app, db, tmpdir):
+    """Default invenio-files-rest location."""
+    from invenio_files_rest import InvenioFilesREST
+    from invenio_files_rest.models import Location
+
+    InvenioFilesREST(base_app)
+    location = Location(name='default', uri=str(tmpdir.join('files')), default=True)
+    db.session.add(location)
+    db.session.commit()
+    return location
+
+
+@pytest.mark.parametrize('owned', [False, True])
+def test_files_rest_storage(location, db, artifact, owned):
+    """Artifacts are stored as file instances, committed only by jobs owning the session."""
+    from invenio_files_rest.models import FileInstance
+
+    storage = FilesRestArtifactStorage()
+    if owned:
+        with job_owns_session():
+            uri = storage.store(artifact, 'ab/abcd.txt', 'text/plain')
+    else:
+        uri = storage.store(artifact, 'ab/abcd.txt', 'text/plain')
+    with storage.open(uri) as f:
+        assert f.read() == b'data'
+
+    db.session.rollback()
+    assert (FileInstance.query.get(uri) is not None) == owned
+
+
+class ClientError(Exception):
+    """Error of an S3 client."""
+
+
+class S3Client(object):
+    """S3 client keeping objects in memory."""
+
+    exceptions = type('Exceptions', (object,), {'ClientError': ClientError})
+
+    def __init__(self):
+        self.objects = {}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError()
+
+    def upload_file(self, path, bucket, key, ExtraArgs):
+        with open(path, 'rb') as f:
+            self.objects[(bucket, key)] = (f.read(), ExtraArgs)
+
+    def generate_presigned_url(self, method, ExpiresIn, Params):
+        return 'https://s3/{Bucket}/{Key}?expires={0}&type={ResponseContentType}'.format(ExpiresIn, **Params)
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+def test_s3_storage(artifact):
+    """Artifacts are uploaded once per key and downloaded from presigned URLs."""
+    storage = S3ArtifactStorage(bucket='presentations', prefix='outputs/', expires=60)
+    storage._client = S3Client()
+    uri = storage.store(artifact, 'ab/abcd.txt.gz', 'text/plain', encoding='gzip')
+    assert uri == 'outputs/ab/abcd.txt.gz'
+    assert storage.client.objects[('presentations', uri)] == \
+        (b'data', {'ContentType': 'text/plain', 'ContentEncoding': 'gzip'})
+    storage.client.objects[('presentations', uri)] = (b'same', {})
+    assert storage.store(artifact, 'ab/abcd.txt.gz', 'text/plain') == uri
+    assert storage.client.objects[('presentations', uri)][0] == b'same'
+
+    assert storage.url(uri, 'text/plain', 'inline') == \
+        'https://s3/presentations/outputs/ab/abcd.txt.gz?expires=60&type=text/plain'
+    storage.presigned = False
+    assert storage.url(uri, 'text/plain', 'inline') is None
+
+    storage.remove(uri)
+    assert not storage.client.objects
+
+
+def test_download_redirect(use_storage):
+    """Downloads are redirected to the storage if the client accepts the stored encoding."""
+    storage = use_storage(S3ArtifactStorage(bucket='presentations'))
+    storage._client = S3Client()
+    output = dict(PresentationOutputFile(path='output.txt', mimetype='text/plain', filename='output.txt'),
+                  uri='ab/abcd.txt.gz', encoding='gzip')
+
+    assert download_redirect(output, 'gzip, deflate').startswith('https://s3/presentations/ab/abcd.txt.gz')
+    assert download_redirect(output, 'identity') is None  # decompressed on the fly instead
+    assert download_redirect(dict(output, uri=None), 'gzip') is None
+
+    use_storage(ScratchArtifactStorage())
+    assert download_redirect(output, 'gzip') is None
+
+
+@pytest.mark.parametrize('storage_class,removed', [(ScratchArtifactStorage, False),
+                                                   (DirectoryArtifactStorage, True)])
+def test_finalize_removes_scratch(app, use_storage, tmpdir, storage_class, removed):
+    """Scratch of a finished job is removed once its output is in a storage other than the scratch."""
+    storage = use_storage(storage_class(root=str(tmpdir.join('artifacts'))))
+    obj = PresentationWorkflowObject.create_job()
+    path = obj.scratch.create_file(task_name='output', suffix='.png')
+    with open(path, 'wb') as f:
+        f.write(b'data')
+    obj.data = PresentationOutputFile(path=os.path.basename(path), mimetype='image/png', filename='output.png')
+
+    finalize_output(obj, None)
+    assert os.path.isdir(obj.extra_data['_scratch']) != removed
+    with storage.open(obj.data['uri']) as f:
+        assert f.read() == b'data'
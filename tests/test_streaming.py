@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of downloads of outputs which are still being written."""
+
+from __future__ import absolute_import, print_function
+
+import pytest
+
+from invenio_records_presentation.errors import PresentationStreamError
+from invenio_records_presentation.utils import STREAM_COMPLETE_SUFFIX, STREAMING
+from invenio_records_presentation.views import follow_body
+
+
+class StreamingResult(object):
+    """Result of a job streaming its output."""
+
+    task_id = 'job'
+
+    def __init__(self, path):
+        self.state = STREAMING
+        self.info = {'path': path, 'filename': 'output.txt', 'mimetype': 'text/plain'}
+
+
+@pytest.fixture()
+def stream_app(app):
+    """Application polling streamed outputs quickly."""
+    app.config['INVENIO_RECORDS_PRESENTATION_STREAM_POLL_INTERVAL'] = 0.01
+    app.config['INVENIO_RECORDS_PRESENTATION_STREAM_IDLE_TIMEOUT'] = 0.1
+    return app
+
+
+def test_follow_complete(stream_app, tmpdir):
+    """The whole output is streamed once it is marked complete."""
+    path = tmpdir.join('output.txt')
+    path.write_binary(b'data')
+    tmpdir.join('output.txt' + STREAM_COMPLETE_SUFFIX).write_binary(b'')
+
+    body, headers = follow_body(StreamingResult(str(path)))
+    assert b''.join(body) == b'data'
+
+
+def test_follow_stalled(stream_app, tmpdir):
+    """Downloads of outputs nobody writes anymore are aborted."""
+    path = tmpdir.join('output.txt')
+    path.write_binary(b'data')
+
+    body, headers = follow_body(StreamingResult(str(path)))
+    assert next(body) == b'data'
+    with pytest.raises(PresentationStreamError):
+        next(body)
+
+
+def test_follow_failed(stream_app, tmpdir):
+    """Downloads of outputs of failed jobs are aborted."""
+    stream_app.config['INVENIO_RECORDS_PRESENTATION_STREAM_IDLE_TIMEOUT'] = 60
+    path = tmpdir.join('output.txt')
+    path.write_binary(b'')
+    result = StreamingResult(str(path))
+    result.state = 'FAILURE'
+
+    body, headers = follow_body(result)
+    with pytest.raises(PresentationStreamError):
+        next(body)
+
+
+def test_follow_heartbeat(stream_app, tmpdir, monkeypatch):
+    """Clients downloading a streamed output keep its job from being cancelled."""
+    from invenio_records_presentation import views
+
+    beats = []
+    monkeypatch.setattr(views, 'heartbeat', beats.append)
+    path = tmpdir.join('output.txt')
+    path.write_binary(b'data')
+
+    body, headers = follow_body(StreamingResult(str(path)))
+    with pytest.raises(PresentationStreamError):
+        list(body)
+    assert beats and set(beats) == {'job'}
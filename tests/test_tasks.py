@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of pre-warming tasks."""
+
+from __future__ import absolute_import, print_function
+
+from invenio_records_presentation import tasks
+
+
+def test_schedule_prewarm_caches_saturation(app, monkeypatch):
+    """Record signals do not ask the broker for the queue length every time."""
+    lengths = []
+    scheduled = []
+    monkeypatch.setattr(tasks, 'queue_length', lambda queue: lengths.append(queue) or 0)
+    monkeypatch.setattr(tasks.prewarm_presentation, 'apply_async', lambda **kwargs: scheduled.append(kwargs))
+
+    tasks.schedule_prewarm('pdf', 'a')
+    tasks.schedule_prewarm('pdf', 'b')
+    assert len(lengths) == 1
+    assert len(scheduled) == 2
+
+    assert not tasks.prewarm_saturated()  # tasks always ask the broker
+    assert len(lengths) == 2
+
+
+def test_schedule_prewarm_saturated(app, monkeypatch):
+    """Nothing is scheduled while the pre-warming queue is saturated."""
+    scheduled = []
+    app.config['INVENIO_RECORDS_PRESENTATION_PREWARM_MAX_QUEUE_LENGTH'] = 10
+    monkeypatch.setattr(tasks, 'queue_length', lambda queue: 10)
+    monkeypatch.setattr(tasks.prewarm_presentation, 'apply_async', lambda **kwargs: scheduled.append(kwargs))
+
+    tasks.schedule_prewarm('pdf', 'a')
+    assert not scheduled
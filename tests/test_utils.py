@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of utilities."""
+
+from __future__ import absolute_import, print_function
+
+import pytest
+
+from invenio_records_presentation.utils import content_disposition
+
+
+@pytest.mark.parametrize('filename,expected', [
+    ('output.pdf', 'inline; filename="output.pdf"'),
+    ('Příliš žluťoučký.pdf',
+     'inline; filename="Prilis zlutoucky.pdf"; '
+     'filename*=UTF-8\'\'P%C5%99%C3%ADli%C5%A1%20%C5%BElu%C5%A5ou%C4%8Dk%C3%BD.pdf'),
+    ('файл.pdf', 'inline; filename="download.pdf"; filename*=UTF-8\'\'%D1%84%D0%B0%D0%B9%D0%BB.pdf'),
+    ('файл.пдф', 'inline; filename="download"; filename*=UTF-8\'\'%D1%84%D0%B0%D0%B9%D0%BB.%D0%BF%D0%B4%D1%84'),
+    ('"quoted".txt', 'inline; filename="_quoted_.txt"; filename*=UTF-8\'\'%22quoted%22.txt'),
+    ('back\\slash.txt', 'inline; filename="back_slash.txt"; filename*=UTF-8\'\'back%5Cslash.txt'),
+    ('new\r\nline.txt', 'inline; filename="new__line.txt"; filename*=UTF-8\'\'new%0D%0Aline.txt'),
+])
+def test_content_disposition(filename, expected):
+    """Filenames are sent safely, with an ASCII fallback of non-ASCII ones."""
+    assert content_disposition(filename) == expected
+
+
+def test_content_disposition_attachment():
+    """Test disposition type."""
+    assert content_disposition('output.zip', 'attachment') == 'attachment; filename="output.zip"'
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of wrappers of presentation workflow tasks."""
+
+from __future__ import absolute_import, print_function
+
+from datetime import date
+
+import pytest
+
+from invenio_records_presentation.models import PresentationUsage
+from invenio_records_presentation.utils import job_owns_session, session_owned
+from invenio_records_presentation.workflows import session_released
+
+
+class JobObject(object):
+    """Workflow object of a job."""
+
+    session_released = False
+
+    def __init__(self, model):
+        self.model = model
+
+
+@pytest.fixture()
+def job(db):
+    """Workflow object whose model is expired by a commit."""
+    model = PresentationUsage(presentation_id='job', day=date.today())
+    db.session.add(model)
+    db.session.commit()
+    return JobObject(model)
+
+
+def passthrough(obj, eng):
+    """Workflow task doing nothing."""
+
+
+@pytest.mark.parametrize('owned', [False, True])
+def test_session_released(db, job, owned):
+    """Only workers owning the session commit it before a task, workflows run directly do not."""
+    db.session.add(PresentationUsage(presentation_id='caller', day=date.today()))
+    if owned:
+        with job_owns_session():
+            assert session_owned()
+            session_released(passthrough)(job, None)
+    else:
+        session_released(passthrough)(job, None)
+    assert not session_owned()
+    assert job.session_released == owned
+    assert job.model.presentation_id == 'job'  # loaded before the transaction ended
+
+    db.session.rollback()
+    presentations = {usage.presentation_id for usage in PresentationUsage.query}
+    assert presentations == ({'job', 'caller'} if owned else {'job'})
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2019 CESNET.
+#
+# Invenio Records Presentation is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Test of incremental writers."""
+
+from __future__ import absolute_import, print_function
+
+import io
+import json
+from xml.etree import ElementTree
+
+import pytest
+
+from invenio_records_presentation.writers import JSONStreamWriter, XMLStreamWriter
+
+
+def test_json_roundtrip():
+    """Nested documents written incrementally are valid JSON."""
+    fh = io.BytesIO()
+    writer = JSONStreamWriter(fh)
+    with writer.object():
+        writer.value('1', key='id')
+        writer.value({'title': 'Příliš žluťoučký kůň'}, key='metadata')
+        with writer.array(key='files'):
+            for i in range(3):
+                writer.value({'key': 'file{}.txt'.format(i), 'size': i})
+            with writer.object():
+                pass
+            with writer.array():
+                writer.value(None)
+        with writer.array(key='empty'):
+            pass
+
+    assert json.loads(fh.getvalue().decode('utf-8')) == {
+        'id': '1',
+        'metadata': {'title': 'Příliš žluťoučký kůň'},
+        'files': [{'key': 'file0.txt', 'size': 0}, {'key': 'file1.txt', 'size': 1},
+                  {'key': 'file2.txt', 'size': 2}, {}, [None]],
+        'empty': [],
+    }
+
+
+def test_json_top_level_value():
+    """A single top-level value is written without a key."""
+    fh = io.BytesIO()
+    writer = JSONStreamWriter(fh)
+    writer.value([1, 2])
+    assert json.loads(fh.getvalue().decode('utf-8')) == [1, 2]
+
+    with pytest.raises(ValueError):
+        writer.value(3)
+
+
+@pytest.mark.parametrize('write', [
+    lambda writer: writer.value('1', key='id'),
+    lambda writer: writer.start_object(key='metadata'),
+    lambda writer: writer.start_array(key='files'),
+])
+def test_json_top_level_key(write):
+    """Keys of top-level values are rejected instead of being dropped."""
+    with pytest.raises(ValueError):
+        write(JSONStreamWriter(io.BytesIO()))
+
+
+def test_json_keys_mismatch():
+    """Object members need keys and array items can not have them."""
+    writer = JSONStreamWriter(io.BytesIO())
+    writer.start_object()
+    with pytest.raises(ValueError):
+        writer.value(1)
+    writer.start_array(key='items')
+    with pytest.raises(ValueError):
+        writer.value(1, key='item')
+
+
+def test_xml_roundtrip():
+    """Documents written incrementally are valid XML."""
+    fh = io.BytesIO()
+    writer = XMLStreamWriter(fh)
+    with writer.container('record', {'id': '1'}):
+        writer.element('title', 'A & B')
+        writer.element('empty')
+    writer.close()
+
+    root = ElementTree.fromstring(fh.getvalue())
+    assert root.attrib == {'id': '1'}
+    assert root.find('title').text == 'A & B'
+    assert root.find('empty').text is None